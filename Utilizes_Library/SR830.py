@@ -15,169 +15,245 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 
-import visa
-import types
+import functools
 import logging
-import time
-import instrument as Instrument
+from collections import namedtuple
 
+import SR830_Lib
 
-class SR830(Instrument):
+# one entry of the parameter table of SR830: the command mnemonic, the type of the value (bool, int or float), the
+# flags, a fixed first argument of the command (e.g. 1 for "OUTP? 1"), the channels of parameters that take the channel
+# as first argument, the limits of the value, its units and the names of the values of parameters with a fixed set of
+# values
+Parameter = namedtuple('Parameter', ['command', 'type', 'flags', 'index', 'channels', 'minval', 'maxval', 'units',
+                                     'format_map'], defaults=(None, None, None, None, None, None))
+
+
+class SR830:
     '''
     This is the python driver for the Lock-In SR830 from Stanford Research Systems.
 
+    It provides the parameters of the former QTLab driver on top of SR830_Lib.SR830, which does the communication.
+    Every parameter of the table PARAMETERS can be read and set with get(name) and set(name, value) or with the methods
+    get_<name> and set_<name>:
+
+        lockin = SR830('ASRL3::INSTR')
+        lockin.set_harmonic(2)
+        lockin.set_out(1.5, channel=2)
+        x = lockin.get_X()
+
+    Settings are cached: they are read from the device the first time they are needed and a set is only sent if it
+    changes the value. Readings (X, Y, R, P, the aux inputs and the status bits) are always read from the device. The
+    commands can be collected and sent in one transmission with lockin.lib.batch().
+
     Usage:
     Initialize with
-    <name> = instruments.create('name', 'SR830', address='<GPIB address>',
-        reset=<bool>)
+    <name> = SR830(address='<VISA resource name>', reset=<bool>)
     '''
 
-    def __init__(self, name, address, reset=False):
+    FLAG_GET = 1
+    FLAG_SET = 2
+    FLAG_GETSET = FLAG_GET | FLAG_SET
+    # the value changes by itself, so it is never cached
+    FLAG_VOLATILE = 4
+    # the device may limit or round the value, so it is read back after every set
+    FLAG_GET_AFTER_SET = 8
+
+    TIME_CONSTANT_NAMES = {0: "10mus", 1: "30mus", 2: "100mus", 3: "300mus", 4: "1ms", 5: "3ms", 6: "10ms", 7: "30ms",
+                           8: "100ms", 9: "300ms", 10: "1s", 11: "3s", 12: "10s", 13: "30s", 14: "100s", 15: "300s",
+                           16: "1ks", 17: "3ks", 18: "10ks", 19: "30ks"}
+    SENSITIVITY_NAMES = {0: "2nV", 1: "5nV", 2: "10nV", 3: "20nV", 4: "50nV", 5: "100nV", 6: "200nV", 7: "500nV",
+                         8: "1muV", 9: "2muV", 10: "5muV", 11: "10muV", 12: "20muV", 13: "50muV", 14: "100muV",
+                         15: "200muV", 16: "500muV", 17: "1mV", 18: "2mV", 19: "5mV", 20: "10mV", 21: "20mV",
+                         22: "50mV", 23: "100mV", 24: "200mV", 25: "500mV", 26: "1V"}
+    CHANNELS = (1, 2, 3, 4)
+
+    PARAMETERS = {
+        'mode': Parameter('FMOD', bool, FLAG_SET),
+        'frequency': Parameter('FREQ', float, FLAG_GETSET | FLAG_GET_AFTER_SET, minval=1e-3, maxval=102e3, units='Hz'),
+        'phase': Parameter('PHAS', float, FLAG_GETSET | FLAG_GET_AFTER_SET, minval=-360, maxval=729.99, units='deg'),
+        'harmonic': Parameter('HARM', int, FLAG_GETSET | FLAG_GET_AFTER_SET, minval=1, maxval=19999),
+        'amplitude': Parameter('SLVL', float, FLAG_GETSET | FLAG_GET_AFTER_SET, minval=0.004, maxval=5.0, units='V'),
+        'X': Parameter('OUTP', float, FLAG_GET | FLAG_VOLATILE, index=1, units='V'),
+        'Y': Parameter('OUTP', float, FLAG_GET | FLAG_VOLATILE, index=2, units='V'),
+        'R': Parameter('OUTP', float, FLAG_GET | FLAG_VOLATILE, index=3, units='V'),
+        'P': Parameter('OUTP', float, FLAG_GET | FLAG_VOLATILE, index=4, units='deg'),
+        'tau': Parameter('OFLT', int, FLAG_GETSET | FLAG_GET_AFTER_SET, format_map=TIME_CONSTANT_NAMES),
+        'out': Parameter('AUXV', float, FLAG_GETSET, channels=CHANNELS, minval=-10.5, maxval=10.5, units='V'),
+        'in': Parameter('OAUX', float, FLAG_GET | FLAG_VOLATILE, channels=CHANNELS, units='V'),
+        'sensitivity': Parameter('SENS', int, FLAG_GETSET, format_map=SENSITIVITY_NAMES),
+        'reserve': Parameter('RMOD', int, FLAG_GETSET, format_map={0: 'High reserve', 1: 'Normal', 2: 'Low noise'}),
+        'input_config': Parameter('ISRC', int, FLAG_GETSET,
+                                  format_map={0: 'A', 1: 'A-B', 2: 'CVC 1MOhm', 3: 'CVC 100MOhm'}),
+        'input_shield': Parameter('IGND', bool, FLAG_GETSET, format_map={False: 'Float', True: 'GND'}),
+        'input_coupling': Parameter('ICPL', bool, FLAG_GETSET, format_map={False: 'AC', True: 'DC'}),
+        'notch_filter': Parameter('ILIN', int, FLAG_GETSET, format_map={0: 'off', 1: '1xline', 2: '2xline', 3: 'both'}),
+        'ref_input': Parameter('FMOD', bool, FLAG_GETSET, format_map={False: 'external', True: 'internal'}),
+        'ext_trigger': Parameter('RSLP', int, FLAG_GETSET | FLAG_GET_AFTER_SET,
+                                 format_map={0: 'Sine', 1: 'TTL rising edge', 2: 'TTL falling edge'}),
+        'sync_filter': Parameter('SYNC', bool, FLAG_GETSET | FLAG_GET_AFTER_SET, format_map={False: 'off', True: 'on'}),
+        'filter_slope': Parameter('OFSL', int, FLAG_GETSET,
+                                  format_map={0: '6dB/oct.', 1: '12dB/oct.', 2: '18dB/oct.', 3: '24dB/oct.'}),
+        # the bits of the LIA status register are latched and cleared by reading them, so they tell if the event
+        # happened since the bit was read before
+        'input_overload': Parameter('LIAS', bool, FLAG_GET | FLAG_VOLATILE, index=0,
+                                    format_map={False: 'normal', True: 'overload'}),
+        'time_constant_overload': Parameter('LIAS', bool, FLAG_GET | FLAG_VOLATILE, index=1,
+                                            format_map={False: 'normal', True: 'overload'}),
+        'output_overload': Parameter('LIAS', bool, FLAG_GET | FLAG_VOLATILE, index=2,
+                                     format_map={False: 'normal', True: 'overload'}),
+        'unlocked': Parameter('LIAS', bool, FLAG_GET | FLAG_VOLATILE, index=3,
+                              format_map={False: 'locked', True: 'unlocked'}),
+    }
+
+    # parameters of read_output
+    OUTPUTS = {1: 'X', 2: 'Y', 3: 'R', 4: 'P'}
+
+    def __init__(self, address=None, reset=False, sr830=None, rm=None):
         '''
         Initializes the SR830.
 
         Input:
-            name (string)    : name of the instrument
-            address (string) : GPIB address
-            reset (bool)     : resets to default values, default=false
+            address (string)       : VISA resource name, e.g. 'ASRL3::INSTR' (not needed if sr830 is connected)
+            reset (bool)           : resets to default values, default=false
+            sr830 (SR830_Lib.SR830): driver whose connection is used, default=a new one
+            rm (ResourceManager)   : resource manager of a new SR830_Lib.SR830
 
         Output:
             None
         '''
         logging.info(__name__ + ' : Initializing instrument')
-        Instrument.__init__(self, name)
-        self._address = address
-        self._visainstrument = visa.instrument(self._address)
-
-        self.add_parameter('mode',
-           flags=Instrument.FLAG_SET,
-           type=types.BooleanType)
-        self.add_parameter('frequency', type=types.FloatType,
-            flags=Instrument.FLAG_GETSET | Instrument.FLAG_GET_AFTER_SET,
-            minval=1e-3, maxval=102e3,
-            units='Hz', format='%.04e')
-        self.add_parameter('phase', type=types.FloatType,
-            flags=Instrument.FLAG_GETSET | Instrument.FLAG_GET_AFTER_SET,
-            minval=-360, maxval=729.99, units='deg')
-        self.add_parameter('harmonic',type=types.IntType,
-                           flags=Instrument.FLAG_GETSET | Instrument.FLAG_GET_AFTER_SET,
-                           minval=1, maxval=19999)
-        self.add_parameter('amplitude', type=types.FloatType,
-            flags=Instrument.FLAG_GETSET | Instrument.FLAG_GET_AFTER_SET,
-            minval=0.004, maxval=5.0,
-            units='V', format='%.04e')
-        self.add_parameter('X', flags=Instrument.FLAG_GET, units='V', type=types.FloatType)
-        self.add_parameter('Y', flags=Instrument.FLAG_GET, units='V', type=types.FloatType)
-        self.add_parameter('R', flags=Instrument.FLAG_GET, units='V', type=types.FloatType)
-        self.add_parameter('P', flags=Instrument.FLAG_GET, units='deg', type=types.FloatType)
-        self.add_parameter('tau', type=types.IntType,
-            flags=Instrument.FLAG_GETSET | Instrument.FLAG_GET_AFTER_SET,
-            format_map={
-                0 : "10mus",
-                1 : "30mus",
-                2 : "100mus",
-                3 : "300mus",
-                4 : "1ms",
-                5 : "3ms",
-                6 : "10ms",
-                7 : "30ms",
-                8 : "100ms",
-                9 : "300ms",
-                10 : "1s",
-                11 : "3s",
-                12 : "10s",
-                13 : "30s",
-                14 : "100s",
-                15 : "300s",
-                16 : "1ks",
-                17 : "3ks",
-                18 : "10ks",
-                19 : "30ks"
-            })
-        self.add_parameter('out', type=types.FloatType, channels=(1,2,3,4),
-            flags=Instrument.FLAG_GETSET,
-            minval=-10.5, maxval=10.5, units='V', format='%.3f')
-        self.add_parameter('in', type=types.FloatType, channels=(1,2,3,4),
-            flags=Instrument.FLAG_GET,
-            minval=-10.5, maxval=10.5, units='V', format='%.3f')
-        self.add_parameter('sensitivity', type=types.IntType,
-            flags=Instrument.FLAG_GETSET,
-            format_map={
-                0 : "2nV",
-                1 : "5nV",
-                2 : "10nV",
-                3 : "20nV",
-                4 : "50 nV",
-                5 : "100nV",
-                6 : "200nV",
-                7 : "500nV",
-                8 : "1muV",
-                9 : "2muV",
-                10 : "5muV",
-                11 : "10muV",
-                12 : "20muV",
-                13 : "50muV",
-                14 : "100muV",
-                15 : "200muV",
-                16 : "500muV",
-                17 : "1mV",
-                18 : "2mV",
-                19 : "5mV",
-                20 : "10mV",
-                21 : "20mV",
-                22 : "50mV",
-                23 : "100mV",
-                24 : "200mV",
-                25 : "500mV",
-                26 : "1V"
-            })
-        self.add_parameter('reserve', type=types.IntType,
-                           flags=Instrument.FLAG_GETSET,
-                           format_map={0:'High reserve', 1:'Normal', 2:'Low noise'})
-        self.add_parameter('input_config', type=types.IntType,
-                           flags=Instrument.FLAG_GETSET,
-                           format_map={0:'A', 1:'A-B', 2:'CVC 1MOhm', 3:'CVC 100MOhm'})
-        self.add_parameter('input_shield', type=types.BooleanType,
-                           flags=Instrument.FLAG_GETSET,
-                           format_map={False:'Float', True:'GND'})
-        self.add_parameter('input_coupling', type=types.BooleanType,
-                           flags=Instrument.FLAG_GETSET,
-                           format_map={False:'AC', True:'DC'})
-        self.add_parameter('notch_filter', type=types.IntType,
-                           flags=Instrument.FLAG_GETSET,
-                           format_map={0:'off', 1:'1xline', 2:'2xline', 3:'both'})
-        self.add_parameter('ref_input', type=types.BooleanType,
-                           flags=Instrument.FLAG_GETSET,
-                           format_map={False:'external', True:'internal'})
-        self.add_parameter('ext_trigger', type=types.IntType,
-                           flags=Instrument.FLAG_GETSET | Instrument.FLAG_GET_AFTER_SET,
-                           format_map={0:'Sine', 1:'TTL rising edge', 2:'TTL falling edge'})
-        self.add_parameter('sync_filter', type=types.BooleanType,
-                           flags=Instrument.FLAG_GETSET | Instrument.FLAG_GET_AFTER_SET,
-                           format_map={False:'off', True:'on'})
-        self.add_parameter('filter_slope', type=types.IntType,
-                           flags=Instrument.FLAG_GETSET,
-                           format_map={0:'6dB/oct.', 1:'12dB/oct.', 2:'18dB/oct.', 3:'24dB/oct.'})
-        self.add_parameter('unlocked', type=types.BooleanType,
-                           flags=Instrument.FLAG_GET,
-                           format_map={False:'locked', True:'unlocked'})
-        self.add_parameter('input_overload', type=types.BooleanType,
-                           flags=Instrument.FLAG_GET,
-                           format_map={False:'normal', True:'overload'})
-        self.add_parameter('time_constant_overload', type=types.BooleanType,
-                           flags=Instrument.FLAG_GET,
-                           format_map={False:'normal', True:'overload'})
-        self.add_parameter('output_overload', type=types.BooleanType,
-                           flags=Instrument.FLAG_GET,
-                           format_map={False:'normal', True:'overload'})
-
-        self.add_function('reset')
-        self.add_function('get_all')
+        self.lib = sr830 if sr830 is not None else SR830_Lib.SR830(rm)
+        if address is not None:
+            # the output interface (OUTX) is selected once by connect
+            self.lib.connect(address)
+
+        # the settings are read when they are needed for the first time
+        self.lib.enable_settings_cache(refresh=False)
 
         if reset:
             self.reset()
+
+    def __getattr__(self, name):
+        # get_<name> and set_<name> of the parameters in the table (only called for attributes that don't exist)
+        for prefix, method in (('get_', SR830.get), ('set_', SR830.set)):
+            if name.startswith(prefix) and name[len(prefix):] in self.PARAMETERS:
+                return functools.partial(method, self, name[len(prefix):])
+        raise AttributeError("'SR830' object has no attribute '" + name + "'")
+
+    # Parameters
+    def get(self, name, channel=None):
+        '''
+        Get the value of a parameter. Settings are taken from the cache if they were read or set before. Inside
+        lib.batch() a SR830_Lib.BatchReply is returned.
+
+        Input:
+            name (string)  : name of the parameter in PARAMETERS
+            channel (int)  : channel of parameters that have channels
+
+        Output:
+            value of the type of the parameter
+        '''
+        parameter = self._parameter(name, self.FLAG_GET)
+        key = self._key(parameter, channel)
+        convert = self._converter(parameter.type)
+        logging.debug(__name__ + ' : reading %s from instrument' % name)
+
+        if parameter.flags & self.FLAG_VOLATILE:
+            return self.lib._query(self.lib._setting_query(key), convert)
+        return self.lib._read_setting(key, convert)
+
+    def set(self, name, value, channel=None):
+        '''
+        Set a parameter. The command is only sent if it changes the cached value. Parameters the device may limit or
+        round (frequency, phase, harmonic, amplitude, ...) are read back afterwards, so that the cache holds the value
+        the device uses.
+
+        Input:
+            name (string)  : name of the parameter in PARAMETERS
+            value          : new value
+            channel (int)  : channel of parameters that have channels
+
+        Output:
+            None
+        '''
+        parameter = self._parameter(name, self.FLAG_SET)
+        key = self._key(parameter, channel)
+
+        if parameter.format_map is not None and value not in parameter.format_map:
+            raise ValueError(name + " must be one of " + str(sorted(parameter.format_map)))
+        if (parameter.minval is not None and value < parameter.minval) or \
+                (parameter.maxval is not None and value > parameter.maxval):
+            raise ValueError(name + " must be within " + str(parameter.minval) + " to " + str(parameter.maxval))
+
+        logging.debug(__name__ + ' : setting %s to %s' % (name, value))
+        if parameter.type is float:
+            value = float(value)
+        else:
+            value = int(value)
+        if parameter.command == self.lib.OPERATION_SET_HARMONIC:
+            # the harmonic may limit the frequency, which SR830_Lib takes care of
+            self.lib.set_harmonic(value)
         else:
-            self.get_all()
+            self.lib._write_setting(key + (", " if " " in key else " ") + str(value))
+
+        if parameter.flags & self.FLAG_GET_AFTER_SET:
+            self.lib.invalidate_settings(key)
+            self.get(name, channel)
+
+    def format(self, name, value):
+        '''
+        Returns the value of a parameter as text, e.g. '12dB/oct.' for the filter slope 1.
+        '''
+        parameter = self.PARAMETERS[name]
+        if parameter.format_map is not None:
+            return parameter.format_map[parameter.type(value)]
+        if parameter.units is not None:
+            return '%.04e %s' % (value, parameter.units)
+        return str(value)
+
+    def invalidate(self, *names):
+        '''
+        Forgets the cached values of the given parameters (of all if none is given), e.g. after changes on the front
+        panel.
+        '''
+        if not names:
+            self.lib.invalidate_settings()
+            return
+        keys = []
+        for name in names:
+            parameter = self.PARAMETERS[name]
+            for channel in parameter.channels or (None,):
+                keys.append(self._key(parameter, channel))
+        self.lib.invalidate_settings(*keys)
+
+    def _parameter(self, name, flag):
+        if name not in self.PARAMETERS:
+            raise ValueError("Unknown parameter " + name)
+        parameter = self.PARAMETERS[name]
+        if not parameter.flags & flag:
+            raise ValueError("Parameter " + name + " can not be " + ("read" if flag == self.FLAG_GET else "set"))
+        return parameter
+
+    @staticmethod
+    def _key(parameter, channel):
+        # key of the settings cache of SR830_Lib, e.g. "HARM", "AUXV 2" or "OUTP 1"
+        if parameter.channels is not None:
+            if channel not in parameter.channels:
+                raise ValueError("Channel must be one of " + str(parameter.channels))
+            return parameter.command + " " + str(channel)
+        if parameter.index is not None:
+            return parameter.command + " " + str(parameter.index)
+        return parameter.command
+
+    @staticmethod
+    def _converter(kind):
+        # replies are converted from the reply text or the number in the settings cache
+        if kind is bool:
+            return lambda value: int(float(value)) == 1
+        if kind is int:
+            return lambda value: int(float(value))
+        return float
 
     # Functions
     def reset(self):
@@ -191,272 +267,91 @@ class SR830(Instrument):
             None
         '''
         logging.info(__name__ + ' : Resetting instrument')
-        self._visainstrument.write('*RST')
-        self.get_all()
+        self.lib.reset()
 
     def get_all(self):
         '''
-        Reads all implemented parameters from the instrument,
-        and updates the wrapper.
+        Reads all implemented parameters from the instrument in one transmission, and updates the cache.
 
         Input:
             None
 
         Output:
-            None
+            values (dict) : value of every parameter; parameters with channels have a list of the values
         '''
         logging.info(__name__ + ' : reading all settings from instrument')
-        self.get_sensitivity()
-        self.get_tau()
-        self.get_frequency()
-        self.get_amplitude()
-        self.get_phase()
-        self.get_X()
-        self.get_Y()
-        self.get_R()
-        self.get_P()
-        self.get_ref_input()
-        self.get_ext_trigger()
-        self.get_sync_filter()
-        self.get_harmonic()
-        self.get_input_config()
-        self.get_input_shield()
-        self.get_input_coupling()
-        self.get_notch_filter()
-        self.get_reserve()
-        self.get_filter_slope()
-        self.get_unlocked()
-        self.get_input_overload()
-        self.get_time_constant_overload()
-        self.get_output_overload()
+        self.invalidate()
+
+        replies = {}
+        with self.lib.batch():
+            # X, Y, R and P are read together with one SNAP?, so that they belong to the same moment
+            snap = self.lib.read_snap()
+            for name, parameter in self.PARAMETERS.items():
+                if not parameter.flags & self.FLAG_GET or name in self.OUTPUTS.values():
+                    continue
+                if parameter.channels is not None:
+                    replies[name] = [self.get(name, channel) for channel in parameter.channels]
+                else:
+                    replies[name] = self.get(name)
+
+        values = {name: [r.value for r in reply] if isinstance(reply, list) else reply.value
+                  for name, reply in replies.items()}
+        for index, name in self.OUTPUTS.items():
+            values[name] = snap.value[index - 1]
+        return values
 
     def disable_front_panel(self):
         '''
-        enables the front panel of the lock-in
+        disables the front panel of the lock-in
         while being in remote control
         '''
-        self._visainstrument.write('OVRM 0')
+        self.lib._write('OVRM 0')
 
     def enable_front_panel(self):
         '''
         enables the front panel of the lock-in
         while being in remote control
         '''
-        self._visainstrument.write('OVRM 1')
+        self.lib._write('OVRM 1')
 
     def auto_phase(self):
         '''
         offsets the phase so that
         the Y component is zero
         '''
-        self._visainstrument.write('APHS')
+        self.lib.auto_phase()
 
     def direct_output(self):
         '''
-        select GPIB as interface
+        select GPIB as interface (this is done once when connecting to the device)
         '''
-        self._visainstrument.write('OUTX 1')
+        self.lib._write(self.lib.OPERATION_SEND_RESPONSE_TO_GPIB)
 
-    def read_output(self,output, ovl):
+    def read_output(self, output, ovl=False):
         '''
         Read out R,X,Y or phase (P) of the Lock-In
 
         Input:
-            mode (int) :
+            output (int) :
             1 : "X",
             2 : "Y",
             3 : "R"
             4 : "P"
-
-        '''
-        parameters = {
-        1 : "X",
-        2 : "Y",
-        3 : "R",
-        4 : "P"
-        }
-        self.direct_output()
-        if parameters.__contains__(output):
-            logging.info(__name__ + ' : Reading parameter from instrument: %s ' %parameters.get(output))
-            if ovl:
-                self.get_input_overload()
-                self.get_time_constant_overload()
-                self.get_output_overload()
-            readvalue = float(self._visainstrument.ask('OUTP?%s' %output))
-        else:
-            print('Wrong output requested.')
-        return readvalue
-
-    def do_get_X(self, ovl=False):
-        '''
-        Read out X of the Lock In
-        Check for overloads if ovl is True
-        '''
-        return self.read_output(1, ovl)
-
-    def do_get_Y(self, ovl=False):
-        '''
-        Read out Y of the Lock In
-        Check for overloads if ovl is True
-        '''
-        return self.read_output(2, ovl)
-
-    def do_get_R(self, ovl=False):
-        '''
-        Read out R of the Lock In
-        Check for overloads if ovl is True
-        '''
-        return self.read_output(3, ovl)
-
-    def do_get_P(self, ovl=False):
-        '''
-        Read out P of the Lock In
-        Check for overloads if ovl is True
-        '''
-        return self.read_output(4, ovl)
-
-    def do_set_frequency(self, frequency):
-        '''
-        Set frequency of the local oscillator
-
-        Input:
-            frequency (float) : frequency in Hz
-
-        Output:
-            None
-        '''
-        logging.debug(__name__ + ' : setting frequency to %s Hz' % frequency)
-        self._visainstrument.write('FREQ %e' % frequency)
-
-
-    def do_get_frequency(self):
-        '''
-        Get the frequency of the local oscillator
-
-        Input:
-            None
-
-        Output:
-            frequency (float) : frequency in Hz
-        '''
-        self.direct_output()
-        logging.debug(__name__ + ' : reading frequency from instrument')
-        return float(self._visainstrument.ask('FREQ?'))
-
-    def do_get_amplitude(self):
-        '''
-        Get the frequency of the local oscillator
-
-        Input:
-            None
-
-        Output:
-            frequency (float) : frequency in Hz
-        '''
-        self.direct_output()
-        logging.debug(__name__ + ' : reading frequency from instrument')
-        return float(self._visainstrument.ask('SLVL?'))
-
-    def do_set_mode(self,val):
-        logging.debug(__name__ + ' : Setting Reference mode to external' )
-        self._visainstrument.write('FMOD %d' %val)
-
-
-    def do_set_amplitude(self, amplitude):
-        '''
-        Set frequency of the local oscillator
-
-        Input:
-            frequency (float) : frequency in Hz
-
-        Output:
-            None
-        '''
-        logging.debug(__name__ + ' : setting amplitude to %s V' % amplitude)
-        self._visainstrument.write('SLVL %e' % amplitude)
-
-
-    def do_set_tau(self,timeconstant):
-        '''
-        Set the time constant of the LockIn
-
-        Input:
-            time constant (integer) : integer from 0 to 19
-
-        Output:
-            None
-        '''
-
-        self.direct_output()
-        logging.debug(__name__ + ' : setting time constant on instrument to %s'%(timeconstant))
-        self._visainstrument.write('OFLT %s' % timeconstant)
-
-    def do_get_tau(self):
-        '''
-        Get the time constant of the LockIn
-
-        Input:
-            None
-        Output:
-            time constant (integer) : integer from 0 to 19
+            ovl (bool) : read the status registers in the same transmission. The status is stored in
+                         lib.last_status (a SR830_Lib.SR830Status)
         '''
+        if output not in self.OUTPUTS:
+            raise ValueError('Wrong output requested: %s' % output)
 
-        self.direct_output()
-        logging.debug(__name__ + ' : getting time constant on instrument')
-        return float(self._visainstrument.ask('OFLT?'))
+        name = self.OUTPUTS[output]
+        logging.info(__name__ + ' : Reading parameter from instrument: %s ' % name)
+        if not ovl:
+            return self.get(name)
 
-    def do_set_sensitivity(self, sens):
-        '''
-        Set the sensitivity of the LockIn
-
-        Input:
-            sensitivity (integer) : integer from 0 to 26
-
-        Output:
-            None
-        '''
-
-        self.direct_output()
-        logging.debug(__name__ + ' : setting sensitivity on instrument to %s'%(sens))
-        self._visainstrument.write('SENS %d' % sens)
-
-    def do_get_sensitivity(self):
-        '''
-        Get the sensitivity
-            Output:
-            sensitivity (integer) : integer from 0 to 26
-        '''
-        self.direct_output()
-        logging.debug(__name__ + ' : reading sensitivity from instrument')
-        return float(self._visainstrument.ask('SENS?'))
-
-    def do_get_phase(self):
-        '''
-        Get the reference phase shift
-
-        Input:
-            None
-
-        Output:
-            phase (float) : reference phase shit in degree
-        '''
-        self.direct_output()
-        logging.debug(__name__ + ' : reading frequency from instrument')
-        return float(self._visainstrument.ask('PHAS?'))
-
-
-    def do_set_phase(self, phase):
-        '''
-        Set the reference phase shift
-
-        Input:
-            phase (float) : reference phase shit in degree
-
-        Output:
-            None
-        '''
-        logging.debug(__name__ + ' : setting the reference phase shift to %s degree' %phase)
-        self._visainstrument.write('PHAS %e' % phase)
+        with self.lib.batch():
+            reply = self.get(name)
+            self.lib._query_status()
+        return reply.value
 
     def set_aux(self, output, value):
         '''
@@ -467,8 +362,7 @@ class SR830(Instrument):
         Output:
             None
         '''
-        logging.debug(__name__ + ' : setting the output %(out)i to value %(val).3f' % {'out':output,'val': value})
-        self._visainstrument.write('AUXV %(out)i, %(val).3f' % {'out':output,'val':value})
+        self.set('out', value, output)
 
     def read_aux(self, output):
         '''
@@ -478,211 +372,14 @@ class SR830(Instrument):
         Output:
             voltage on the output D/A converter
         '''
-        logging.debug(__name__ + ' : reading the output %i' %output)
-        return float(self._visainstrument.ask('AUXV? %i' %output))
+        return self.get('out', output)
 
     def get_oaux(self, value):
         '''
-        Query the voltage on the aux output
+        Query the voltage on the aux input
         Input:
-            output - number 1-4 (defining which output you are adressing)
+            output - number 1-4 (defining which input you are adressing)
         Output:
             voltage on the input A/D converter
         '''
-        logging.debug(__name__ + ' : reading the input %i' %value)
-        return float(self._visainstrument.ask('OAUX? %i' %value))
-
-    def do_set_out(self, value, channel):
-        '''
-        Set output voltage, rounded to nearest mV.
-        '''
-        self.set_aux(channel, value)
-
-    def do_get_out(self, channel):
-        '''
-        Read output voltage.
-        '''
-        return self.read_aux(channel)
-
-    def do_get_in(self, channel):
-        '''
-        Read input voltage, resolution is 1/3 mV.
-        '''
-        return self.get_oaux(channel)
-
-    def do_get_ref_input(self):
-        '''
-        Query reference input: internal (true,1) or external (false,0)
-        '''
-        return int(self._visainstrument.ask('FMOD?'))==1
-
-    def do_set_ref_input(self, value):
-        '''
-        Set reference input: internal (true,1) or external (false,0)
-        '''
-        if value:
-            self._visainstrument.write('FMOD 1')
-        else:
-            self._visainstrument.write('FMOD 0')
-
-    def do_get_ext_trigger(self):
-        '''
-        Query trigger source for external reference: sine (0), TTL rising edge (1), TTL falling edge (2)
-        '''
-        return int(self._visainstrument.ask('RSLP?'))
-
-    def do_set_ext_trigger(self, value):
-        '''
-        Set trigger source for external reference: sine (0), TTL rising edge (1), TTL falling edge (2)
-        '''
-        self._visainstrument.write('RSLP '+ str(value))
-
-    def do_get_sync_filter(self):
-        '''
-        Query sync filter. Note: only available below 200Hz
-        '''
-        return int(self._visainstrument.ask('SYNC?'))==1
-
-    def do_set_sync_filter(self, value):
-        '''
-        Set sync filter. Note: only available below 200Hz
-        '''
-        if value:
-            self._visainstrument.write('SYNC 1')
-        else:
-            self._visainstrument.write('SYNC 0')
-
-    def do_get_harmonic(self):
-        '''
-        Query detection harmonic in the range of 1..19999.
-        Note: frequency*harmonic<102kHz
-        '''
-        return int(self._visainstrument.ask('HARM?'))
-
-    def do_set_harmonic(self, value):
-        '''
-        Set detection harmonic in the range of 1..19999.
-        Note: frequency*harmonic<102kHz
-        '''
-        self._visainstrument.write('HARM '+ str(value))
-
-    def do_get_input_config(self):
-        '''
-        Query input configuration: A (0), A-B (1), CVC 1MOhm (2), CVC 100MOhm (3)
-        '''
-        return int(self._visainstrument.ask('ISRC?'))
-
-    def do_set_input_config(self, value):
-        '''
-        Set input configuration: A (0), A-B (1), CVC 1MOhm (2), CVC 100MOhm (3)
-        '''
-        self._visainstrument.write('ISRC '+ str(value))
-
-    def do_get_input_shield(self):
-        '''
-        Query input shield: float (false,0), gnd (true,1)
-        '''
-        return int(self._visainstrument.ask('IGND?'))==1
-
-    def do_set_input_shield(self, value):
-        '''
-        Set input shield: float (false,0), gnd (true,1)
-        '''
-        if value:
-            self._visainstrument.write('IGND 1')
-        else:
-            self._visainstrument.write('IGND 0')
-
-    def do_get_input_coupling(self):
-        '''
-        Query input coupling: AC (false,0), DC (true,1)
-        '''
-        return int(self._visainstrument.ask('ICPL?'))==1
-
-    def do_set_input_coupling(self, value):
-        '''
-        Set input coupling: AC (false,0), DC (true,1)
-        '''
-        if value:
-            self._visainstrument.write('ICPL 1')
-        else:
-            self._visainstrument.write('ICPL 0')
-
-    def do_get_notch_filter(self):
-        '''
-        Query notch filter: none (0), 1xline (1), 2xline(2), both (3)
-        '''
-        return int(self._visainstrument.ask('ILIN?'))
-
-    def do_set_notch_filter(self, value):
-        '''
-        Set notch filter: none (0), 1xline (1), 2xline(2), both (3)
-        '''
-        self._visainstrument.write('ILIN ' + str(value))
-
-    def do_get_reserve(self):
-        '''
-        Query reserve: High reserve (0), Normal (1), Low noise (2)
-        '''
-        return int(self._visainstrument.ask('RMOD?'))
-
-    def do_set_reserve(self, value):
-        '''
-        Set reserve: High reserve (0), Normal (1), Low noise (2)
-        '''
-        self._visainstrument.write('RMOD ' + str(value))
-
-    def do_get_filter_slope(self):
-        '''
-        Query filter slope: 6dB/oct. (0), 12dB/oct. (1), 18dB/oct. (2), 24dB/oct. (3)
-        '''
-        return int(self._visainstrument.ask('OFSL?'))
-
-    def do_set_filter_slope(self, value):
-        '''
-        Set filter slope: 6dB/oct. (0), 12dB/oct. (1), 18dB/oct. (2), 24dB/oct. (3)
-        '''
-        self._visainstrument.write('OFSL ' + str(value))
-    def do_get_unlocked(self, update=True):
-        '''
-        Query if PLL is locked.
-        Note: the status bit will be cleared after readout!
-        Set update to True for querying present unlock situation, False for querying past events
-        '''
-        if update:
-           self._visainstrument.ask('LIAS? 3')     #for realtime detection we clear the bit by reading it
-           time.sleep(0.02)                        #and wait for a little while so that it can be set
-        return int(self._visainstrument.ask('LIAS? 3'))==1
-
-    def do_get_input_overload(self, update=True):
-        '''
-        Query if input or amplifier is in overload.
-        Note: the status bit will be cleared after readout!
-        Set update to True for querying present overload, False for querying past events
-        '''
-        if update:
-            self._visainstrument.ask('LIAS? 0')     #for realtime detection we clear the bit by reading it
-            time.sleep(0.02)                        #and wait for a little while so that it can be set again
-        return int(self._visainstrument.ask('LIAS? 0'))==1
-
-    def do_get_time_constant_overload(self, update=True):
-        '''
-        Query if filter is in overload.
-        Note: the status bit will be cleared after readout!
-        Set update to True for querying present overload, False for querying past events
-        '''
-        if update:
-            self._visainstrument.ask('LIAS? 1')     #for realtime detection we clear the bit by reading it
-            time.sleep(0.02)                        #and wait for a little while so that it can be set again
-        return int(self._visainstrument.ask('LIAS? 1'))==1
-
-    def do_get_output_overload(self, update=True):
-        '''
-        Query if output (also main display) is in overload.
-        Note: the status bit will be cleared after readout!
-        Set update to True for querying present overload, False for querying past events
-        '''
-        if update:
-            self._visainstrument.ask('LIAS? 2')     #for realtime detection we clear the bit by reading it
-            time.sleep(0.02)                        #and wait for a little while so that it can be set again
-        return int(self._visainstrument.ask('LIAS? 2'))==1
+        return self.get('in', value)
@@ -0,0 +1,89 @@
+from collections import namedtuple
+
+import numpy as np
+
+# result of analyse(); every field is a numpy array with one entry per frequency point. Points without current have
+# valid == False, an undefined (nan) impedance and series values, zero parallel capacitance and infinite parallel
+# resistance.
+ImpedanceResult = namedtuple('ImpedanceResult', ['frequency', 'impedance', 'admittance',
+                                                 'series_capacitance', 'series_resistance',
+                                                 'parallel_capacitance', 'parallel_resistance',
+                                                 'loss_tangent', 'capacitance_uncertainty', 'valid'])
+
+# result of dual_phase(); arrays with one entry per frequency point: the parallel capacitance in F and conductance in S
+# and the phase in degrees of the current after the phase reference was removed (90 for an ideal capacitor)
+DualPhaseResult = namedtuple('DualPhaseResult', ['frequency', 'capacitance', 'conductance', 'phase'])
+
+
+def complex_current(x=None, y=None, r=None, phi=None):
+    """Returns the lock-in output as complex numbers X + iY. Either x and y or r and phi (in degrees) have to be
+    given."""
+
+    if x is not None and y is not None:
+        return np.asarray(x, dtype=float) + 1j * np.asarray(y, dtype=float)
+    if r is not None and phi is not None:
+        return np.asarray(r, dtype=float) * np.exp(1j * np.radians(np.asarray(phi, dtype=float)))
+
+    raise ValueError("Either x and y or r and phi have to be given")
+
+
+def analyse(frequency, amplitude, x=None, y=None, r=None, phi=None, sigma_y=None):
+    """Calculates the impedance of the device under test and its equivalent series and parallel circuits for all
+    points of a sweep at once.
+
+    The arguments are numpy arrays (or numbers) with the frequency in Hz, the amplitude of the sine output in V and
+    the current measured with a current input of the SR830 in A, given as x and y or as r and phi in degrees (e.g. the
+    fields of a SR830_Sweep.SweepResult). If the standard deviation of y is given, the uncertainty of the parallel
+    capacitance is calculated as well, otherwise capacitance_uncertainty is None."""
+
+    frequency = np.asarray(frequency, dtype=float)
+    omega = 2 * np.pi * frequency
+    admittance = complex_current(x, y, r, phi) / amplitude
+    admittance, omega = np.broadcast_arrays(admittance, omega)
+
+    conductance = admittance.real
+    susceptance = admittance.imag
+    magnitude_squared = conductance ** 2 + susceptance ** 2
+    valid = magnitude_squared > 0
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # parallel circuit: Y = 1/Rp + i omega Cp
+        parallel_capacitance = susceptance / omega
+        parallel_resistance = np.where(conductance != 0, 1 / conductance, np.inf)
+        loss_tangent = np.where(susceptance != 0, conductance / susceptance, np.inf)
+
+        # series circuit: Z = 1/Y = Rs + 1/(i omega Cs)
+        impedance = np.where(valid, 1 / np.where(valid, admittance, 1), np.nan + 1j * np.nan)
+        series_resistance = np.where(valid, conductance / magnitude_squared, np.nan)
+        series_capacitance = np.where(valid & (susceptance != 0), magnitude_squared / (omega * susceptance), np.nan)
+
+        # the parallel capacitance only depends on y, so its uncertainty follows directly from the one of y
+        if sigma_y is not None:
+            capacitance_uncertainty = np.broadcast_to(np.asarray(sigma_y, dtype=float) / (omega * amplitude),
+                                                      omega.shape)
+        else:
+            capacitance_uncertainty = None
+
+    return ImpedanceResult(frequency, impedance, admittance, series_capacitance, series_resistance,
+                           parallel_capacitance, parallel_resistance, loss_tangent, capacitance_uncertainty, valid)
+
+
+def capacitance_from_magnitude(frequency, amplitude, r):
+    """Capacitance in F estimated from the magnitude of the current only (C = R / (2 pi f U)), as done by the older
+    measurement scripts. This is only correct for an ideal capacitor; analyse() takes the phase into account."""
+    return np.asarray(r, dtype=float) / (2 * np.pi * np.asarray(frequency, dtype=float) * amplitude)
+
+
+def dual_phase(frequency, amplitude, x, y, phase_reference=0.0):
+    """Parallel capacitance and conductance from both phases of the current (X and Y of one read_snap per point),
+    without auto phase on the device.
+
+    The phase_reference in degrees (a number or one value per point, e.g. from SR830_Calibration.PhaseReference) is the
+    phase shift of the setup itself, i.e. the measured phase of an ideal capacitor minus 90 degrees. The current is
+    rotated back by it, which gives Y = G U + i omega C U for the parallel circuit."""
+
+    frequency = np.asarray(frequency, dtype=float)
+    current = complex_current(x, y) * np.exp(-1j * np.radians(np.asarray(phase_reference, dtype=float)))
+    admittance = current / amplitude
+    return DualPhaseResult(frequency, admittance.imag / (2 * np.pi * frequency), admittance.real,
+                           np.degrees(np.angle(current)))
@@ -0,0 +1,99 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import SR830_Lib
+import SR830_Sweep
+
+
+class AsyncSR830:
+    """Coroutine version of SR830_Lib.SR830 to drive several lock-ins from one event loop, e.g.
+
+        async def main():
+            devices = [AsyncSR830(), AsyncSR830()]
+            await devices[0].connect('ASRL3::INSTR')
+            await devices[1].connect('ASRL4::INSTR')
+            results = await asyncio.gather(*(d.sweep([1000, 10000, 100000]) for d in devices))
+
+    All public methods of SR830 (set_*, read_*, read_snap, ...) are available as coroutines. The blocking calls run in
+    one worker thread per device, so the commands of a device are always sent in the order they were awaited while
+    different devices work in parallel. A call that is cancelled before its turn is not sent at all. If a call takes
+    longer than the timeout (in seconds) a TimeoutError is raised and the input buffer of the device is cleared
+    afterwards, so that a late reply can't be mistaken for the reply of the next query."""
+
+    def __init__(self, sr830=None, rm=None, timeout=None):
+        self.sr830 = sr830 if sr830 is not None else SR830_Lib.SR830(rm)
+        self.timeout = timeout
+
+        # a single worker keeps the command order of this device
+        self.__executor = ThreadPoolExecutor(max_workers=1)
+
+    def __getattr__(self, name):
+        # only called for attributes that are not defined here; public methods of the driver become coroutines
+        attribute = getattr(self.sr830, name)
+        if name.startswith("_") or not callable(attribute):
+            return attribute
+
+        async def call(*args, **kwargs):
+            return await self._run(attribute, *args, **kwargs)
+
+        call.__name__ = name
+        call.__doc__ = attribute.__doc__
+        return call
+
+    async def _run(self, function, *args, **kwargs):
+        # run a blocking function of the driver in the worker thread of this device
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.__executor, lambda: function(*args, **kwargs))
+
+        try:
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            # the call keeps running in the worker; clear the device once it finished
+            if self.sr830.instrument is not None:
+                self.__executor.submit(self.sr830.instrument.clear)
+            raise
+
+    async def close(self):
+        """Disconnects the device and stops the worker thread."""
+        if self.sr830.instrument is not None:
+            await self._run(self.sr830.disconnect)
+        self.__executor.shutdown(wait=True)
+
+    """ sweeps """
+
+    async def measure(self, sweep, frequency):
+        """Measures one frequency point with the given SR830_Sweep.FrequencySweep and returns [x, y, r, phi] and the
+        time spent waiting. The waits are awaited, so other devices can work in the meantime."""
+
+        return await self._drive(sweep.measure(frequency))
+
+    async def sweep(self, frequencies, callback=None, **sweep_options):
+        """Coroutine version of SR830_Sweep.FrequencySweep(...).run(frequencies, callback). The keyword arguments are
+        passed on to FrequencySweep. The SweepResult includes the faulty points like the one of run."""
+
+        sweep = await self._run(SR830_Sweep.FrequencySweep, self.sr830, **sweep_options)
+        result, waited = await self._drive(sweep.steps(frequencies, callback))
+        return result
+
+    async def _drive(self, steps):
+        # run one of the generators of FrequencySweep: its steps in the worker, its waits in the event loop
+        waited = 0.0
+        while True:
+            finished, value = await self._run(self._step, steps)
+            if finished:
+                return value, waited
+
+            trace = self.sr830.trace
+            start = trace.clock() if trace is not None else None
+            await asyncio.sleep(value)
+            if trace is not None:
+                trace.record_sleep(start, trace.clock())
+            waited += value
+
+    @staticmethod
+    def _step(steps):
+        # a StopIteration can't be passed through a future, so the result of the generator is returned instead
+        try:
+            return False, next(steps)
+        except StopIteration as finished:
+            return True, finished.value
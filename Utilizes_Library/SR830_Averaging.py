@@ -0,0 +1,215 @@
+import math
+from collections import namedtuple
+
+import numpy as np
+
+# equivalent noise bandwidth of the output filter times the time constant for 6, 12, 18 and 24 dB/oct (manual, p. 3-29)
+NOISE_BANDWIDTHS = {6: 1 / 4, 12: 1 / 8, 18: 3 / 32, 24: 5 / 64}
+
+# result of Averager.average(): the mean of X and Y, their standard errors (corrected for the correlation of the
+# samples by the output filter), the number of samples, the relative uncertainty of the capacitance (of the component
+# of the current along the phase reference + 90 degrees), whether the target uncertainty was reached and the Allan
+# deviation of that component (in A or V) over the averaging times in s
+AveragedPoint = namedtuple('AveragedPoint', ['x', 'y', 'sigma_x', 'sigma_y', 'samples', 'relative_uncertainty',
+                                             'converged', 'allan_time', 'allan_deviation'])
+
+
+def noise_bandwidth(time_constant, filter_slope):
+    """Equivalent noise bandwidth of the output filter in Hz."""
+    return NOISE_BANDWIDTHS[filter_slope] / time_constant
+
+
+def allan_deviation(samples, interval, factors=None):
+    """Overlapping Allan deviation of equally spaced samples (taken every interval seconds). Returns the averaging
+    times and the deviations for the given averaging factors (by default powers of 2 up to a third of the samples).
+
+    For white noise the deviation falls with 1 / sqrt(averaging time); where it flattens or rises, drift dominates and
+    longer averaging does not help any more."""
+
+    samples = np.asarray(samples, dtype=float)
+    if factors is None:
+        factors = 2 ** np.arange(int(math.log2(max(len(samples) // 3, 1))) + 1)
+    factors = np.asarray([m for m in factors if 2 * m < len(samples)], dtype=int)
+
+    # the means over m samples follow from the cumulative sum, so every factor costs one vectorised difference
+    cumulative = np.concatenate(([0.0], np.cumsum(samples)))
+    deviations = np.empty(len(factors))
+    for i, m in enumerate(factors):
+        means = (cumulative[m:] - cumulative[:-m]) / m
+        differences = means[m:] - means[:-m]
+        deviations[i] = math.sqrt(0.5 * np.mean(differences ** 2))
+
+    return factors * interval, deviations
+
+
+class RunningStatistics:
+    """Mean and variance of a growing number of samples (Welford), for several channels at once. Blocks of samples are
+    merged with the parallel form of the algorithm, so that buffered readings are added as whole arrays."""
+
+    def __init__(self, channels=1):
+        self.count = 0
+        self.mean = np.zeros(channels)
+        self.__m2 = np.zeros(channels)
+
+    def add(self, value):
+        value = np.asarray(value, dtype=float)
+        self.count += 1
+        delta = value - self.mean
+        self.mean = self.mean + delta / self.count
+        self.__m2 = self.__m2 + delta * (value - self.mean)
+
+    def extend(self, values):
+        """Adds an array of samples with one row per sample."""
+        values = np.asarray(values, dtype=float).reshape(-1, len(self.mean))
+        count = len(values)
+        if not count:
+            return
+        mean = values.mean(axis=0)
+        m2 = ((values - mean) ** 2).sum(axis=0)
+
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * count / total
+        self.__m2 = self.__m2 + m2 + delta ** 2 * self.count * count / total
+        self.count = total
+
+    @property
+    def variance(self):
+        """Sample variance (n - 1) of every channel; nan for less than two samples."""
+        if self.count < 2:
+            return np.full(len(self.mean), np.nan)
+        return self.__m2 / (self.count - 1)
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+
+class Averager:
+    """Averages the output of an SR830_Lib.SR830 at one point until the capacitance is known well enough, e.g.
+
+        averager = Averager(sr830, relative_uncertainty=1e-3, time_constant=1, filter_slope=12)
+        sweep = SR830_Sweep.FrequencySweep(sr830, time_constant=1, filter_slope=12, averager=averager,
+                                           phase_reference=phase_reference)
+
+    The samples are read with read_snap every interval seconds (source "snap") or recorded by the internal buffer at
+    sample_rate and read in blocks (source "buffer", the displays are set to X and Y). After every sample (or block)
+    the mean and variance are updated; the averaging stops as soon as the standard error of the capacitance component
+    relative to its mean is below relative_uncertainty (after min_samples) or after max_samples. Quiet points stop
+    after a few samples while noisy points are averaged longer.
+
+    Samples closer than 1 / (2 noise bandwidth) of the output filter are not independent; the standard errors take
+    this into account, and the default interval of "snap" is this correlation time. The capacitance component is the
+    one along the phase reference (in degrees) + 90 degrees. In a sweep it is taken per point from the
+    SR830_Calibration.PhaseReference of the sweep; phase_reference is the fixed one used without it."""
+
+    SOURCES = ("snap", "buffer")
+
+    def __init__(self, sr830, relative_uncertainty=1e-3, max_samples=1000, min_samples=5, source="snap",
+                 interval=None, sample_rate=64, block=32, phase_reference=0.0, time_constant=None, filter_slope=None):
+
+        if source not in self.SOURCES:
+            raise ValueError("Source must be one of " + str(self.SOURCES))
+        if not 2 <= min_samples <= max_samples:
+            raise ValueError("The samples must be at least 2 and min_samples must not exceed max_samples")
+
+        self.sr830 = sr830
+
+        # if the filter settings are not given they are read from the device
+        if time_constant is None:
+            time_constant = sr830.read_time_constant()
+        if filter_slope is None:
+            filter_slope = sr830.read_filter_slope()
+
+        self.relative_uncertainty = relative_uncertainty
+        self.max_samples = max_samples
+        self.min_samples = min_samples
+        self.source = source
+        self.sample_rate = sample_rate
+        self.block = block
+        self.phase_reference = phase_reference
+        self.correlation_time = 1 / (2 * noise_bandwidth(time_constant, filter_slope))
+        self.interval = self.correlation_time if interval is None else interval
+        self.last = None
+
+    def average(self, phase_reference=None):
+        """Generator that averages the current point (after the output settled). It yields the times to wait and
+        returns [x, y, r, phi] of the mean; the full AveragedPoint is kept in last. The phase reference can be given
+        per point, e.g. from a PhaseReference at the frequency of the point."""
+
+        if phase_reference is None:
+            phase_reference = self.phase_reference
+        rotation = np.exp(-1j * math.radians(phase_reference))
+
+        statistics = RunningStatistics(3)
+        samples = []
+
+        if self.source == "snap":
+            interval = self.interval
+            while True:
+                x, y, r, phi = self.sr830.read_snap()
+                capacitive = (complex(x, y) * rotation).imag
+                statistics.add((x, y, capacitive))
+                samples.append(capacitive)
+                if self._finished(statistics, interval):
+                    break
+                yield interval
+        else:
+            interval = yield from self._average_buffer(statistics, samples, rotation)
+
+        x, y, capacitive = statistics.mean
+        errors = self._standard_errors(statistics, interval)
+        uncertainty = self._relative_uncertainty(statistics, interval)
+        allan_time, allan = allan_deviation(samples, interval)
+
+        self.last = AveragedPoint(x, y, errors[0], errors[1], statistics.count, uncertainty,
+                                  uncertainty <= self.relative_uncertainty, allan_time, allan)
+        return [x, y, math.hypot(x, y), math.degrees(math.atan2(y, x))]
+
+    def _average_buffer(self, statistics, samples, rotation):
+        sr830 = self.sr830
+        sr830.pause_buffer()
+        sr830.display_ch1_x()
+        sr830.display_ch2_y()
+        rate = sr830.set_sample_rate(self.sample_rate)
+        sr830.set_buffer_mode_one_shot()
+        sr830.reset_buffer()
+        sr830.start_buffer()
+
+        limit = min(self.max_samples, sr830.BUFFER_SIZE)
+        read = 0
+        try:
+            while True:
+                yield min(self.block, limit - read) / rate
+                stored = min(sr830.read_buffer_length(), limit)
+                if stored <= read:
+                    continue
+
+                x = sr830.read_buffer(1, read, stored - read)
+                y = sr830.read_buffer(2, read, stored - read)
+                capacitive = ((x + 1j * y) * rotation).imag
+                statistics.extend(np.column_stack((x, y, capacitive)))
+                samples.extend(capacitive)
+                read = stored
+
+                if self._finished(statistics, 1 / rate) or read >= limit:
+                    return 1 / rate
+        finally:
+            sr830.pause_buffer()
+
+    def _finished(self, statistics, interval):
+        if statistics.count >= self.max_samples:
+            return True
+        return statistics.count >= self.min_samples and \
+            self._relative_uncertainty(statistics, interval) <= self.relative_uncertainty
+
+    def _standard_errors(self, statistics, interval):
+        # samples within the correlation time count as one
+        independent = statistics.count * min(1.0, interval / self.correlation_time)
+        return statistics.std / math.sqrt(max(independent, 1.0))
+
+    def _relative_uncertainty(self, statistics, interval):
+        mean = abs(statistics.mean[2])
+        if mean == 0:
+            return math.inf
+        return float(self._standard_errors(statistics, interval)[2] / mean)
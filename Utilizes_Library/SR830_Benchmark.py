@@ -0,0 +1,255 @@
+"""Benchmarks of the sweep throughput and the per call overhead of SR830_Lib, run without a device:
+
+    python SR830_Benchmark.py                     # run all benchmarks and compare them with the baseline
+    python SR830_Benchmark.py --save-baseline     # run all benchmarks and store the results as new baseline
+
+The sweep runs against SR830_Sim in virtual time, so the waits and the simulated serial transfer cost no real time.
+It reports the points per second the sweep reaches on the simulated serial link (instrument time) and the real time
+the host spends per point (driver and Python). The per call benchmarks use a loopback resource that answers
+immediately, so they measure the overhead of the driver alone; only the settings cache, which saves transfers rather
+than Python time, is measured on the simulated serial link.
+
+A result that is worse than the baseline by more than the tolerance is reported as regression and the script exits
+with 1."""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import SR830_Analysis
+import SR830_Lib
+import SR830_Sim
+import SR830_Sweep
+import SR830_Trace
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "SR830_Benchmark_baseline.json")
+
+# frequencies, amplitude and filter of Trial.py
+TRIAL_FREQUENCIES = [1000, 2500, 5000, 7500, 10000, 25000, 50000, 75000, 100000]
+TRIAL_AMPLITUDE = .004
+
+# the simulated gap. At 100 kHz it draws 25 nA, more than the 100 MOhm input of Trial.py measures (10 nA at 1 V), so
+# the benchmark uses the 1 MOhm input at 50 mV (50 nA full scale), which keeps every point in range
+TRIAL_CAPACITANCE = 10e-12
+TRIAL_SENSITIVITY = .05
+
+# virtual time in s the simulator settles after the setup before the sweep is timed (20 time constants)
+TRIAL_SETTLE_TIME = 20
+
+# relative deviation from TRIAL_CAPACITANCE up to which the sweep counts as valid
+TRIAL_CAPACITANCE_TOLERANCE = 1e-2
+
+
+class LoopbackResource:
+    """pyvisa resource that answers every query immediately with a fixed reply."""
+
+    REPLIES = {"SNAP?": "1.234e-06,-2.345e-07,1.256e-06,-10.78", "OUTP?": "1.234e-06"}
+    DEFAULT_REPLY = "0"
+
+    def __init__(self):
+        self.timeout = 2000
+        self.read_termination = '\n'
+        self.write_termination = '\n'
+        self.__replies = []
+
+    def write(self, message):
+        for command in message.split(";"):
+            name = SR830_Trace.mnemonic(command)
+            if name.endswith("?"):
+                self.__replies.append(self.REPLIES.get(name, self.DEFAULT_REPLY))
+
+    def read(self):
+        return self.__replies.pop(0)
+
+    def query(self, message):
+        self.write(message)
+        return self.read()
+
+    def clear(self):
+        self.__replies = []
+
+    def close(self):
+        pass
+
+
+def _setup_trial(sr830):
+    # the setup of Trial.py, except for the input range (see TRIAL_SENSITIVITY)
+    with sr830.batch():
+        sr830.use_internal_reference()
+        sr830.enable_line_filters()
+        sr830.set_input_mode_I_1M()
+        sr830.set_input_shield_to_floating()
+        sr830.set_input_coupling_dc()
+        sr830.set_filter_slope(12)
+        sr830.set_reserve_normal()
+        sr830.set_time_constant(1)
+        sr830.set_sensitivity(TRIAL_SENSITIVITY)
+        sr830.display_ch1_x()
+        sr830.display_ch2_y()
+    sr830.set_sine_output_level(TRIAL_AMPLITUDE)
+
+
+def benchmark_trial_sweep(repeats=3, baud_rate=9600, latency=0.002):
+    """Runs the sweep of Trial.py (convergence polling, phase corrected on the host) on a simulated 10 pF gap in virtual
+    time. Returns the points per second on the simulated device and the host time per point in ms (best of the
+    repeats).
+
+    Only the sweep is timed; the simulator settles after the setup first. A sweep with clipped points or a capacitance
+    off by more than TRIAL_CAPACITANCE_TOLERANCE raises a RuntimeError instead of giving a rate, so that a faster but
+    wrong sweep does not count as improvement."""
+
+    instrument_rate = 0
+    host_time = float('inf')
+
+    for _ in range(repeats):
+        clock = SR830_Sim.VirtualClock()
+        rm = SR830_Sim.SimulatedResourceManager(load=SR830_Sim.RCLoad(capacitance=TRIAL_CAPACITANCE),
+                                                baud_rate=baud_rate, latency=latency, seed=1, clock=clock.time,
+                                                sleep=clock.sleep)
+        sr830 = SR830_Lib.SR830(rm)
+        sr830.connect('ASRL3::INSTR')
+
+        # the sweep sleeps through the trace, which sleeps in virtual time
+        sr830.enable_trace(SR830_Trace.CommandTrace(clock=clock.time, sleep=clock.sleep))
+
+        _setup_trial(sr830)
+        clock.sleep(TRIAL_SETTLE_TIME)
+
+        start_host = time.perf_counter()
+        start = clock.time()
+        sweep = SR830_Sweep.FrequencySweep(sr830, time_constant=1, filter_slope=12, convergence_tolerance=1e-3)
+        result = sweep.run(TRIAL_FREQUENCIES)
+        host = time.perf_counter() - start_host
+        duration = clock.time() - start
+
+        _check_trial_sweep(result)
+        instrument_rate = max(instrument_rate, len(TRIAL_FREQUENCIES) / duration)
+        host_time = min(host_time, host / len(TRIAL_FREQUENCIES))
+
+    return instrument_rate, 1e3 * host_time
+
+
+def _check_trial_sweep(result):
+    if result.fault.any():
+        raise RuntimeError("The trial sweep clipped at " +
+                           ", ".join("%g Hz" % frequency for frequency in result.frequency[result.fault]))
+    capacitance = SR830_Analysis.dual_phase(result.frequency, TRIAL_AMPLITUDE, result.x, result.y).capacitance
+    deviation = abs(capacitance / TRIAL_CAPACITANCE - 1)
+    if deviation.max() > TRIAL_CAPACITANCE_TOLERANCE:
+        i = deviation.argmax()
+        raise RuntimeError("The trial sweep measured %.4g pF at %g Hz instead of %g pF"
+                           % (capacitance[i] * 1e12, result.frequency[i], TRIAL_CAPACITANCE * 1e12))
+
+
+def benchmark_call(function, number=20000, repeats=5):
+    """Returns the time of one call of the function in us (best of the repeats)."""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        best = min(best, time.perf_counter() - start)
+    return 1e6 * best / number
+
+
+def benchmark_device_call(function, settings_cache, number=100, baud_rate=9600, latency=0.002):
+    """Returns the time of one call of function(sr830) in ms on the simulated device in virtual time (the transfer on
+    the serial link and the latency), with or without the settings cache."""
+    clock = SR830_Sim.VirtualClock()
+    rm = SR830_Sim.SimulatedResourceManager(baud_rate=baud_rate, latency=latency, clock=clock.time, sleep=clock.sleep)
+    sr830 = SR830_Lib.SR830(rm)
+    sr830.connect('ASRL3::INSTR')
+    if settings_cache:
+        sr830.enable_settings_cache()
+
+    start = clock.time()
+    for _ in range(number):
+        function(sr830)
+    return 1e3 * (clock.time() - start) / number
+
+
+def loopback_sr830():
+    sr830 = SR830_Lib.SR830(rm=object())
+    sr830.instrument = LoopbackResource()
+    return sr830
+
+
+def run_benchmarks(repeats=3):
+    """Runs all benchmarks and returns {name: (value, unit, higher_is_better)}."""
+
+    results = {}
+    rate, host = benchmark_trial_sweep(repeats)
+    results["trial_sweep_points_per_second"] = (rate, "points/s", True)
+    results["trial_sweep_host_time_per_point"] = (host, "ms", False)
+
+    sr830 = loopback_sr830()
+    results["read_x"] = (benchmark_call(sr830.read_x), "us", False)
+    results["read_snap"] = (benchmark_call(sr830.read_snap), "us", False)
+    results["set_sensitivity"] = (benchmark_call(lambda: sr830.set_sensitivity(.2)), "us", False)
+    # the settings cache saves transfers, so it is measured on the simulated link and not against the loopback
+    for name, cache in (("set_sensitivity_device", False), ("set_sensitivity_device_cached", True)):
+        results[name] = (benchmark_device_call(lambda device: device.set_sensitivity(.2), cache), "ms", False)
+    results["find_suitable_range"] = (benchmark_call(
+        lambda: SR830_Lib.SR830.find_suitable_range(3e-4, SR830_Lib.SR830.SENSITIVITY_RANGES)), "us", False)
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Returns the names of all results that are worse than the baseline by more than the relative tolerance."""
+    regressions = []
+    for name, (value, unit, higher_is_better) in results.items():
+        if name not in baseline:
+            continue
+        change = (value - baseline[name]) / baseline[name]
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def report(results, baseline, regressions):
+    lines = ["{:<34}{:>14}{:>14}{:>10}".format("benchmark", "result", "baseline", "change")]
+    for name, (value, unit, higher_is_better) in results.items():
+        if name in baseline:
+            reference = "{:.4g}".format(baseline[name])
+            change = "{:+.1%}".format((value - baseline[name]) / baseline[name])
+        else:
+            reference = change = "-"
+        mark = "  REGRESSION" if name in regressions else ""
+        lines.append("{:<34}{:>14}{:>14}{:>10}{}".format(name, "{:.4g} {}".format(value, unit), reference, change,
+                                                         mark))
+    return "\n".join(lines)
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of the SR830 driver against the simulated device")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="json file with the baseline results")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="relative change that counts as regression (default 0.2)")
+    parser.add_argument("--repeats", type=int, default=3, help="repetitions of the sweep benchmark")
+    options = parser.parse_args(arguments)
+
+    results = run_benchmarks(options.repeats)
+
+    baseline = {}
+    if os.path.exists(options.baseline):
+        with open(options.baseline, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+
+    regressions = compare(results, baseline, options.tolerance)
+    print(report(results, baseline, regressions))
+
+    if options.save_baseline:
+        with open(options.baseline, 'w', encoding='utf-8') as file:
+            json.dump({name: value for name, (value, unit, higher_is_better) in results.items()}, file, indent=1)
+        print("Baseline saved to " + options.baseline)
+        return 0
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,325 @@
+import os
+from collections import namedtuple
+
+import numpy as np
+
+import SR830_Analysis
+import SR830_Profile
+import SR830_Writer
+
+# settings of the SR830 a fixture calibration is valid for: the input mode (as name of SR830_Profile.SETTINGS, e.g.
+# "I_100M"), the sensitivity in V and the time constant in s
+CalibrationKey = namedtuple('CalibrationKey', ['input', 'sensitivity', 'time_constant'])
+
+STANDARDS = ("open", "short", "load")
+
+
+def settings_key(sr830):
+    """Returns the CalibrationKey of the current settings of an SR830_Lib.SR830 (read in one transmission)."""
+    with sr830.batch():
+        input_mode = sr830.read_input_mode()
+        sensitivity = sr830.read_sensitivity()
+        time_constant = sr830.read_time_constant()
+    return CalibrationKey(SR830_Profile.MeasurementProfile._decode("input", float(input_mode.value)),
+                          sensitivity.value, time_constant.value)
+
+
+def measure_impedance(sweep, frequencies, amplitude, callback=None):
+    """Runs the SR830_Sweep.FrequencySweep and returns the measured impedance U / I (complex, in Ohm) per frequency."""
+    result = sweep.run(frequencies, callback)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return amplitude / SR830_Analysis.complex_current(result.x, result.y)
+
+
+def read_legacy_short(filename):
+    """Reads a short circuit calibration of the older measurement scripts (semshort*.csv with the columns frequency,
+    impedance and phase in degrees). Returns the frequencies, the complex impedance and the amplitude."""
+    metadata, columns, data = SR830_Writer.read_sweep(filename)
+    if columns is None or len(columns) < 3:
+        raise ValueError(filename + " is not a calibration file")
+    impedance = data[:, 1] * np.exp(1j * np.radians(data[:, 2]))
+    return data[:, 0], impedance, metadata.get("Ue / V")
+
+
+class _FrequencyTable:
+    """Base of the calibrations: values at increasing frequencies for one CalibrationKey. The values at the frequencies
+    of a sweep are interpolated by the subclass and cached per frequency list."""
+
+    # name of the kind of calibration in the error messages
+    NAME = "calibration"
+    # number of frequency lists whose interpolated values are kept
+    CACHE_SIZE = 32
+
+    def __init__(self, frequency, key=None):
+        self.frequency = np.asarray(frequency, dtype=float)
+        self.key = key
+        if self.frequency.ndim != 1 or not len(self.frequency):
+            raise ValueError("A " + self.NAME + " needs at least one frequency")
+        if np.any(np.diff(self.frequency) <= 0):
+            raise ValueError("The frequencies of a " + self.NAME + " must be increasing")
+        self.__interpolated = {}
+
+    def _cached(self, frequency, interpolate):
+        # interpolate(frequency) is only called for a frequency list that is not in the cache
+        frequency = np.asarray(frequency, dtype=float)
+        cache_key = frequency.tobytes()
+        values = self.__interpolated.get(cache_key)
+        if values is None:
+            values = interpolate(frequency)
+            if len(self.__interpolated) >= self.CACHE_SIZE:
+                self.__interpolated.clear()
+            self.__interpolated[cache_key] = values
+        return values
+
+    def _save(self, filename, **arrays):
+        if self.key is not None:
+            arrays.update(input=np.array(self.key.input), sensitivity=np.array(self.key.sensitivity),
+                          time_constant=np.array(self.key.time_constant))
+        np.savez(filename, frequency=self.frequency, **arrays)
+
+    @staticmethod
+    def _load_key(data):
+        # the CalibrationKey of a file loaded with np.load or None
+        if "input" not in data:
+            return None
+        return CalibrationKey(str(data["input"]), float(data["sensitivity"]), float(data["time_constant"]))
+
+
+class FixtureCalibration(_FrequencyTable):
+    """Open / short / load compensation of the fixture for one CalibrationKey, e.g.
+
+        calibration = FixtureCalibration.record(sweep, frequencies, .004, key=settings_key(sr830))
+        calibration.save("fixture.npz")
+        ...
+        result = calibration.correct_sweep(sweep.run(frequencies), .004)
+
+    The standards are the impedances (U / I) measured with the fixture open, shorted and with a known load at the
+    calibration frequencies. The fixture is treated as linear two port, which gives
+
+        Z = A (Zm - Zs) / (1 - Zm Yo)
+
+    for the measured impedance Zm, with the short Zs, the open admittance Yo = 1 / Zo and A = 1 - Zs Yo, or with a
+    load Zl measured as Zlm, A = Zl (1 - Zlm Yo) / (Zlm - Zs). A missing open or short is left out (Yo = 0, Zs = 0).
+
+    The coefficients are calculated once from the standards. For the frequencies of a sweep they are interpolated
+    linearly over the logarithm of the frequency (constant outside of the calibrated range) and kept, so that every
+    further sweep with the same frequencies is corrected with a few array operations."""
+
+    # prefix of the files in a CalibrationStore
+    PREFIX = "fixture"
+
+    def __init__(self, frequency, open=None, short=None, load=None, load_impedance=None, key=None):
+        super().__init__(frequency, key)
+        if open is None and short is None:
+            raise ValueError("A calibration needs an open or a short measurement")
+        if (load is None) != (load_impedance is None):
+            raise ValueError("A load measurement needs the impedance of the load and vice versa")
+
+        standards = {}
+        for name, values in (("open", open), ("short", short), ("load", load), ("load_impedance", load_impedance)):
+            if values is not None:
+                values = np.broadcast_to(np.asarray(values, dtype=complex), self.frequency.shape).copy()
+                standards[name] = values
+        self.standards = standards
+
+        short = standards.get("short", np.zeros(len(self.frequency), dtype=complex))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            open_admittance = 1 / standards["open"] if "open" in standards else np.zeros_like(short)
+            if "load" in standards:
+                gain = standards["load_impedance"] * (1 - standards["load"] * open_admittance) / \
+                    (standards["load"] - short)
+            else:
+                gain = 1 - short * open_admittance
+
+        self.coefficients = np.array([gain, short, open_admittance])
+        if not np.all(np.isfinite(self.coefficients)):
+            raise ValueError("The standards give no finite correction (e.g. the load equals the short)")
+
+    def __repr__(self):
+        return "FixtureCalibration(" + ", ".join(name for name in STANDARDS if name in self.standards) + ", " + \
+            "{:g} Hz to {:g} Hz, {})".format(self.frequency[0], self.frequency[-1], self.key)
+
+    """ correction """
+
+    def interpolate(self, frequency):
+        """Returns the coefficients (A, Zs, Yo) at the given frequencies as array of shape (3, number of frequencies).
+        The result is cached per frequency list."""
+
+        def interpolate(frequency):
+            log_frequency = np.log(frequency.ravel())
+            log_calibration = np.log(self.frequency)
+            return np.array([np.interp(log_frequency, log_calibration, c.real) +
+                             1j * np.interp(log_frequency, log_calibration, c.imag)
+                             for c in self.coefficients]).reshape((3,) + frequency.shape)
+
+        return self._cached(frequency, interpolate)
+
+    def correct(self, frequency, impedance):
+        """Returns the impedance of the device under test for the measured impedances (complex, in Ohm) at the given
+        frequencies. Works on whole arrays, e.g. many sweeps with the frequencies along the last axis."""
+        gain, short, open_admittance = self.interpolate(frequency)
+        impedance = np.asarray(impedance, dtype=complex)
+        return gain * (impedance - short) / (1 - impedance * open_admittance)
+
+    def correct_sweep(self, result, amplitude):
+        """Corrects a SR830_Sweep.SweepResult (measured with the given amplitude in V) and returns the
+        SR830_Analysis.ImpedanceResult of the device under test."""
+        current = SR830_Analysis.complex_current(result.x, result.y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            impedance = self.correct(result.frequency, amplitude / current)
+            current = np.where(current != 0, amplitude / impedance, 0)
+        return SR830_Analysis.analyse(result.frequency, amplitude, current.real, current.imag)
+
+    """ recording """
+
+    @classmethod
+    def record(cls, sweep, frequencies, amplitude, standards=("open", "short"), load_impedance=None, key=None,
+               prompt=input):
+        """Measures the standards one after another with the SR830_Sweep.FrequencySweep. Before every standard prompt
+        is called with a request to connect it (input() waits for enter). The key defaults to the current settings of
+        the SR830."""
+
+        unknown = set(standards) - set(STANDARDS)
+        if unknown:
+            raise ValueError("Unknown standards " + ", ".join(sorted(unknown)))
+        if key is None:
+            key = settings_key(sweep.sr830)
+
+        frequencies = np.sort(np.asarray(frequencies, dtype=float))
+        measured = {}
+        for standard in standards:
+            if prompt is not None:
+                prompt("Connect the " + standard + " standard to the fixture and press enter ")
+            measured[standard] = measure_impedance(sweep, frequencies, amplitude)
+
+        return cls(frequencies, load_impedance=load_impedance, key=key, **measured)
+
+    @classmethod
+    def from_legacy_short(cls, filename, key=None):
+        """Returns a short only calibration from a semshort*.csv file of the older measurement scripts."""
+        frequency, impedance, amplitude = read_legacy_short(filename)
+        order = np.argsort(frequency)
+        return cls(frequency[order], short=impedance[order], key=key)
+
+    """ files """
+
+    def save(self, filename):
+        """Saves the standards (not the coefficients, they are recalculated on loading) as .npz file."""
+        self._save(filename, **self.standards)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as data:
+            standards = {name: data[name] for name in STANDARDS + ("load_impedance",) if name in data}
+            return cls(data["frequency"], key=cls._load_key(data), **standards)
+
+
+class PhaseReference(_FrequencyTable):
+    """Phase shift of the setup (current amplifier, cables, fixture) per frequency for SR830_Analysis.dual_phase, so
+    that the capacitance can be calculated from X and Y without auto phase at every point, e.g.
+
+        reference = PhaseReference.record(sweep, frequencies)      # with a reference capacitor in the fixture
+        ...
+        result = sweep.run(frequencies)
+        estimate = SR830_Analysis.dual_phase(result.frequency, .004, result.x, result.y, reference.at(result.frequency))
+
+    It is recorded with an (ideally lossless) capacitor, whose current leads the reference by 90 degrees; the phase
+    reference is the measured phase minus 90 degrees. Between the calibration frequencies the phase is interpolated
+    linearly over the logarithm of the frequency; the values for a frequency list are cached."""
+
+    NAME = "phase reference"
+    PREFIX = "phase"
+
+    def __init__(self, frequency, phase, key=None):
+        super().__init__(frequency, key)
+        self.phase = np.broadcast_to(np.asarray(phase, dtype=float), self.frequency.shape).copy()
+
+    def __repr__(self):
+        return "PhaseReference({:g} Hz to {:g} Hz, {})".format(self.frequency[0], self.frequency[-1], self.key)
+
+    def at(self, frequency):
+        """Returns the phase reference in degrees at the given frequencies."""
+        return self._cached(frequency, lambda f: np.interp(np.log(f), np.log(self.frequency), self.phase))
+
+    @classmethod
+    def record(cls, sweep, frequencies, key=None, prompt=input):
+        """Measures the phase of a reference capacitor with the SR830_Sweep.FrequencySweep (which should not use auto
+        phase). The key defaults to the current settings of the SR830."""
+        if key is None:
+            key = settings_key(sweep.sr830)
+        if prompt is not None:
+            prompt("Connect the reference capacitor to the fixture and press enter ")
+
+        frequencies = np.sort(np.asarray(frequencies, dtype=float))
+        result = sweep.run(frequencies)
+        # unwrapped, so that the interpolation does not jump between +180 and -180 degrees
+        phase = np.degrees(np.unwrap(np.angle(SR830_Analysis.complex_current(result.x, result.y))))
+        return cls(frequencies, phase - 90, key)
+
+    @classmethod
+    def from_fixture(cls, calibration):
+        """Phase reference from the gain of a FixtureCalibration with a load standard."""
+        gain = calibration.coefficients[0]
+        # the gain multiplies the measured impedance, so the current is shifted by its angle
+        return cls(calibration.frequency, np.degrees(np.unwrap(np.angle(gain))), calibration.key)
+
+    def save(self, filename):
+        self._save(filename, phase=self.phase)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as data:
+            return cls(data["frequency"], data["phase"], cls._load_key(data))
+
+
+class CalibrationStore:
+    """Directory with one file per CalibrationKey and kind of calibration (FixtureCalibration or PhaseReference).
+    Calibrations are loaded once and kept, so that a long series of measurements with the same settings does not read
+    the files again:
+
+        store = CalibrationStore("calibrations")
+        store.save(FixtureCalibration.record(sweep, frequencies, .004))
+        ...
+        calibration = store.find(sr830)
+        if calibration is not None:
+            result = calibration.correct_sweep(result, .004)"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.__calibrations = {}
+
+    def filename(self, key, kind=FixtureCalibration):
+        return os.path.join(self.directory, "{}_{}_{:.0e}V_{:.0e}s.npz".format(
+            kind.PREFIX, key.input, key.sensitivity, key.time_constant))
+
+    def save(self, calibration):
+        if calibration.key is None:
+            raise ValueError("Only calibrations with a key can be stored")
+        os.makedirs(self.directory, exist_ok=True)
+        calibration.save(self.filename(calibration.key, type(calibration)))
+        self.__calibrations[type(calibration), calibration.key] = calibration
+
+    def get(self, key, kind=FixtureCalibration):
+        """Returns the calibration of the kind for the key. Raises a KeyError if there is none."""
+        calibration = self.__calibrations.get((kind, key))
+        if calibration is None:
+            filename = self.filename(key, kind)
+            if not os.path.exists(filename):
+                raise KeyError(key)
+            calibration = self.__calibrations[kind, key] = kind.load(filename)
+        return calibration
+
+    def find(self, sr830, kind=FixtureCalibration):
+        """Returns the calibration of the kind for the current settings of the SR830 or None if there is none."""
+        try:
+            return self.get(settings_key(sr830), kind)
+        except KeyError:
+            return None
+
+    def keys(self, kind=FixtureCalibration):
+        """Returns the keys of all stored calibrations of the kind."""
+        keys = []
+        for name in sorted(os.listdir(self.directory)) if os.path.isdir(self.directory) else ():
+            if name.startswith(kind.PREFIX + "_") and name.endswith(".npz"):
+                keys.append(kind.load(os.path.join(self.directory, name)).key)
+        return keys
@@ -0,0 +1,232 @@
+import io
+import json
+import os
+import sqlite3
+import time
+from collections import namedtuple
+
+import numpy as np
+
+import SR830_Sweep
+import SR830_Writer
+
+# a sweep read from the database: its id, the name of the device, the id of the run, the time it was stored (unix
+# time), the name of the profile of the run, the amplitude in V and the SR830_Sweep.SweepResult
+StoredSweep = namedtuple('StoredSweep', ['id', 'device', 'run', 'timestamp', 'profile', 'amplitude', 'result'])
+
+# the fields of a SweepResult, each stored as npy blob in a column of its own
+ARRAY_COLUMNS = SR830_Sweep.SweepResult._fields
+
+# relative difference up to which a stored amplitude matches the amplitude of a query
+AMPLITUDE_TOLERANCE = 1e-6
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    description TEXT
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    device_id INTEGER NOT NULL REFERENCES devices (id),
+    started REAL NOT NULL,
+    profile TEXT,
+    settings TEXT,
+    notes TEXT
+);
+CREATE TABLE IF NOT EXISTS sweeps (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    device_id INTEGER NOT NULL REFERENCES devices (id),
+    timestamp REAL NOT NULL,
+    amplitude REAL,
+    points INTEGER NOT NULL,
+    """ + ",\n    ".join(column + " BLOB" for column in ARRAY_COLUMNS) + """
+);
+CREATE INDEX IF NOT EXISTS runs_device ON runs (device_id, started);
+CREATE INDEX IF NOT EXISTS sweeps_device_amplitude ON sweeps (device_id, amplitude, timestamp);
+CREATE INDEX IF NOT EXISTS sweeps_run ON sweeps (run_id);
+CREATE INDEX IF NOT EXISTS sweeps_timestamp ON sweeps (timestamp);
+"""
+
+
+def _to_blob(array):
+    if array is None:
+        return None
+    buffer = io.BytesIO()
+    np.save(buffer, np.asarray(array), allow_pickle=False)
+    return buffer.getvalue()
+
+
+def _from_blob(blob):
+    if blob is None:
+        return None
+    return np.load(io.BytesIO(blob), allow_pickle=False)
+
+
+class MeasurementDatabase:
+    """Local SQLite database of sweeps, e.g.
+
+        with MeasurementDatabase("measurements.sqlite") as database:
+            run = database.start_run("gap 7", SR830_Profile.CAPACITANCE_SWEEP)
+            database.add_sweep(run, sweep.run(frequencies))
+            ...
+            for stored in database.sweeps(device="gap 7", amplitude=.004):
+                print(stored.timestamp, stored.result.y)
+
+    A run is a series of sweeps of one device with one instrument profile; its settings are stored with it as json.
+    Every sweep keeps the arrays of its SweepResult as npy blobs (one column per field), so that a sweep is read back
+    without parsing text, and its amplitude (the one of the profile unless given) and timestamp as indexed columns for
+    the queries. add_sweeps() stores many sweeps in one transaction."""
+
+    def __init__(self, filename=":memory:"):
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        if filename != ":memory:":
+            # readers (e.g. an analysis) do not block the acquisition writing into the file
+            self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.executescript(SCHEMA)
+        self.__devices = {}
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    """ devices and runs """
+
+    def device(self, name, description=None):
+        """Returns the id of the device with the name; the device is added if it is not known yet."""
+        device_id = self.__devices.get(name)
+        if device_id is None:
+            with self.connection:
+                self.connection.execute("INSERT OR IGNORE INTO devices (name, description) VALUES (?, ?)",
+                                        (name, description))
+            device_id = self.connection.execute("SELECT id FROM devices WHERE name = ?", (name,)).fetchone()[0]
+            self.__devices[name] = device_id
+        return device_id
+
+    def devices(self):
+        """Returns the names of all devices."""
+        return [name for name, in self.connection.execute("SELECT name FROM devices ORDER BY name")]
+
+    def start_run(self, device, profile=None, notes=None, started=None):
+        """Adds a run of the device (name) with the SR830_Profile.MeasurementProfile and returns its id."""
+        settings = json.dumps(profile.settings) if profile is not None else None
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO runs (device_id, started, profile, settings, notes) VALUES (?, ?, ?, ?, ?)",
+                (self.device(device), time.time() if started is None else started,
+                 profile.name if profile is not None else None, settings, notes))
+        return cursor.lastrowid
+
+    def run_settings(self, run):
+        """Returns the settings of the profile of the run as dict (empty if the run has no profile)."""
+        row = self.connection.execute("SELECT settings FROM runs WHERE id = ?", (run,)).fetchone()
+        if row is None:
+            raise KeyError(run)
+        return json.loads(row[0]) if row[0] else {}
+
+    """ sweeps """
+
+    def _sweep_row(self, run, device_id, result, amplitude, timestamp):
+        return (run, device_id, time.time() if timestamp is None else timestamp, amplitude,
+                len(result.frequency)) + tuple(_to_blob(getattr(result, column)) for column in ARRAY_COLUMNS)
+
+    def _run_device(self, run):
+        row = self.connection.execute("SELECT device_id, settings FROM runs WHERE id = ?", (run,)).fetchone()
+        if row is None:
+            raise KeyError(run)
+        device_id, settings = row
+        return device_id, json.loads(settings).get("amplitude") if settings else None
+
+    def add_sweep(self, run, result, amplitude=None, timestamp=None):
+        """Stores an SR830_Sweep.SweepResult of the run and returns its id. The amplitude defaults to the one of the
+        profile of the run and the timestamp to now."""
+        return self.add_sweeps(run, [result], amplitude, None if timestamp is None else [timestamp])[0]
+
+    def add_sweeps(self, run, results, amplitude=None, timestamps=None):
+        """Stores many sweeps of the run in one transaction (executemany) and returns their ids."""
+        device_id, profile_amplitude = self._run_device(run)
+        if amplitude is None:
+            amplitude = profile_amplitude
+        if timestamps is None:
+            timestamps = [None] * len(results)
+
+        rows = [self._sweep_row(run, device_id, result, amplitude, timestamp)
+                for result, timestamp in zip(results, timestamps)]
+        columns = ("run_id", "device_id", "timestamp", "amplitude", "points") + ARRAY_COLUMNS
+
+        with self.connection:
+            self.connection.executemany("INSERT INTO sweeps (" + ", ".join(columns) + ") VALUES (" +
+                                        ", ".join("?" * len(columns)) + ")", rows)
+            # the transaction holds the write lock, so the rows got the last consecutive ids
+            last = self.connection.execute("SELECT COALESCE(MAX(id), 0) FROM sweeps").fetchone()[0]
+        return list(range(last - len(rows) + 1, last + 1))
+
+    def import_csv(self, filename, run, timestamp=None):
+        """Stores a csv file of SR830_Writer.SweepWriter (columns frequency, X, Y, R and phase) in the run. The
+        amplitude is taken from the metadata of the file and the timestamp defaults to the time the file was last
+        changed."""
+        metadata, columns, data = SR830_Writer.read_sweep(filename)
+        if columns is None or len(columns) < 5:
+            raise ValueError(filename + " is not a sweep file")
+        result = SR830_Sweep.SweepResult(*(data[:, i] for i in range(5)), np.zeros(len(data)),
+                                         np.zeros(len(data), dtype=bool))
+        return self.add_sweep(run, result, metadata.get("Ue / V"),
+                              os.path.getmtime(filename) if timestamp is None else timestamp)
+
+    def sweeps(self, device=None, amplitude=None, run=None, profile=None, since=None, until=None, load=True):
+        """Returns the StoredSweeps that match all given conditions, oldest first: the device (name), the amplitude in
+        V, the run (id), the name of the profile and the time range (unix time). Without load the results are None, so
+        that only the index columns are read."""
+
+        conditions = []
+        parameters = []
+        if device is not None:
+            conditions.append("devices.name = ?")
+            parameters.append(device)
+        if amplitude is not None:
+            conditions.append("sweeps.amplitude BETWEEN ? AND ?")
+            parameters += [amplitude * (1 - AMPLITUDE_TOLERANCE), amplitude * (1 + AMPLITUDE_TOLERANCE)]
+        if run is not None:
+            conditions.append("sweeps.run_id = ?")
+            parameters.append(run)
+        if profile is not None:
+            conditions.append("runs.profile = ?")
+            parameters.append(profile)
+        if since is not None:
+            conditions.append("sweeps.timestamp >= ?")
+            parameters.append(since)
+        if until is not None:
+            conditions.append("sweeps.timestamp < ?")
+            parameters.append(until)
+
+        columns = ["sweeps.id", "devices.name", "sweeps.run_id", "sweeps.timestamp", "runs.profile",
+                   "sweeps.amplitude"]
+        if load:
+            columns += ["sweeps." + column for column in ARRAY_COLUMNS]
+
+        query = "SELECT " + ", ".join(columns) + " FROM sweeps JOIN devices ON devices.id = sweeps.device_id " \
+                "JOIN runs ON runs.id = sweeps.run_id"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY sweeps.timestamp, sweeps.id"
+
+        stored = []
+        for row in self.connection.execute(query, parameters):
+            result = SR830_Sweep.SweepResult(*(_from_blob(blob) for blob in row[6:])) if load else None
+            stored.append(StoredSweep(*row[:6], result))
+        return stored
+
+    def count(self, device=None):
+        """Returns the number of sweeps (of the device)."""
+        if device is None:
+            return self.connection.execute("SELECT COUNT(*) FROM sweeps").fetchone()[0]
+        return self.connection.execute("SELECT COUNT(*) FROM sweeps JOIN devices ON devices.id = sweeps.device_id "
+                                       "WHERE devices.name = ?", (device,)).fetchone()[0]
@@ -0,0 +1,264 @@
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# result of fit(); parameters and standard_errors have the shape (devices, parameters) in the units given by the
+# PARAMETERS of the model, residual is the rms of the relative deviation between model and data for every device
+FitResult = namedtuple('FitResult', ['model', 'names', 'parameters', 'standard_errors', 'residual', 'converged',
+                                     'iterations'])
+
+########################################################################################################################
+# Equivalent circuits
+#
+# Every model works on all devices at once. The parameters are given as array of shape (devices, parameters) in the
+# internal representation (the logarithm of the parameters marked in LOGARITHMIC, so that they stay positive).
+# evaluate() returns the impedance of shape (devices, frequencies) and its derivative with respect to the internal
+# parameters of shape (devices, frequencies, parameters).
+########################################################################################################################
+
+
+class SeriesRC:
+    """Resistance R in series with the capacitance C: Z = R + 1/(i omega C)"""
+
+    NAME = "series RC"
+    PARAMETERS = ("R / Ohm", "C / F")
+    LOGARITHMIC = (True, True)
+
+    @staticmethod
+    def evaluate(omega, p):
+        r, c = np.exp(p[:, 0:1]), np.exp(p[:, 1:2])
+        capacitive = 1 / (1j * omega * c)
+        impedance = r + capacitive
+        jacobian = np.stack([np.broadcast_to(r, impedance.shape), -capacitive], axis=-1)
+        return impedance, jacobian
+
+    @staticmethod
+    def initial_guess(omega, impedance):
+        # the capacitance dominates at the lowest and the resistance at the highest frequency
+        c = -1 / (omega[0] * impedance[:, 0].imag)
+        r = impedance[:, -1].real
+        return _log_positive(np.stack([r, c], axis=-1))
+
+    @staticmethod
+    def constrain(p):
+        return p
+
+
+class ParallelRC:
+    """Resistance R parallel to the capacitance C: Y = 1/R + i omega C"""
+
+    NAME = "parallel RC"
+    PARAMETERS = ("R / Ohm", "C / F")
+    LOGARITHMIC = (True, True)
+
+    @staticmethod
+    def evaluate(omega, p):
+        r, c = np.exp(p[:, 0:1]), np.exp(p[:, 1:2])
+        impedance = 1 / (1 / r + 1j * omega * c)
+        square = impedance ** 2
+        jacobian = np.stack([square / r, -square * 1j * omega * c], axis=-1)
+        return impedance, jacobian
+
+    @staticmethod
+    def initial_guess(omega, impedance):
+        admittance = 1 / impedance
+        r = 1 / admittance[:, 0].real
+        c = admittance[:, -1].imag / omega[-1]
+        return _log_positive(np.stack([r, c], axis=-1))
+
+    @staticmethod
+    def constrain(p):
+        return p
+
+
+class SeriesRCStray:
+    """Resistance R in series with the capacitance C, both parallel to the stray capacitance Cs of the fixture:
+    Y = 1/(R + 1/(i omega C)) + i omega Cs"""
+
+    NAME = "series RC with stray capacitance"
+    PARAMETERS = ("R / Ohm", "C / F", "Cs / F")
+    LOGARITHMIC = (True, True, True)
+
+    @staticmethod
+    def evaluate(omega, p):
+        r, c, cs = np.exp(p[:, 0:1]), np.exp(p[:, 1:2]), np.exp(p[:, 2:3])
+        capacitive = 1 / (1j * omega * c)
+        branch = 1 / (r + capacitive)
+        impedance = 1 / (branch + 1j * omega * cs)
+
+        # dZ/dp = -Z^2 dY/dp
+        square = impedance ** 2
+        branch_square = branch ** 2
+        jacobian = np.stack([square * branch_square * r,
+                             -square * branch_square * capacitive,
+                             -square * 1j * omega * cs], axis=-1)
+        return impedance, jacobian
+
+    @staticmethod
+    def initial_guess(omega, impedance):
+        # at the lowest frequency both capacitances add up, at the highest the resistance separates them
+        admittance = 1 / impedance
+        total = admittance[:, 0].imag / omega[0]
+        cs = 0.1 * total
+        c = total - cs
+        r = (1 / (admittance[:, -1] - 1j * omega[-1] * cs)).real
+        return _log_positive(np.stack([r, c, cs], axis=-1))
+
+    @staticmethod
+    def constrain(p):
+        return p
+
+
+class ParallelRCPE:
+    """Resistance R parallel to a constant phase element: Y = 1/R + Q (i omega)^n with 0 < n <= 1"""
+
+    NAME = "parallel R-CPE"
+    PARAMETERS = ("R / Ohm", "Q / S s^n", "n")
+    LOGARITHMIC = (True, True, False)
+
+    @staticmethod
+    def evaluate(omega, p):
+        r, q, n = np.exp(p[:, 0:1]), np.exp(p[:, 1:2]), p[:, 2:3]
+        log_i_omega = np.log(omega) + 0.5j * np.pi
+        element = q * np.exp(n * log_i_omega)
+        impedance = 1 / (1 / r + element)
+        square = impedance ** 2
+        jacobian = np.stack([square / r, -square * element, -square * element * log_i_omega], axis=-1)
+        return impedance, jacobian
+
+    @staticmethod
+    def initial_guess(omega, impedance):
+        admittance = 1 / impedance
+        middle = len(omega) // 2
+        r = 1 / admittance[:, 0].real
+        q = admittance[:, middle].imag / omega[middle]
+        p = _log_positive(np.stack([r, q, np.ones_like(r)], axis=-1))
+        p[:, 2] = 0.9
+        return p
+
+    @staticmethod
+    def constrain(p):
+        p[:, 2] = np.clip(p[:, 2], 1e-3, 1)
+        return p
+
+
+MODELS = {"series_rc": SeriesRC, "parallel_rc": ParallelRC, "series_rc_stray": SeriesRCStray,
+          "parallel_r_cpe": ParallelRCPE}
+
+
+def _log_positive(values):
+    # guesses from noisy data may be negative or undefined; they are replaced by a small positive value
+    values = np.where(np.isfinite(values) & (values > 0), values, 1e-15)
+    return np.log(np.abs(values))
+
+
+########################################################################################################################
+# Fitting
+########################################################################################################################
+
+
+def fit(model, frequency, impedance, max_iterations=200, tolerance=1e-10):
+    """Fits the model (a class above or its key in MODELS) to the complex impedance of one device (shape (frequencies,))
+    or of many devices (shape (devices, frequencies)) that were measured at the same frequencies.
+
+    All devices are fitted simultaneously with a Levenberg-Marquardt iteration on the relative deviation
+    (Z_model - Z) / |Z| using the analytic derivatives of the model."""
+
+    if isinstance(model, str):
+        model = MODELS[model]
+
+    omega = 2 * np.pi * np.asarray(frequency, dtype=float)
+    impedance = np.atleast_2d(np.asarray(impedance, dtype=complex))
+    weight = 1 / np.abs(impedance)
+    devices = impedance.shape[0]
+
+    def residuals(p):
+        modelled, jacobian = model.evaluate(omega, p)
+        deviation = (modelled - impedance) * weight
+        residual = np.concatenate([deviation.real, deviation.imag], axis=1)
+        weighted = jacobian * weight[:, :, np.newaxis]
+        return residual, np.concatenate([weighted.real, weighted.imag], axis=1)
+
+    p = model.constrain(model.initial_guess(omega, impedance))
+    residual, jacobian = residuals(p)
+    cost = np.sum(residual ** 2, axis=1)
+    damping = np.full(devices, 1e-3)
+    converged = np.zeros(devices, dtype=bool)
+    iterations = np.zeros(devices, dtype=int)
+
+    for _ in range(max_iterations):
+        active = ~converged
+        if not np.any(active):
+            break
+
+        # damped normal equations of all devices that are still iterating
+        jt = np.swapaxes(jacobian[active], 1, 2)
+        normal = jt @ jacobian[active]
+        gradient = jt @ residual[active][:, :, np.newaxis]
+        diagonal = np.einsum('nii->ni', normal)
+        damped = normal + (damping[active, np.newaxis] * diagonal + 1e-30)[:, :, np.newaxis] * np.eye(p.shape[1])
+        step = -np.linalg.solve(damped, gradient)[:, :, 0]
+
+        trial = p.copy()
+        trial[active] = model.constrain(p[active] + step)
+        trial_residual, trial_jacobian = residuals(trial)
+        trial_cost = np.sum(trial_residual ** 2, axis=1)
+
+        # accept the step where it reduced the cost and adapt the damping
+        accepted = active & (trial_cost < cost)
+        rejected = active & ~accepted
+        change = np.where(accepted, (cost - trial_cost) / np.maximum(cost, 1e-300), 0)
+
+        p[accepted] = trial[accepted]
+        residual[accepted] = trial_residual[accepted]
+        jacobian[accepted] = trial_jacobian[accepted]
+        cost[accepted] = trial_cost[accepted]
+        damping[accepted] = np.maximum(damping[accepted] / 10, 1e-12)
+        damping[rejected] *= 10
+        iterations[active] += 1
+
+        converged |= accepted & (change < tolerance)
+        converged |= rejected & (damping > 1e12)
+
+    # standard errors from the covariance of the parameters at the solution
+    degrees_of_freedom = max(residual.shape[1] - p.shape[1], 1)
+    normal = np.swapaxes(jacobian, 1, 2) @ jacobian
+    with np.errstate(invalid='ignore'):
+        covariance = np.linalg.pinv(normal) * (cost / degrees_of_freedom)[:, np.newaxis, np.newaxis]
+        internal_errors = np.sqrt(np.einsum('nii->ni', covariance))
+
+    # the errors of logarithmic parameters are relative errors
+    logarithmic = np.array(model.LOGARITHMIC)
+    parameters = np.where(logarithmic, np.exp(p), p)
+    standard_errors = np.where(logarithmic, internal_errors * parameters, internal_errors)
+
+    return FitResult(model.NAME, model.PARAMETERS, parameters, standard_errors,
+                     np.sqrt(cost / residual.shape[1]), converged, iterations)
+
+
+def _fit_chunk(arguments):
+    model, frequency, impedance, options = arguments
+    return fit(model, frequency, impedance, **options)
+
+
+def fit_many(model, frequency, impedance, processes=None, chunk_size=1000, **options):
+    """Like fit(), but splits the devices into chunks that are fitted in parallel by a pool of processes. The further
+    keyword arguments are passed on to fit()."""
+
+    if isinstance(model, str):
+        model = MODELS[model]
+
+    impedance = np.atleast_2d(np.asarray(impedance, dtype=complex))
+    chunks = [(model, frequency, impedance[start:start + chunk_size], options)
+              for start in range(0, impedance.shape[0], chunk_size)]
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        results = list(pool.map(_fit_chunk, chunks))
+
+    return FitResult(model.NAME, model.PARAMETERS,
+                     np.concatenate([r.parameters for r in results]),
+                     np.concatenate([r.standard_errors for r in results]),
+                     np.concatenate([r.residual for r in results]),
+                     np.concatenate([r.converged for r in results]),
+                     np.concatenate([r.iterations for r in results]))
@@ -1,6 +1,79 @@
-import pyvisa
+import bisect
+import time
+from contextlib import contextmanager
 
-# TODO: query error register to see if a fault condition exists (i.e. input overload, ...)
+import SR830_Trace
+
+
+class SR830Status:
+    """Content of the LIA status register (LIAS?) and the error status register (ERRS?) of one reading. The bits of
+    both registers are latched by the device, so they describe everything since the registers were read before."""
+
+    # names of the bits of the LIA status register and the error status register (unused bits are None)
+    LIA_STATUS_BITS = ("input overload", "filter overload", "output overload", "unlock", "range change",
+                       "time constant change", "trigger", None)
+    ERROR_STATUS_BITS = (None, "backup error", "RAM error", None, "ROM error", "GPIB error", "DSP error", "math error")
+    # the LIA status bits that make a reading unusable
+    LIA_FAULT_MASK = 0b1111
+
+    def __init__(self, lia, errors):
+        self.lia = lia
+        self.errors = errors
+
+    @property
+    def input_overload(self):
+        return bool(self.lia & 1)
+
+    @property
+    def filter_overload(self):
+        return bool(self.lia & 2)
+
+    @property
+    def output_overload(self):
+        return bool(self.lia & 4)
+
+    @property
+    def unlocked(self):
+        return bool(self.lia & 8)
+
+    @property
+    def fault(self):
+        """True if the reading is unusable because of an overload, an unlocked reference or a device error."""
+        return bool(self.lia & self.LIA_FAULT_MASK) or bool(self.errors)
+
+    @property
+    def events(self):
+        """Names of all bits that are set."""
+        return ([name for bit, name in enumerate(self.LIA_STATUS_BITS) if name and self.lia & (1 << bit)] +
+                [name for bit, name in enumerate(self.ERROR_STATUS_BITS) if name and self.errors & (1 << bit)])
+
+    def __repr__(self):
+        return "SR830Status(" + ", ".join(self.events) + ")"
+
+
+class SR830StatusError(Exception):
+    """Raised by a reading that comes with a fault in the status registers if the status check was enabled with
+    raise_on_fault. The status is available as attribute."""
+
+    def __init__(self, status):
+        super().__init__("SR830 reported " + ", ".join(status.events))
+        self.status = status
+
+
+class BatchReply:
+    """Reply to a query that was made inside SR830.batch(). The value is available after the batch was sent."""
+
+    def __init__(self, convert=None):
+        self.value = None
+        self.received = False
+        self.__convert = convert
+
+    def _receive(self, reply):
+        # convert the raw reply the same way the query method would have done it without the batch
+        if self.__convert is not None:
+            reply = self.__convert(reply)
+        self.value = reply
+        self.received = True
 
 
 class SR830:
@@ -29,6 +102,11 @@ class SR830:
     UPPER_FREQ_LIMIT = 102000       # Limit in Hz based on the specifications of the SR830
     LOWER_FREQ_LIMIT = 0.001
 
+    # detection harmonic; the detected frequency (reference frequency times harmonic) must not exceed UPPER_FREQ_LIMIT
+    OPERATION_SET_HARMONIC = "HARM"
+    LOWER_HARMONIC_LIMIT = 1
+    UPPER_HARMONIC_LIMIT = 19999
+
     OPERATION_SINE_OUTPUT_LEVEL = "SLVL"
     LOWER_SINE_OUTPUT_LEVEL = 0.004     # Limit in Volts based on the specifications of the SR830
     UPPER_SINE_OUTPUT_LEVEL = 5
@@ -52,6 +130,14 @@ class SR830:
     SENSITIVITY_RANGES = (2e-9, 5e-9, 10e-9, 20e-9, 50e-9, 100e-9, 200e-9, 500e-9, 1000e-9,
                           2e-6, 5e-6, 10e-6, 20e-6, 50e-6, 100e-6, 200e-6, 500e-6, 1000e-6,
                           2e-3, 5e-3, 10e-3, 20e-3, 50e-3, 100e-3, 200e-3, 500e-3, 1000e-3)
+    # factor between the sensitivity in volts and the output for the input modes A, A-B, I (1 MOhm) and I (100 MOhm).
+    # The current inputs show the current in A
+    INPUT_SCALES = (1, 1, 1e-6, 1e-8)
+
+    # limits of the auto range: the range is changed if R is above UPPER_RANGE_LIMIT or below LOWER_RANGE_LIMIT
+    # times the full scale. The sensitivity steps by at most a factor 2.5, so a range within these limits always exists
+    UPPER_RANGE_LIMIT = 0.9
+    LOWER_RANGE_LIMIT = 0.2
 
     OPERATION_SET_RESERVE_MODE_HIGH_RESERVE = "RMOD 0"
     OPERATION_SET_RESERVE_MODE_NORMAL = "RMOD 1"
@@ -91,6 +177,32 @@ class SR830:
     # snap commands read data synchronously (important if time constant is very short)
     READ_SNAP_X_Y_R_PHI = "SNAP? 1, 2, 3, 4"
 
+    # status registers (reading them clears them)
+    READ_LIA_STATUS = "LIAS?"
+    READ_ERROR_STATUS = "ERRS?"
+
+    # data storage commands (internal buffer of the two display channels)
+    OPERATION_SET_SAMPLE_RATE = "SRAT"
+    # Available sample rates in Hz (index 14 would be the external trigger which is not supported here)
+    SAMPLE_RATES = (62.5e-3, 125e-3, 250e-3, 500e-3, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+    OPERATION_SET_BUFFER_MODE_ONE_SHOT = "SEND 0"
+    OPERATION_SET_BUFFER_MODE_LOOP = "SEND 1"
+    OPERATION_START_BUFFER = "STRT"
+    OPERATION_PAUSE_BUFFER = "PAUS"
+    OPERATION_RESET_BUFFER = "REST"
+    READ_BUFFER_LENGTH = "SPTS?"
+    READ_BUFFER_BINARY_IEEE = "TRCB?"
+    READ_BUFFER_BINARY_LIA = "TRCL?"
+    BUFFER_SIZE = 16383             # maximum number of points stored per channel
+    BUFFER_BYTES_PER_POINT = 4      # both binary formats transfer 4 bytes per point
+
+    # settings that are kept in the settings cache (commands that take a channel as first parameter include it)
+    CACHED_SETTINGS = ("FMOD", "FREQ", "HARM", "SLVL", "ISRC", "IGND", "ICPL", "ILIN", "SENS", "RMOD", "OFLT", "OFSL",
+                       "DDEF 1", "DDEF 2")
+    INDEXED_SETTINGS = ("DDEF", "AUXV")
+    QUERY_SEPARATOR = ";"
+    MAX_COMMAND_LINE_LENGTH = 255   # the input queue of the SR830 holds 256 characters
+
     """
     ####################################################################################################################
     General functions to communicate with the device
@@ -103,8 +215,25 @@ class SR830:
         self.__debug = False
         self.instrument = None
 
-        # if we have no resource manager then get one
+        # SR830_Trace.CommandTrace that records the timing of all transmissions; None while tracing is disabled
+        self.trace = None
+
+        # shadow copy of the device settings; None while the settings cache is disabled
+        self.__settings = None
+
+        # commands collected by batch(); None while no batch is active
+        self.__batch = None
+
+        # status check of the readings (see enable_status_check)
+        self.__status_check = False
+        self.__raise_on_fault = False
+        self.__status_callbacks = []
+        self.last_status = None
+
+        # if we have no resource manager then get one (pyvisa is only imported here, because it takes long to import
+        # and is not needed with a shared or simulated resource manager)
         if rm is None:
+            import pyvisa
             self.rm = pyvisa.ResourceManager()
         else:
             self.rm = rm
@@ -117,6 +246,127 @@ class SR830:
         """Disables the debug output. Nothing will be printed to the console that you haven't specified yourself."""
         self.__debug = False
 
+    def enable_trace(self, trace=None):
+        """Records the time of every transmission (split into writing and waiting for the reply) and of the sleeps of
+        auto_range and the sweeps in an SR830_Trace.CommandTrace, which is returned. A trace can be shared by several
+        devices."""
+        self.trace = trace if trace is not None else SR830_Trace.CommandTrace()
+        return self.trace
+
+    def disable_trace(self):
+        self.trace = None
+
+    def _sleep(self, seconds):
+        # sleeps are recorded while the trace is enabled
+        if self.trace is None:
+            time.sleep(seconds)
+        else:
+            self.trace.sleep(seconds)
+
+    def enable_settings_cache(self, refresh=True):
+        """Enables the settings cache. All cached settings are read from the device in one transmission and every
+        following set command is only sent if it changes the setting. If the settings are changed on the front panel
+        the cache has to be invalidated or refreshed. Without refresh the cache starts empty and every setting is read
+        from the device when it is needed for the first time."""
+        self.__settings = {}
+        if refresh:
+            self.refresh_settings()
+
+    def enable_status_check(self, raise_on_fault=False):
+        """Reads the status registers together with every reading (read_x, ..., read_snap) in the same transmission.
+        The status is stored in last_status and passed to all status callbacks. With raise_on_fault a reading that
+        comes with an overload, unlock or device error raises an SR830StatusError."""
+        self.__status_check = True
+        self.__raise_on_fault = raise_on_fault
+
+    def disable_status_check(self):
+        self.__status_check = False
+
+    def add_status_callback(self, callback):
+        """The callback is called with the SR830Status of every status read."""
+        self.__status_callbacks.append(callback)
+
+    def remove_status_callback(self, callback):
+        self.__status_callbacks.remove(callback)
+
+    def disable_settings_cache(self):
+        """Disables the settings cache. Every set command will be sent to the device again."""
+        self.__settings = None
+
+    def refresh_settings(self):
+        """Reads all cached settings from the device in one transmission."""
+        with self.batch():
+            replies = [self._query(self._setting_query(key), self._parse_setting) for key in self.CACHED_SETTINGS]
+        settings = {key: reply.value for key, reply in zip(self.CACHED_SETTINGS, replies)}
+
+        if self.__settings is not None:
+            self.__settings = settings
+        return settings
+
+    def invalidate_settings(self, *keys):
+        """Forgets the cached value of the given settings (e.g. "SENS", "DDEF 1") or of all settings if none is
+        given. The next set command of these settings is sent to the device in any case."""
+        if self.__settings is None:
+            return
+        if keys:
+            for key in keys:
+                self.__settings.pop(key, None)
+        else:
+            self.__settings.clear()
+
+    @contextmanager
+    def batch(self):
+        """Collects all commands and queries inside the with block and sends them together in as few lines as
+        possible when the block is left. Queries made inside the block return a BatchReply whose value is available
+        after the block:
+
+            with sr830.batch():
+                sr830.set_time_constant(1)
+                sr830.set_sensitivity(.2)
+                snap = sr830.read_snap()
+            x, y, r, phi = snap.value
+
+        If batches are nested, everything collected so far is sent at the end of the inner block."""
+
+        outer = self.__batch is not None
+        if not outer:
+            self.__batch = []
+
+        try:
+            yield self
+        except BaseException:
+            # nothing of the failed block is sent; the cache may contain settings that were never written
+            if not outer:
+                self.__batch = None
+            self.invalidate_settings()
+            raise
+
+        commands = self.__batch
+        if outer:
+            self.__batch = []
+        else:
+            self.__batch = None
+
+        try:
+            self._send_batch(commands)
+        except BaseException:
+            # the settings were cached when they were collected, but may not have reached the device
+            keys = self._batch_settings(commands)
+            if keys:
+                self.invalidate_settings(*keys)
+            raise
+
+    def _batch_settings(self, commands):
+        # keys of the cached settings that the commands of a batch write
+        keys = []
+        for msg, reply in commands:
+            if reply is None and " " in msg:
+                try:
+                    keys.append(self._split_setting(msg)[0])
+                except ValueError:
+                    pass
+        return keys
+
     def connect(self, visa_resource_name):
 
         # Connect to the device
@@ -141,24 +391,192 @@ class SR830:
         return self.instrument
 
     def _write(self, msg):
+        # inside a batch the command is only collected
+        if self.__batch is not None:
+            self.__batch.append((msg, None))
+            return
+
         # if the debug output is enabled we dump the msg to the console
         if self.__debug:
             print('Write cmd: ' + str(msg))
 
         # send the command to the instrument
-        self.instrument.write(msg)
+        if self.trace is None:
+            self.instrument.write(msg)
+        else:
+            start = self.trace.clock()
+            self.instrument.write(msg)
+            written = self.trace.clock()
+            self.trace.record((msg,), start, written, written)
+
+    def _query(self, msg, convert=None):
+        # inside a batch the query is only collected and the reply is delivered when the batch was sent
+        if self.__batch is not None:
+            reply = BatchReply(convert)
+            self.__batch.append((msg, reply))
+            return reply
 
-    def _query(self, msg):
         # if the debug output is enabled we dump the msg to the console
         if self.__debug:
             print('Query cmd: ' + str(msg))
 
         # send the command to the instrument
-        return self.instrument.query(msg)
+        if self.trace is None:
+            response = self.instrument.query(msg)
+        else:
+            # write and read separately to tell the time on the wire from the time the device needs to reply
+            start = self.trace.clock()
+            self.instrument.write(msg)
+            written = self.trace.clock()
+            response = self.instrument.read()
+            self.trace.record((msg,), start, written, self.trace.clock(), len(response))
+
+        if convert is not None:
+            return convert(response)
+        return response
 
     def _read(self):
         return self.instrument.read()
 
+    def _query_multiple(self, queries):
+        # several queries are sent in one line separated by a semicolon; the device answers each of them
+        return self._transmit(queries, len(queries))
+
+    def _transmit(self, commands, number_of_queries):
+        # send several commands in one line and read the replies of the queries among them
+        msg = self.QUERY_SEPARATOR.join(commands)
+        if self.__debug:
+            print('Batch cmd: ' + str(msg))
+
+        if self.trace is not None:
+            start = self.trace.clock()
+        self.instrument.write(msg)
+        if self.trace is not None:
+            written = self.trace.clock()
+
+        # depending on the interface the replies come in separate lines or in one line, so we read until all are there
+        replies = []
+        while len(replies) < number_of_queries:
+            replies.extend(self._read().split(self.QUERY_SEPARATOR))
+
+        if self.trace is not None:
+            self.trace.record(commands, start, written, self.trace.clock(), sum(len(reply) for reply in replies))
+        return replies
+
+    def _send_batch(self, commands):
+        # split the collected commands into lines that fit into the input queue of the device and send them
+        line = []
+        length = 0
+        for msg, reply in commands:
+            if line and length + len(self.QUERY_SEPARATOR) + len(msg) > self.MAX_COMMAND_LINE_LENGTH:
+                self._send_batch_line(line)
+                line = []
+                length = 0
+            line.append((msg, reply))
+            length += len(msg) + (len(self.QUERY_SEPARATOR) if length else 0)
+
+        if line:
+            self._send_batch_line(line)
+
+    def _send_batch_line(self, line):
+        pending = [reply for msg, reply in line if reply is not None]
+        replies = self._transmit([msg for msg, reply in line], len(pending))
+        for reply, response in zip(pending, replies):
+            reply._receive(response)
+
+    def _write_setting(self, msg):
+        # write commands that change a cached setting are only sent if the setting changes
+        if self.__settings is None:
+            self._write(msg)
+            return
+
+        key, value = self._split_setting(msg)
+        if key in self.__settings and self.__settings[key] == value:
+            if self.__debug:
+                print('Skipped cmd: ' + str(msg))
+            return
+
+        self._write(msg)
+        self.__settings[key] = value
+
+    def _read_setting(self, key, convert=None):
+        # read a setting from the cache if possible, otherwise from the device
+        if self.__settings is not None and key in self.__settings:
+            value = self.__settings[key]
+            if convert is not None:
+                value = convert(value)
+
+            # inside a batch every query returns a reply object, even if nothing has to be sent
+            if self.__batch is not None:
+                reply = BatchReply()
+                reply._receive(value)
+                return reply
+            return value
+
+        def receive(response):
+            value = self._parse_setting(response)
+            if self.__settings is not None:
+                self.__settings[key] = value
+            if convert is not None:
+                value = convert(value)
+            return value
+
+        return self._query(self._setting_query(key), receive)
+
+    def _split_setting(self, msg):
+        # split a command (e.g. "SENS 24" or "DDEF 1, 0, 0") into the setting ("SENS" / "DDEF 1") and its value
+        mnemonic, parameters = msg.split(" ", 1)
+        if mnemonic in self.INDEXED_SETTINGS:
+            index, parameters = parameters.split(",", 1)
+            mnemonic = mnemonic + " " + index.strip()
+        return mnemonic, self._parse_setting(parameters)
+
+    @staticmethod
+    def _setting_query(key):
+        # "SENS" -> "SENS?" and "DDEF 1" -> "DDEF? 1"
+        parts = key.split(" ", 1)
+        parts[0] = parts[0] + "?"
+        return " ".join(parts)
+
+    @staticmethod
+    def _parse_setting(value):
+        # settings are compared as numbers, so that e.g. "1000" and "1000.0" are the same setting
+        values = tuple(float(v) for v in str(value).split(","))
+        if len(values) == 1:
+            return values[0]
+        return values
+
+    def _query_binary(self, msg, number_of_bytes):
+        # the length of a binary reply can't be told apart from other replies in one line
+        if self.__batch is not None:
+            raise RuntimeError("Binary transfers can not be part of a batch")
+
+        # if the debug output is enabled we dump the msg to the console
+        if self.__debug:
+            print('Binary query cmd: ' + str(msg) + ' (' + str(number_of_bytes) + ' bytes)')
+
+        # binary transfers are not terminated, so the exact number of bytes has to be read. On a serial link a
+        # full buffer takes a while to transmit, therefore the timeout is extended by the expected transfer time
+        timeout = self.instrument.timeout
+        baud_rate = getattr(self.instrument, 'baud_rate', None)
+        if timeout is not None and baud_rate:
+            # 10 bits per byte (start bit, 8 data bits, stop bit)
+            self.instrument.timeout = timeout + 1000 * 10 * number_of_bytes / baud_rate
+
+        try:
+            if self.trace is None:
+                self.instrument.write(msg)
+                return self.instrument.read_bytes(number_of_bytes)
+
+            start = self.trace.clock()
+            self.instrument.write(msg)
+            written = self.trace.clock()
+            data = self.instrument.read_bytes(number_of_bytes)
+            self.trace.record((msg,), start, written, self.trace.clock(), len(data))
+            return data
+        finally:
+            self.instrument.timeout = timeout
+
     def disconnect(self):
         self.instrument.close()
 
@@ -169,6 +587,9 @@ class SR830:
         self._write(self.OPERATION_RESET)
         self._write(self.OPERATION_CLEAR)
 
+        # the reset changed the settings of the device
+        self.invalidate_settings()
+
     """
     ####################################################################################################################
     Instrument specific functions
@@ -178,58 +599,87 @@ class SR830:
     """ Oscillator / reference section """
 
     def use_external_reference(self):
-        self._write(self.OPERATION_SET_TO_EXTERNAL_REFERENCE)
+        self._write_setting(self.OPERATION_SET_TO_EXTERNAL_REFERENCE)
 
     def use_internal_reference(self):
-        self._write(self.OPERATION_SET_TO_INTERNAL_REFERENCE)
+        self._write_setting(self.OPERATION_SET_TO_INTERNAL_REFERENCE)
 
     def set_reference_frequency(self, frequency_in_hz):
         if self.LOWER_FREQ_LIMIT <= frequency_in_hz <= self.UPPER_FREQ_LIMIT:
             msg = self.OPERATION_SET_INTERNAL_REFERENCE_FREQUENCY + " " + str(frequency_in_hz)
-            self._write(msg)
+            self._write_setting(msg)
         else:
             raise ValueError("Frequency must be within " + str(self.LOWER_FREQ_LIMIT) + " Hz to "
                              + str(self.UPPER_FREQ_LIMIT) + " Hz")
 
+    def read_reference_frequency(self):
+        """Returns the reference frequency in Hz."""
+        return self._read_setting(self.OPERATION_SET_INTERNAL_REFERENCE_FREQUENCY, float)
+
+    def set_harmonic(self, harmonic):
+        """Sets the harmonic of the reference frequency that is detected. The SR830 limits the reference frequency to
+        UPPER_FREQ_LIMIT divided by the harmonic, so the harmonic has to be set back before a higher frequency is
+        set. Above the first harmonic the cached frequency and harmonic are dropped, since the SR830 may have limited
+        one of them."""
+        if int(harmonic) == harmonic and self.LOWER_HARMONIC_LIMIT <= harmonic <= self.UPPER_HARMONIC_LIMIT:
+            self._write_setting(self.OPERATION_SET_HARMONIC + " " + str(int(harmonic)))
+            if harmonic > 1:
+                self.invalidate_settings(self.OPERATION_SET_INTERNAL_REFERENCE_FREQUENCY, self.OPERATION_SET_HARMONIC)
+        else:
+            raise ValueError("Harmonic must be an integer within " + str(self.LOWER_HARMONIC_LIMIT) + " to "
+                             + str(self.UPPER_HARMONIC_LIMIT))
+
+    def read_harmonic(self):
+        """Returns the detection harmonic."""
+        return self._read_setting(self.OPERATION_SET_HARMONIC, int)
+
     def set_sine_output_level(self, voltage):
         if self.LOWER_SINE_OUTPUT_LEVEL <= voltage <= self.UPPER_SINE_OUTPUT_LEVEL:
             msg = self.OPERATION_SINE_OUTPUT_LEVEL + " " + str(voltage)
-            self._write(msg)
+            self._write_setting(msg)
         else:
             raise ValueError("Sine output voltage must be within " + str(self.LOWER_SINE_OUTPUT_LEVEL) + " V to "
                              + str(self.UPPER_SINE_OUTPUT_LEVEL) + " V")
 
+    def read_sine_output_level(self):
+        """Returns the amplitude of the sine output in volts."""
+        return self._read_setting(self.OPERATION_SINE_OUTPUT_LEVEL)
+
     """ Input Mode section """
 
     def set_input_mode_A(self):
-        self._write(self.OPERATION_SET_INPUT_TO_A)
+        self._write_setting(self.OPERATION_SET_INPUT_TO_A)
         
     def set_input_mode_I_100M(self):
-        self._write(self.OPERATION_SET_INPUT_TO_I_100M)
+        self._write_setting(self.OPERATION_SET_INPUT_TO_I_100M)
         
     def set_input_mode_I_1M(self):
-        self._write(self.OPERATION_SET_INPUT_TO_I_1M)
+        self._write_setting(self.OPERATION_SET_INPUT_TO_I_1M)
 
     def set_input_mode_A_minus_B(self):
-        self._write(self.OPERATION_SET_INPUT_TO_A_MINUS_B)
+        self._write_setting(self.OPERATION_SET_INPUT_TO_A_MINUS_B)
 
     def set_input_shield_to_floating(self):
-        self._write(self.OPERATION_SET_INPUT_SHIELD_TO_FLOATING)
+        self._write_setting(self.OPERATION_SET_INPUT_SHIELD_TO_FLOATING)
 
     def set_input_shield_to_ground(self):
-        self._write(self.OPERATION_SET_INPUT_SHIELD_TO_GROUND)
+        self._write_setting(self.OPERATION_SET_INPUT_SHIELD_TO_GROUND)
 
     def set_input_coupling_ac(self):
-        self._write(self.OPERATION_SET_INPUT_COUPLING_AC)
+        self._write_setting(self.OPERATION_SET_INPUT_COUPLING_AC)
 
     def set_input_coupling_dc(self):
-        self._write(self.OPERATION_SET_INPUT_COUPLING_DC)
+        self._write_setting(self.OPERATION_SET_INPUT_COUPLING_DC)
 
     def enable_line_filters(self):
-        self._write(self.OPERATION_ENABLE_LINE_FILTER)
+        self._write_setting(self.OPERATION_ENABLE_LINE_FILTER)
 
     def disable_line_filters(self):
-        self._write(self.OPERATION_DISABLE_LINE_FILTER)
+        self._write_setting(self.OPERATION_DISABLE_LINE_FILTER)
+
+    def read_input_mode(self):
+        """Returns the input mode as index (0: A, 1: A-B, 2: I (1 MOhm), 3: I (100 MOhm))."""
+        return self._read_setting("ISRC", int)
 
     """ sensitivity / time constant section """
 
@@ -244,7 +694,7 @@ class SR830:
 
         # construct the command and sent it to the device
         cmd = self.OPERATION_SET_SENSITIVITY + " " + str(range_index)
-        self._write(cmd)
+        self._write_setting(cmd)
 
     def set_time_constant(self, time_in_seconds):
 
@@ -257,7 +707,7 @@ class SR830:
 
         # construct the command and sent it to the device
         cmd = self.OPERATION_SET_TIME_CONSTANT + " " + str(range_index)
-        self._write(cmd)
+        self._write_setting(cmd)
 
     def set_filter_slope(self, filter_in_db):
 
@@ -270,43 +720,108 @@ class SR830:
 
         # construct the command and sent it to the device
         cmd = self.OPERATION_LOW_PASS_FILTER_SLOPE + " " + str(range_index)
-        self._write(cmd)
+        self._write_setting(cmd)
+
+    def read_sensitivity(self):
+        """Returns the sensitivity that is currently used by the device in volts."""
+        return self._read_setting(self.OPERATION_SET_SENSITIVITY, lambda index: self.SENSITIVITY_RANGES[int(index)])
+
+    def auto_range(self, max_steps=6, wait=None):
+        """Fast replacement for auto_gain: the sensitivity is adjusted on the host based on R from read_snap. The range
+        is only changed if R is outside of LOWER_RANGE_LIMIT to UPPER_RANGE_LIMIT times the full scale (hysteresis)
+        and then set directly to the suitable range. If the output is overloaded, the real value is unknown and the
+        range is searched by bisection between the current and the largest range. After each change it waits for
+        wait seconds (by default one time constant) and reads again, at most max_steps times (5 steps are enough to
+        bisect all ranges). Returns the last reading [x, y, r, phi]."""
+
+        steps = self.auto_range_steps(max_steps, wait)
+        try:
+            while True:
+                self._sleep(next(steps))
+        except StopIteration as finished:
+            return finished.value
+
+    def auto_range_steps(self, max_steps=6, wait=None):
+        """Generator version of auto_range that yields the times to wait instead of sleeping (see SR830_Sweep)."""
+
+        if wait is None:
+            wait = self.read_time_constant()
+        scale = self.INPUT_SCALES[self.read_input_mode()]
+        index = int(self._read_setting(self.OPERATION_SET_SENSITIVITY))
+        largest = len(self.SENSITIVITY_RANGES) - 1
+
+        snap = self.read_snap()
+        for _ in range(max_steps):
+
+            # compare R with the current range in volts
+            value = snap[2] / scale
+            full_scale = self.SENSITIVITY_RANGES[index]
+            if self.LOWER_RANGE_LIMIT * full_scale <= value <= self.UPPER_RANGE_LIMIT * full_scale:
+                break
+
+            if value >= full_scale:
+                # the output is clipped, so the real value is somewhere above; bisect the remaining ranges
+                target = (index + 1 + largest + 1) // 2
+            else:
+                # smallest range that shows the value below the upper limit
+                target = bisect.bisect_left(self.SENSITIVITY_RANGES, value / self.UPPER_RANGE_LIMIT)
+            target = min(target, largest)
+            if target == index:
+                break
+
+            index = target
+            self._write_setting(self.OPERATION_SET_SENSITIVITY + " " + str(index))
+            yield wait
+            snap = self.read_snap()
+
+        return snap
+
+    def read_time_constant(self):
+        """Returns the time constant that is currently used by the device in seconds."""
+        return self._read_setting(self.OPERATION_SET_TIME_CONSTANT, lambda index: self.TIME_CONSTANTS[int(index)])
+
+    def read_filter_slope(self):
+        """Returns the low pass filter slope that is currently used by the device in dB/oct."""
+        return self._read_setting(self.OPERATION_LOW_PASS_FILTER_SLOPE, lambda index: self.FILTER_SLOPES[int(index)])
 
     """ reserve mode section """
 
     def set_reserve_high_reserve(self):
-        self._write(self.OPERATION_SET_RESERVE_MODE_HIGH_RESERVE)
+        self._write_setting(self.OPERATION_SET_RESERVE_MODE_HIGH_RESERVE)
 
     def set_reserve_normal(self):
-        self._write(self.OPERATION_SET_RESERVE_MODE_NORMAL)
+        self._write_setting(self.OPERATION_SET_RESERVE_MODE_NORMAL)
 
     def set_reserve_low_noise(self):
-        self._write(self.OPERATION_SET_RESERVE_MODE_LOW_NOISE)
+        self._write_setting(self.OPERATION_SET_RESERVE_MODE_LOW_NOISE)
 
     """ display control section (what will be shown on the device display) """
 
     def display_ch1_x(self):
-        self._write(self.OPERATION_SET_DISPLAY_CH1_TO_X)
+        self._write_setting(self.OPERATION_SET_DISPLAY_CH1_TO_X)
 
     def display_ch1_r(self):
-        self._write(self.OPERATION_SET_DISPLAY_CH1_TO_R)
+        self._write_setting(self.OPERATION_SET_DISPLAY_CH1_TO_R)
 
     def display_ch2_y(self):
-        self._write(self.OPERATION_SET_DISPLAY_CH2_TO_Y)
+        self._write_setting(self.OPERATION_SET_DISPLAY_CH2_TO_Y)
 
     def display_ch2_phi(self):
-        self._write(self.OPERATION_SET_DISPLAY_CH2_TO_PHI)
+        self._write_setting(self.OPERATION_SET_DISPLAY_CH2_TO_PHI)
 
     """ auto commands section """
 
     def auto_gain(self):
         self._write(self.OPERATION_AUTO_GAIN)
+        self.invalidate_settings("SENS")
 
     def auto_reserve(self):
         self._write(self.OPERATION_AUTO_RESERVE)
+        self.invalidate_settings("RMOD")
 
     def auto_phase(self):
         self._write(self.OPERATION_AUTO_PHASE)
+        self.invalidate_settings("PHAS")
 
     def auto_offset_x(self):
         self._write(self.OPERATION_AUTO_OFFSET_X)
@@ -320,21 +835,60 @@ class SR830:
     """ data transfer section section (to read measurement values from the device) """
 
     def read_x(self):
-        return float(self._query(self.READ_X))
+        return self._query_reading(self.READ_X, float)
 
     def read_y(self):
-        return float(self._query(self.READ_Y))
+        return self._query_reading(self.READ_Y, float)
 
     def read_r(self):
-        return float(self._query(self.READ_R))
+        return self._query_reading(self.READ_R, float)
 
     def read_phi(self):
-        return float(self._query(self.READ_PHI))
+        return self._query_reading(self.READ_PHI, float)
 
     def read_snap(self):
 
         # query the values (the values will be read simultaneously and are transmitted together
-        response = self._query(self.READ_SNAP_X_Y_R_PHI)
+        return self._query_reading(self.READ_SNAP_X_Y_R_PHI, self._parse_snap)
+
+    def read_status(self):
+        """Reads both status registers in one transmission and returns them as SR830Status."""
+        with self.batch():
+            reply = self._query_status()
+        return reply.value
+
+    def _query_reading(self, msg, convert):
+        # without the status check a reading is a simple query
+        if not self.__status_check:
+            return self._query(msg, convert)
+
+        # inside a batch the status queries are just appended to the batch
+        if self.__batch is not None:
+            reply = self._query(msg, convert)
+            self._query_status()
+            return reply
+
+        with self.batch():
+            reply = self._query(msg, convert)
+            self._query_status()
+        return reply.value
+
+    def _query_status(self):
+        # the status is handled as soon as the reply of the error register arrived
+        lia = self._query(self.READ_LIA_STATUS, int)
+        return self._query(self.READ_ERROR_STATUS, lambda errors: self._handle_status(SR830Status(lia.value,
+                                                                                                  int(errors))))
+
+    def _handle_status(self, status):
+        self.last_status = status
+        for callback in self.__status_callbacks:
+            callback(status)
+        if self.__raise_on_fault and status.fault:
+            raise SR830StatusError(status)
+        return status
+
+    @staticmethod
+    def _parse_snap(response):
         [x, y, r, phi] = str(response).split(",")
 
         # convert values to float before returning them
@@ -345,6 +899,108 @@ class SR830:
 
         return [x, y, r, phi]
 
+    """ data storage section (fill the internal buffer and read it back in one binary transfer) """
+
+    def set_sample_rate(self, sample_rate_in_hz):
+
+        # check the given values for a suitable range and return a value that is certainly available.
+        # if the value is larger then the maximum available rate, a error is raised
+        value = self.find_suitable_range(sample_rate_in_hz, self.SAMPLE_RATES)
+
+        # get the index of the rate. This is needed for the command that needs to be sent to the SR830
+        rate_index = self.SAMPLE_RATES.index(value)
+
+        # construct the command and sent it to the device
+        cmd = self.OPERATION_SET_SAMPLE_RATE + " " + str(rate_index)
+        self._write(cmd)
+
+        # the rate that is actually used is returned, since it may differ from the requested one
+        return value
+
+    def set_buffer_mode_one_shot(self):
+        self._write(self.OPERATION_SET_BUFFER_MODE_ONE_SHOT)
+
+    def set_buffer_mode_loop(self):
+        self._write(self.OPERATION_SET_BUFFER_MODE_LOOP)
+
+    def start_buffer(self):
+        self._write(self.OPERATION_START_BUFFER)
+
+    def pause_buffer(self):
+        self._write(self.OPERATION_PAUSE_BUFFER)
+
+    def reset_buffer(self):
+        self._write(self.OPERATION_RESET_BUFFER)
+
+    def read_buffer_length(self):
+        return self._query(self.READ_BUFFER_LENGTH, int)
+
+    def read_buffer(self, channel, start=0, count=None, ieee_format=True):
+        """Reads count points of the display channel (1 or 2) starting at the point start from the internal buffer.
+        The data is transferred in one binary block and returned as a numpy array. If ieee_format is False the
+        SR830 specific TRCL format is used, which is faster for the instrument to produce."""
+
+        if channel not in (1, 2):
+            raise ValueError("Channel must be 1 or 2")
+
+        # numpy is only imported here, because it takes long to import and is only needed for the buffer
+        import numpy as np
+
+        # read everything that is stored from start on if no count is given
+        if count is None:
+            count = self.read_buffer_length() - start
+        if count <= 0:
+            return np.zeros(0)
+
+        # construct the command and read the binary block
+        operation = self.READ_BUFFER_BINARY_IEEE if ieee_format else self.READ_BUFFER_BINARY_LIA
+        cmd = operation + " " + str(channel) + ", " + str(start) + ", " + str(count)
+        data = self._query_binary(cmd, count * self.BUFFER_BYTES_PER_POINT)
+
+        if ieee_format:
+            # little endian 4 byte floats
+            return np.frombuffer(data, dtype='<f4').astype(float)
+
+        # each point consists of a 16 bit mantissa followed by a 16 bit exponent (value = m * 2^(exp - 124))
+        raw = np.frombuffer(data, dtype='<i2').reshape(-1, 2)
+        return np.ldexp(raw[:, 0].astype(float), raw[:, 1].astype(int) - 124)
+
+    def acquire_buffer(self, points, sample_rate_in_hz, ieee_format=True):
+        """Records the given number of points of both display channels at the given sample rate into the internal
+        buffer and reads them back. Returns the two channels (as shown on the display) as numpy arrays and the
+        sample rate that was actually used."""
+
+        if not 0 < points <= self.BUFFER_SIZE:
+            raise ValueError("Number of points must be within 1 to " + str(self.BUFFER_SIZE))
+
+        # prepare an empty buffer that stops recording when it is full
+        self.pause_buffer()
+        self.reset_buffer()
+        sample_rate = self.set_sample_rate(sample_rate_in_hz)
+        self.set_buffer_mode_one_shot()
+
+        # record the data; we sleep most of the expected time and then poll until all points are stored
+        self.start_buffer()
+        self._sleep(points / sample_rate)
+        while self.read_buffer_length() < points:
+            self._sleep(1 / sample_rate)
+        self.pause_buffer()
+
+        ch1 = self.read_buffer(1, 0, points, ieee_format)
+        ch2 = self.read_buffer(2, 0, points, ieee_format)
+
+        return ch1, ch2, sample_rate
+
+    """ streaming section """
+
+    def stream(self, source="snap", **options):
+        """Returns an SR830_Stream.SampleStream that reads (time, x, y, r, phi) records continuously, polled with
+        read_snap (source "snap") or recorded by the internal buffer (source "buffer"). It starts with start() or
+        a with block; the keyword arguments are passed on to SampleStream."""
+        # the streaming module (threads, asyncio) is only imported when a stream is used
+        import SR830_Stream
+        return SR830_Stream.SampleStream(self, source, **options)
+
     """
     ####################################################################################################################
     Helper functions
@@ -366,7 +1022,6 @@ class SR830:
 
         # in other cases just select the smallest possible range the requested value is within
         else:
-            # go through the available ranges starting with the smallest and return if we reach a suitable range
-            for v in sorted(value_list):
-                if v > value:
-                    return v
+            # the smallest range that is larger than the value is found by bisection of the sorted ranges
+            ranges = sorted(value_list)
+            return ranges[bisect.bisect_right(ranges, value)]
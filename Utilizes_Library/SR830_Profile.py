@@ -0,0 +1,220 @@
+import json
+import math
+
+import SR830_Lib
+
+# settings of a profile: name -> (setting of the SR830, values). The values are either a dict that maps the value of
+# the profile to the value of the setting or a tuple of the available values (of which the index is sent) or None for
+# numbers that are sent as they are
+SETTINGS = {
+    "reference": ("FMOD", {"external": 0, "internal": 1}),
+    "harmonic": ("HARM", None),
+    "frequency": ("FREQ", None),
+    "amplitude": ("SLVL", None),
+    "input": ("ISRC", {"A": 0, "A-B": 1, "I_1M": 2, "I_100M": 3}),
+    "shield": ("IGND", {"floating": 0, "ground": 1}),
+    "coupling": ("ICPL", {"ac": 0, "dc": 1}),
+    "line_filters": ("ILIN", {"off": 0, "line": 1, "2xline": 2, "both": 3}),
+    "sensitivity": ("SENS", SR830_Lib.SR830.SENSITIVITY_RANGES),
+    "reserve": ("RMOD", {"high_reserve": 0, "normal": 1, "low_noise": 2}),
+    "time_constant": ("OFLT", SR830_Lib.SR830.TIME_CONSTANTS),
+    "filter_slope": ("OFSL", SR830_Lib.SR830.FILTER_SLOPES),
+    "display_ch1": ("DDEF 1", {"x": (0, 0), "r": (1, 0), "x_noise": (2, 0), "aux1": (3, 0), "aux2": (4, 0)}),
+    "display_ch2": ("DDEF 2", {"y": (0, 0), "phi": (1, 0), "y_noise": (2, 0), "aux3": (3, 0), "aux4": (4, 0)}),
+}
+
+# relative difference up to which a number read back counts as the value that was set (the device rounds them)
+TOLERANCE = 1e-3
+
+
+class ProfileError(Exception):
+    """Raised if the settings read back after applying a profile differ from the profile. The differences are
+    available as dict {setting: (expected, read)}."""
+
+    def __init__(self, profile, differences):
+        super().__init__("Profile " + profile.name + " was not applied: " + ", ".join(
+            "{} is {} instead of {}".format(key, read, expected) for key, (expected, read) in differences.items()))
+        self.differences = differences
+
+
+class MeasurementProfile:
+    """Named set of settings of the SR830 for a kind of measurement, e.g.
+
+        profile = MeasurementProfile("capacitance", reference="internal", input="I_100M", time_constant=1,
+                                     sensitivity=.2)
+        profile.apply(sr830)
+
+    The settings are given with the names in SETTINGS; settings that are not given are left as they are. Sensitivity,
+    time constant and filter slope are given in V, s and dB/oct like for SR830_Lib.SR830 and the next available value is
+    used. Profiles can be saved to and loaded from json files.
+
+    apply() compares the profile with the current settings (from the settings cache of the SR830 if it is enabled,
+    otherwise read in one transmission) and sends only the settings that differ. The changes and the read back of all
+    settings of the profile are sent together in one transmission. A new frequency is set at the first harmonic and the
+    harmonic of the profile is set after it, since the SR830 limits the frequency to 102 kHz divided by the harmonic."""
+
+    def __init__(self, name, **settings):
+        unknown = set(settings) - set(SETTINGS)
+        if unknown:
+            raise ValueError("Unknown settings " + ", ".join(sorted(unknown)))
+
+        self.name = name
+        self.settings = {}
+        for key in SETTINGS:
+            if key in settings:
+                # check the value once here, so that a profile can't fail halfway
+                self._encode(key, settings[key])
+                self.settings[key] = settings[key]
+
+        if self.settings.get("frequency", 0) * self.settings.get("harmonic", 1) > SR830_Lib.SR830.UPPER_FREQ_LIMIT:
+            raise ValueError("The detected frequency (frequency times harmonic) must not exceed " +
+                             str(SR830_Lib.SR830.UPPER_FREQ_LIMIT) + " Hz")
+
+    def __repr__(self):
+        return "MeasurementProfile(" + ", ".join([repr(self.name)] + ["{}={!r}".format(key, value) for key, value
+                                                                         in self.settings.items()]) + ")"
+
+    def __eq__(self, other):
+        return isinstance(other, MeasurementProfile) and self.name == other.name and \
+            self.device_settings() == other.device_settings()
+
+    def updated(self, name=None, **settings):
+        """Returns a copy of the profile with some settings changed."""
+        return MeasurementProfile(name or self.name, **dict(self.settings, **settings))
+
+    """ serialisation """
+
+    def to_dict(self):
+        return {"name": self.name, "settings": dict(self.settings)}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["name"], **data["settings"])
+
+    def save(self, filename):
+        with open(filename, 'w', encoding='utf-8') as file:
+            json.dump(self.to_dict(), file, indent=1)
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, 'r', encoding='utf-8') as file:
+            return cls.from_dict(json.load(file))
+
+    @classmethod
+    def capture(cls, sr830, name):
+        """Returns a profile with all settings the SR830 currently uses (read in one transmission). Settings a profile
+        can't express (e.g. a display with a ratio) are left out."""
+        settings = sr830.refresh_settings()
+        captured = {}
+        for key, (setting, values) in SETTINGS.items():
+            try:
+                captured[key] = cls._decode(key, settings[setting])
+            except ValueError:
+                continue
+        return cls(name, **captured)
+
+    """ device settings """
+
+    def device_settings(self):
+        """Returns the settings of the device as dict {setting: value}, e.g. {"SENS": 24.0, "DDEF 1": (0.0, 0.0)}."""
+        return dict(self._encode(key, value) for key, value in self.settings.items())
+
+    @staticmethod
+    def _encode(key, value):
+        setting, values = SETTINGS[key]
+        if values is None:
+            number = float(value)
+        elif isinstance(values, dict):
+            if value not in values:
+                raise ValueError(key + " must be one of " + ", ".join(str(v) for v in values))
+            number = values[value]
+        else:
+            number = values.index(SR830_Lib.SR830.find_suitable_range(value, values))
+
+        return setting, _number(number)
+
+    @staticmethod
+    def _decode(key, number):
+        setting, values = SETTINGS[key]
+        if values is None:
+            return number
+        if isinstance(values, dict):
+            for value, encoded in values.items():
+                if _same(_number(encoded), number):
+                    return value
+            raise ValueError("Unknown value " + str(number) + " of " + setting)
+        return values[int(number)]
+
+    @staticmethod
+    def _command(setting, number):
+        # "SENS" and 24.0 -> "SENS 24", "DDEF 1" and (1.0, 0.0) -> "DDEF 1, 1, 0"
+        numbers = number if isinstance(number, tuple) else (number,)
+        text = [str(int(v)) if float(v).is_integer() else str(v) for v in numbers]
+        if " " in setting:
+            return setting + ", " + ", ".join(text)
+        return setting + " " + ", ".join(text)
+
+    """ applying """
+
+    def difference(self, sr830):
+        """Returns the settings {setting: value} of the profile that differ from the current settings of the SR830."""
+        target = self.device_settings()
+        with sr830.batch():
+            replies = {setting: sr830._read_setting(setting) for setting in target}
+        return {setting: value for setting, value in target.items() if not _same(replies[setting].value, value)}
+
+    def apply(self, sr830, verify=True):
+        """Sends the settings that differ from the current ones and reads all settings of the profile back in the
+        same transmission. Raises a ProfileError if a setting was not taken. Returns the settings that were changed."""
+
+        target = self.device_settings()
+        changes = self.difference(sr830)
+
+        # the SR830 limits the frequency to UPPER_FREQ_LIMIT / harmonic, so a new frequency is set with the first
+        # harmonic and the harmonic of the profile follows it
+        writes = list(changes.items())
+        if "FREQ" in changes and "HARM" in target:
+            writes = [("HARM", 1.0)] + [(setting, value) for setting, value in writes if setting != "HARM"]
+            if target["HARM"] != 1.0:
+                writes.append(("HARM", target["HARM"]))
+
+        with sr830.batch():
+            for setting, value in writes:
+                sr830._write_setting(self._command(setting, value))
+
+            # the device processes the commands of a line in order, so the queries read the new settings
+            if verify:
+                replies = {setting: sr830._query(sr830._setting_query(setting), sr830._parse_setting)
+                           for setting in target}
+
+        if verify:
+            differences = {setting: (value, replies[setting].value) for setting, value in target.items()
+                           if not _same(replies[setting].value, value)}
+            if differences:
+                sr830.invalidate_settings(*differences)
+                raise ProfileError(self, differences)
+
+        return changes
+
+
+def _number(value):
+    # the same representation as in the settings cache of SR830_Lib
+    if isinstance(value, tuple):
+        return tuple(float(v) for v in value)
+    return float(value)
+
+
+def _same(a, b):
+    # compare settings with the tolerance of the rounding of the device
+    if isinstance(a, tuple) or isinstance(b, tuple):
+        return isinstance(a, tuple) and isinstance(b, tuple) and len(a) == len(b) and all(
+            _same(x, y) for x, y in zip(a, b))
+    return math.isclose(a, b, rel_tol=TOLERANCE, abs_tol=1e-12)
+
+
+# profiles of the measurement scripts
+CAPACITANCE_SWEEP = MeasurementProfile("capacitance sweep", reference="internal", line_filters="both",
+                                       input="I_100M", shield="floating", coupling="dc", filter_slope=12,
+                                       reserve="normal", time_constant=1, sensitivity=.2, display_ch1="x",
+                                       display_ch2="y", amplitude=.004)
+IMPEDANCE = CAPACITANCE_SWEEP.updated("impedance", time_constant=.3, sensitivity=.05, amplitude=.04)
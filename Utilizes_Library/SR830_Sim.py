@@ -0,0 +1,478 @@
+import cmath
+import math
+import random
+import time
+
+import numpy as np
+
+import SR830_Lib
+
+
+class RCLoad:
+    """Simple model of a nanogap capacitor connected to the sine output and the current input of the SR830.
+
+    The capacitance is in series with series_resistance (leads, electrolyte) and both are in parallel with the leakage
+    parallel_resistance and the stray capacitance of the fixture. A nonlinear leakage (e.g. tunneling through the gap)
+    adds the current g2 V^2 + g3 V^3 + ... with the nonlinear_conductances (g2, g3, ...) in A/V^k, which creates the
+    higher harmonics of the current."""
+
+    def __init__(self, capacitance=10e-12, series_resistance=0, parallel_resistance=math.inf, stray_capacitance=0,
+                 nonlinear_conductances=()):
+        self.capacitance = capacitance
+        self.series_resistance = series_resistance
+        self.parallel_resistance = parallel_resistance
+        self.stray_capacitance = stray_capacitance
+        self.nonlinear_conductances = tuple(nonlinear_conductances)
+
+    def admittance(self, frequency):
+        """Returns the complex admittance in S at the given frequency (works with numpy arrays as well)."""
+        omega = 2 * np.pi * np.asarray(frequency, dtype=float)
+        branch = 1 / (self.series_resistance + 1 / (1j * omega * self.capacitance))
+        return branch + 1 / self.parallel_resistance + 1j * omega * self.stray_capacitance
+
+    def impedance(self, frequency):
+        """Returns the complex impedance in Ohm at the given frequency."""
+        return 1 / self.admittance(frequency)
+
+    def current(self, frequency, amplitude, harmonic=1):
+        """Returns the complex rms current in A at the given harmonic of the frequency for a sine of the given rms
+        amplitude in V."""
+
+        current = amplitude * complex(self.admittance(frequency)) if harmonic == 1 else 0j
+
+        # cos^k contains cos(h x) with the weight binomial(k, (k - h) / 2) / 2^(k - 1) if k - h is even and not negative
+        peak = math.sqrt(2) * amplitude
+        for k, conductance in enumerate(self.nonlinear_conductances, 2):
+            if k >= harmonic and (k - harmonic) % 2 == 0:
+                current += conductance * peak ** k * math.comb(k, (k - harmonic) // 2) / 2 ** (k - 1) / math.sqrt(2)
+
+        return current
+
+
+class SimulatedSR830:
+    """In-process replacement for the pyvisa resource of an SR830. It understands the commands that SR830_Lib.SR830
+    sends, measures the current through a load (RCLoad by default) and models the lock-in output filter with the set
+    time constant and slope, the output noise and the overload status bits.
+
+    The transmission time of each message is simulated with a fixed latency plus 10 bits per character at the given
+    baud rate (None for a GPIB like link without byte cost), so that sweep throughput can be benchmarked without the
+    device. The noise_density is given in units of the output (A or V) per sqrt(Hz). The clock and sleep functions can
+    be replaced, e.g. to run the simulation in virtual time."""
+
+    IDENTIFICATION = "Stanford_Research_Systems,SR830,s/n00000,ver1.07 (simulated)"
+
+    # input gain of the current inputs (ISRC 2 and 3) in A/V; the voltage inputs measure the current at a sense resistor
+    INPUT_SCALES = SR830_Lib.SR830.INPUT_SCALES
+    # input signal (relative to the full scale sensitivity) that overloads the input for each reserve mode
+    RESERVE_FACTORS = (1000, 100, 10)
+    # outputs are limited to 109% of the full scale sensitivity
+    OUTPUT_LIMIT = 1.09
+    # equivalent noise bandwidth of the output filter in 1/tau for the four slopes
+    NOISE_BANDWIDTHS = (1 / 4, 1 / 8, 3 / 32, 5 / 64)
+
+    # default settings after *RST as given in the manual
+    DEFAULT_SETTINGS = {"FMOD": 1, "FREQ": 1000.0, "SLVL": 1.0, "PHAS": 0.0, "HARM": 1, "RSLP": 0, "ISRC": 0,
+                        "IGND": 0, "ICPL": 0, "ILIN": 0, "SENS": 26, "RMOD": 1, "OFLT": 10, "OFSL": 1, "SYNC": 0,
+                        "SRAT": 4, "SEND": 1, "OUTX": 0, "OVRM": 1, "DDEF 1": (0, 0), "DDEF 2": (0, 0)}
+
+    def __init__(self, resource_name="ASRL3::INSTR", load=None, sense_resistance=1e3, noise_density=0.0,
+                 latency=0.0, baud_rate=9600, auto_gain_duration=3.0, auto_phase_duration=0.5, seed=None,
+                 clock=time.monotonic, sleep=time.sleep):
+
+        self.resource_name = resource_name
+        self.load = load if load is not None else RCLoad()
+        self.sense_resistance = sense_resistance
+        self.noise_density = noise_density
+        self.latency = latency
+        self.baud_rate = baud_rate if resource_name.startswith("ASRL") else None
+        self.auto_gain_duration = auto_gain_duration
+        self.auto_phase_duration = auto_phase_duration
+        self.clock = clock
+        self.sleep = sleep
+        self.random = random.Random(seed)
+
+        # attributes of a pyvisa resource
+        self.read_termination = '\n'
+        self.write_termination = '\n'
+        self.timeout = 2000
+        self.closed = False
+
+        # statistics for benchmarks
+        self.transactions = 0
+        self.bytes_transferred = 0
+
+        self.reset()
+
+    """ pyvisa resource interface """
+
+    def write(self, message):
+        self._transfer(len(message) + len(self.write_termination), self.latency)
+        self.transactions += 1
+        for command in message.split(";"):
+            command = command.strip()
+            if command:
+                self._execute(command)
+
+    def read(self):
+        if not self.__replies or not isinstance(self.__replies[0], str):
+            raise TimeoutError("No reply available from the simulated SR830")
+        reply = self.__replies.pop(0)
+        self._transfer(len(reply) + len(self.read_termination))
+        return reply
+
+    def read_bytes(self, count):
+        if not self.__replies or not isinstance(self.__replies[0], bytes):
+            raise TimeoutError("No binary reply available from the simulated SR830")
+        reply = self.__replies.pop(0)
+        if len(reply) > count:
+            self.__replies.insert(0, reply[count:])
+            reply = reply[:count]
+        self._transfer(len(reply))
+        return reply
+
+    def query(self, message):
+        self.write(message)
+        return self.read()
+
+    def clear(self):
+        self.__replies = []
+
+    def close(self):
+        self.closed = True
+
+    def _transfer(self, number_of_bytes, latency=0.0):
+        # simulate the time the message needs on the wire
+        self.bytes_transferred += number_of_bytes
+        seconds = latency
+        if self.baud_rate:
+            seconds += 10 * number_of_bytes / self.baud_rate
+        if seconds > 0:
+            self.sleep(seconds)
+
+    """ device model """
+
+    def reset(self):
+        self.settings = dict(self.DEFAULT_SETTINGS)
+        self.aux_outputs = [0.0] * 4
+        self.__replies = []
+        self.__status = 0
+        self.__busy_until = self.clock()
+
+        # the state of each RC stage of the output filter (complex X + iY) and the time it was calculated for
+        self.__filter = [0j] * 4
+        self.__time = self.clock()
+
+        # internal data buffer of the two display channels
+        self.__buffer = ([], [])
+        self.__buffer_running = False
+        self.__next_sample = 0.0
+
+    def input_signal(self):
+        """Returns the complex signal (current in A for the current inputs, voltage in V otherwise) at the detection
+        frequency, rotated by the reference phase, i.e. the value the output settles to."""
+
+        if self.settings["FMOD"] == 0:
+            # without an external reference the device is not locked
+            return 0j
+
+        current = self.load.current(self.settings["FREQ"], self.settings["SLVL"], int(self.settings["HARM"]))
+        if self.settings["ISRC"] < 2:
+            current *= self.sense_resistance
+
+        return current * cmath.exp(-1j * math.radians(self.settings["PHAS"]))
+
+    def output(self):
+        """Returns the current complex output X + iY including noise and the output limit."""
+        self._advance()
+        return self._sample()
+
+    def _sample(self):
+        # output of the last filter stage at the time the filter was calculated for
+        value = self.__filter[self._stages() - 1]
+        if self.noise_density:
+            bandwidth = self.NOISE_BANDWIDTHS[int(self.settings["OFSL"])] / self._time_constant()
+            sigma = self.noise_density * math.sqrt(bandwidth)
+            value += complex(self.random.gauss(0, sigma), self.random.gauss(0, sigma))
+
+        limit = self.OUTPUT_LIMIT * self.full_scale()
+        return complex(min(max(value.real, -limit), limit), min(max(value.imag, -limit), limit))
+
+    def full_scale(self):
+        """Returns the full scale sensitivity in A or V depending on the input mode."""
+        return SR830_Lib.SR830.SENSITIVITY_RANGES[int(self.settings["SENS"])] * self._input_scale()
+
+    def _input_scale(self):
+        return self.INPUT_SCALES[int(self.settings["ISRC"])]
+
+    def _time_constant(self):
+        return SR830_Lib.SR830.TIME_CONSTANTS[int(self.settings["OFLT"])]
+
+    def _stages(self):
+        return int(self.settings["OFSL"]) + 1
+
+    def _advance(self):
+        # bring the output filter (and the data buffer) to the current time
+        now = self.clock()
+
+        if self.__buffer_running:
+            period = 1 / SR830_Lib.SR830.SAMPLE_RATES[int(self.settings["SRAT"])]
+            while self.__buffer_running and self.__next_sample <= now:
+                self._step_filter(self.__next_sample)
+                self._store_sample()
+                self.__next_sample += period
+
+        self._step_filter(now)
+        self._update_status()
+
+    def _step_filter(self, now):
+        # exact solution for a cascade of identical RC stages with constant input: the error of stage k decays with
+        # exp(-x) * sum_j e_j * x^(k-j) / (k-j)!
+        x = max(now - self.__time, 0.0) / self._time_constant()
+        self.__time = max(now, self.__time)
+        if x == 0:
+            return
+
+        target = self.input_signal()
+        errors = [state - target for state in self.__filter]
+        decay = math.exp(-x)
+        self.__filter = [target + decay * sum(errors[j] * x ** (k - j) / math.factorial(k - j) for j in range(k + 1))
+                         for k in range(len(self.__filter))]
+
+    def _update_status(self):
+        # the bits of the LIA status register are latched until they are read
+        full_scale = self.full_scale()
+        if abs(self.input_signal()) > self.RESERVE_FACTORS[int(self.settings["RMOD"])] * full_scale:
+            self.__status |= 1
+        value = self.__filter[self._stages() - 1]
+        if max(abs(value.real), abs(value.imag)) > full_scale:
+            self.__status |= 4
+        if self.settings["FMOD"] == 0:
+            self.__status |= 8
+
+    def _display(self, channel, value):
+        # what the display (and the data buffer) of the channel shows
+        if self.settings["DDEF " + str(channel)][0] == 0:
+            return value.real if channel == 1 else value.imag
+        return abs(value) if channel == 1 else math.degrees(cmath.phase(value))
+
+    def _store_sample(self):
+        value = self._sample()
+        for channel in (1, 2):
+            self.__buffer[channel - 1].append(self._display(channel, value))
+
+        if len(self.__buffer[0]) >= SR830_Lib.SR830.BUFFER_SIZE:
+            if self.settings["SEND"] == 0:
+                self.__buffer_running = False
+            else:
+                # in loop mode the oldest points are overwritten
+                for data in self.__buffer:
+                    del data[0]
+
+    """ command interpreter """
+
+    def _execute(self, command):
+        # the device is busy with an auto function until the time it needs for it has passed
+        wait = self.__busy_until - self.clock()
+        if wait > 0:
+            self.sleep(wait)
+
+        parts = command.split(None, 1)
+        mnemonic = parts[0].upper()
+        arguments = [a.strip() for a in parts[1].split(",")] if len(parts) > 1 else []
+
+        if mnemonic.endswith("?"):
+            reply = self._query(mnemonic[:-1], arguments)
+            self.__replies.append(reply)
+        else:
+            self._advance()
+            self._set(mnemonic, arguments)
+
+    def _query(self, mnemonic, arguments):
+        if mnemonic == "*IDN":
+            return self.IDENTIFICATION
+        if mnemonic == "OUTP":
+            return self._format(self._output_value(int(arguments[0]), self.output()))
+        if mnemonic == "SNAP":
+            value = self.output()
+            return ",".join(self._format(self._output_value(int(a), value)) for a in arguments)
+        if mnemonic == "LIAS":
+            self._advance()
+            status = self.__status
+            if arguments:
+                bit = int(arguments[0])
+                self.__status &= ~(1 << bit)
+                return str((status >> bit) & 1)
+            self.__status = 0
+            return str(status)
+        if mnemonic == "ERRS":
+            return "0"
+        if mnemonic == "DDEF":
+            return ",".join(str(v) for v in self.settings["DDEF " + arguments[0]])
+        if mnemonic == "AUXV":
+            return self._format(self.aux_outputs[int(arguments[0]) - 1])
+        if mnemonic == "OAUX":
+            return self._format(0.0)
+        if mnemonic == "SPTS":
+            self._advance()
+            return str(len(self.__buffer[0]))
+        if mnemonic in ("TRCA", "TRCB", "TRCL"):
+            self._advance()
+            channel, start, count = (int(a) for a in arguments)
+            data = np.array(self.__buffer[channel - 1][start:start + count], dtype=float)
+            if mnemonic == "TRCA":
+                return ",".join(self._format(v) for v in data)
+            if mnemonic == "TRCB":
+                return data.astype('<f4').tobytes()
+            return self._encode_lia(data)
+        if mnemonic in self.settings:
+            return self._format(self.settings[mnemonic])
+
+        raise ValueError("Unknown query " + mnemonic + "? for the simulated SR830")
+
+    def _set(self, mnemonic, arguments):
+        if mnemonic == "*RST":
+            self.reset()
+        elif mnemonic == "*CLS":
+            self.__status = 0
+        elif mnemonic == "DDEF":
+            self.settings["DDEF " + arguments[0]] = (int(arguments[1]), int(arguments[2]))
+        elif mnemonic == "AUXV":
+            self.aux_outputs[int(arguments[0]) - 1] = float(arguments[1])
+        elif mnemonic == "APHS":
+            # rotate the reference phase so that the output is along X; the output has to settle again afterwards
+            phase = self.settings["PHAS"] + math.degrees(cmath.phase(self.output()))
+            self.settings["PHAS"] = (phase + 180) % 360 - 180
+            self.__busy_until = self.clock() + self.auto_phase_duration
+        elif mnemonic == "AGAN":
+            self._auto_gain()
+            self.__busy_until = self.clock() + self.auto_gain_duration
+        elif mnemonic in ("ARSV", "AOFF"):
+            pass
+        elif mnemonic == "FREQ":
+            # the detected frequency is limited, so a high harmonic limits the reference frequency
+            limit = SR830_Lib.SR830.UPPER_FREQ_LIMIT / self.settings["HARM"]
+            self.settings["FREQ"] = min(float(arguments[0]), limit)
+        elif mnemonic == "HARM":
+            # a harmonic that would exceed the limit is not accepted
+            harmonic = int(float(arguments[0]))
+            if self.settings["FREQ"] * harmonic <= SR830_Lib.SR830.UPPER_FREQ_LIMIT:
+                self.settings["HARM"] = harmonic
+        elif mnemonic == "ISRC":
+            # the filter holds the signal in the units of the input (V at the sense resistor or A); it is converted,
+            # so that the output after a change of the input mode is the same signal
+            mode = int(float(arguments[0]))
+            factor = self._unit_factor(mode) / self._unit_factor(self.settings["ISRC"])
+            self.__filter = [state * factor for state in self.__filter]
+            self.settings["ISRC"] = mode
+        elif mnemonic == "STRT":
+            if not self.__buffer_running:
+                self.__buffer_running = True
+                self.__next_sample = self.clock()
+        elif mnemonic == "PAUS":
+            self.__buffer_running = False
+        elif mnemonic == "REST":
+            self.__buffer = ([], [])
+            self.__buffer_running = False
+        elif mnemonic in self.settings:
+            value = float(arguments[0])
+            self.settings[mnemonic] = int(value) if value.is_integer() and mnemonic not in ("FREQ", "SLVL",
+                                                                                             "PHAS") else value
+        else:
+            raise ValueError("Unknown command " + mnemonic + " for the simulated SR830")
+
+    def _unit_factor(self, mode):
+        # the voltage inputs see the current as voltage at the sense resistor
+        return self.sense_resistance if mode < 2 else 1.0
+
+    def _auto_gain(self):
+        # use the smallest sensitivity that shows the settled signal below full scale
+        signal = abs(self.input_signal())
+        ranges = SR830_Lib.SR830.SENSITIVITY_RANGES
+        for index, value in enumerate(ranges):
+            if signal < 0.9 * value * self._input_scale():
+                self.settings["SENS"] = index
+                return
+        self.settings["SENS"] = len(ranges) - 1
+
+    def _output_value(self, index, value):
+        # parameter of OUTP? / SNAP?: 1 X, 2 Y, 3 R, 4 theta, 5-8 aux inputs, 9 reference frequency, 10/11 displays
+        if index == 1:
+            return value.real
+        if index == 2:
+            return value.imag
+        if index == 3:
+            return abs(value)
+        if index == 4:
+            return math.degrees(cmath.phase(value))
+        if index == 9:
+            return self.settings["FREQ"]
+        if index in (10, 11):
+            return self._display(index - 9, value)
+        return 0.0
+
+    @staticmethod
+    def _format(value):
+        if isinstance(value, int):
+            return str(value)
+        return "{:.6g}".format(value)
+
+    @staticmethod
+    def _encode_lia(data):
+        # TRCL format: 16 bit mantissa and 16 bit exponent with value = m * 2^(exp - 124). A mantissa that rounds up
+        # to 2^15 does not fit into 16 bits and is limited like on the device
+        mantissa, exponent = np.frexp(data)
+        mantissa = np.clip(np.round(mantissa * 2 ** 15), -2 ** 15, 2 ** 15 - 1).astype('<i2')
+        raw = np.zeros((len(data), 2), dtype='<i2')
+        raw[:, 0] = mantissa
+        raw[:, 1] = exponent - 15 + 124
+        return raw.tobytes()
+
+
+class VirtualClock:
+    """Clock to run the simulation in virtual time: sleeping only advances the time, e.g.
+
+        clock = SR830_Sim.VirtualClock()
+        rm = SR830_Sim.SimulatedResourceManager(clock=clock.time, sleep=clock.sleep)
+
+    A sweep then takes no real waiting time while the simulated device still sees the waits."""
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.now += seconds
+
+
+class SimulatedResourceManager:
+    """Replacement for pyvisa.ResourceManager that opens simulated SR830s, e.g.
+
+        sr830 = SR830_Lib.SR830(rm=SR830_Sim.SimulatedResourceManager(load=SR830_Sim.RCLoad(capacitance=5e-12)))
+        sr830.connect('ASRL3::INSTR')
+
+    Every resource name is a separate device that keeps its state when it is opened again. Loads for single resources
+    can be given with loads={name: load}; all other keyword arguments are passed on to SimulatedSR830."""
+
+    def __init__(self, load=None, loads=None, **options):
+        self.load = load
+        self.loads = dict(loads) if loads else {}
+        self.options = options
+        self.devices = {}
+
+    def list_resources(self):
+        return tuple(sorted(set(self.loads) | set(self.devices)))
+
+    def open_resource(self, resource_name):
+        device = self.devices.get(resource_name)
+        if device is None:
+            device = SimulatedSR830(resource_name, self.loads.get(resource_name, self.load), **self.options)
+            self.devices[resource_name] = device
+        device.closed = False
+        return device
+
+    def close(self):
+        for device in self.devices.values():
+            device.close()
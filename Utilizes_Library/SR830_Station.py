@@ -0,0 +1,155 @@
+import heapq
+import itertools
+import time
+
+import numpy as np
+
+import SR830_Lib
+import SR830_Sweep
+
+
+class SweepJob:
+    """Sweep of one device that was queued with Station.submit(). After Station.run() result holds the
+    SR830_Sweep.SweepResult, or error the exception that stopped the job."""
+
+    def __init__(self, resource_name, frequencies, profile=None, callback=None, sweep_options=None):
+        self.resource_name = resource_name
+        self.frequencies = np.asarray(frequencies, dtype=float)
+        self.profile = profile
+        self.callback = callback
+        self.sweep_options = dict(sweep_options) if sweep_options else {}
+        self.result = None
+        self.error = None
+        self.done = False
+
+    def __repr__(self):
+        state = "failed" if self.error is not None else "done" if self.done else "queued"
+        return "SweepJob(" + self.resource_name + ", " + str(len(self.frequencies)) + " points, " + state + ")"
+
+    def steps(self, sr830):
+        """Generator that runs the whole sweep on the given device. Like FrequencySweep.measure it yields the times to
+        wait, so that the station can use them for other devices."""
+
+        if self.profile is not None:
+            self.profile.apply(sr830)
+        sweep = SR830_Sweep.FrequencySweep(sr830, **self.sweep_options)
+
+        callback = None
+        if self.callback is not None:
+            def callback(frequency, x, y, r, phi):
+                self.callback(self, frequency, x, y, r, phi)
+
+        self.result = yield from sweep.steps(self.frequencies, callback)
+
+
+class Station:
+    """Measurement station with several SR830s that share one resource manager, e.g.
+
+        with Station() as station:
+            for name in ('ASRL3::INSTR', 'ASRL4::INSTR'):
+                station.submit(name, frequencies, profile=SR830_Profile.CAPACITANCE_SWEEP, time_constant=1,
+                               filter_slope=12)
+            jobs = station.run()
+
+    The connection to every device is opened once and reused by all following jobs. run() works through the queued
+    jobs of all devices at the same time in one thread: every job is a generator that yields the times it has to wait
+    for the output filter to settle, and a heap ordered by the time each job is ready again decides which device is
+    served next. While one device settles, the others are set up and read out. The jobs of one device run one after
+    another in the order they were submitted.
+
+    The clock and sleep functions can be replaced, e.g. by SR830_Sim.VirtualClock."""
+
+    def __init__(self, rm=None, clock=time.monotonic, sleep=time.sleep):
+        if rm is None:
+            import pyvisa
+            rm = pyvisa.ResourceManager()
+        self.rm = rm
+        self.clock = clock
+        self.sleep = sleep
+        self.__devices = {}
+        self.__queue = []
+
+    def device(self, resource_name):
+        """Returns the connected SR830_Lib.SR830 of the resource; the connection is opened on first use."""
+        sr830 = self.__devices.get(resource_name)
+        if sr830 is None:
+            sr830 = SR830_Lib.SR830(self.rm)
+            sr830.connect(resource_name)
+            self.__devices[resource_name] = sr830
+        return sr830
+
+    @property
+    def devices(self):
+        return dict(self.__devices)
+
+    def close(self):
+        """Disconnects all devices."""
+        for sr830 in self.__devices.values():
+            sr830.disconnect()
+        self.__devices.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def submit(self, resource_name, frequencies, profile=None, callback=None, **sweep_options):
+        """Queues a sweep of the device with the resource name. The profile (SR830_Profile.MeasurementProfile) is
+        applied before the sweep, the keyword arguments are passed on to SR830_Sweep.FrequencySweep and the callback is
+        called with (job, frequency, x, y, r, phi) after every point. Returns the SweepJob."""
+        job = SweepJob(resource_name, frequencies, profile, callback, sweep_options)
+        self.__queue.append(job)
+        return job
+
+    def run(self):
+        """Runs all queued jobs and returns them. A job that raises an exception is stopped and keeps the exception in
+        its error; the other jobs continue."""
+
+        jobs, self.__queue = self.__queue, []
+
+        # the jobs of every device in the order they were submitted
+        pending = {}
+        for job in jobs:
+            pending.setdefault(job.resource_name, []).append(job)
+
+        # heap of (ready time, sequence number, job, steps); the sequence number keeps the order of equal times
+        ready = []
+        sequence = itertools.count()
+
+        def start_next(resource_name):
+            if pending[resource_name]:
+                job = pending[resource_name].pop(0)
+                try:
+                    steps = job.steps(self.device(resource_name))
+                except Exception as error:
+                    job.error = error
+                    job.done = True
+                    start_next(resource_name)
+                    return
+                heapq.heappush(ready, (self.clock(), next(sequence), job, steps))
+
+        for resource_name in pending:
+            start_next(resource_name)
+
+        while ready:
+            ready_time, _, job, steps = heapq.heappop(ready)
+            wait = ready_time - self.clock()
+            if wait > 0:
+                self.sleep(wait)
+
+            try:
+                seconds = next(steps)
+            except StopIteration:
+                job.done = True
+                start_next(job.resource_name)
+                continue
+            except Exception as error:
+                job.error = error
+                job.done = True
+                start_next(job.resource_name)
+                continue
+
+            heapq.heappush(ready, (self.clock() + seconds, next(sequence), job, steps))
+
+        return jobs
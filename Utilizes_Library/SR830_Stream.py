@@ -0,0 +1,281 @@
+import asyncio
+import math
+import threading
+import time
+from collections import deque, namedtuple
+
+import numpy as np
+
+# one sample of the stream: the time of the sample in seconds (of the clock of the stream), x and y and r in the units
+# of the output (V or A) and phi in degrees
+StreamRecord = namedtuple('StreamRecord', ['time', 'x', 'y', 'r', 'phi'])
+
+
+class RingBuffer:
+    """Bounded first in first out buffer between one producer and one consumer thread.
+
+    If the buffer is full, put() blocks until the consumer took a record (backpressure) or, with overwrite, drops the
+    oldest record and counts it in dropped. After close() put() does nothing and get() returns the remaining records
+    and then None."""
+
+    def __init__(self, capacity, overwrite=False):
+        if capacity < 1:
+            raise ValueError("The capacity must be at least 1")
+        self.capacity = capacity
+        self.overwrite = overwrite
+        self.dropped = 0
+        self.closed = False
+        self.__items = deque()
+        self.__condition = threading.Condition()
+
+    def __len__(self):
+        return len(self.__items)
+
+    def put(self, item):
+        with self.__condition:
+            while len(self.__items) >= self.capacity and not self.overwrite and not self.closed:
+                self.__condition.wait()
+            if self.closed:
+                return
+            if len(self.__items) >= self.capacity:
+                self.__items.popleft()
+                self.dropped += 1
+            self.__items.append(item)
+            self.__condition.notify_all()
+
+    def get(self, timeout=None):
+        """Returns the oldest record or None if the buffer was closed and is empty. Raises a TimeoutError if nothing
+        arrived within timeout seconds."""
+        with self.__condition:
+            if not self.__condition.wait_for(lambda: self.__items or self.closed, timeout):
+                raise TimeoutError("No record within " + str(timeout) + " s")
+            if not self.__items:
+                return None
+            item = self.__items.popleft()
+            self.__condition.notify_all()
+            return item
+
+    def close(self):
+        with self.__condition:
+            self.closed = True
+            self.__condition.notify_all()
+
+
+class Subscription:
+    """Records of a SampleStream for one consumer. It can be iterated (also with async for) until the stream stops."""
+
+    def __init__(self, stream, capacity, overwrite):
+        self.stream = stream
+        self.buffer = RingBuffer(capacity, overwrite)
+
+    def get(self, timeout=None):
+        """Returns the next record or None once the stream stopped and all records were taken."""
+        record = self.buffer.get(timeout)
+        if record is None and self.stream.error is not None:
+            raise self.stream.error
+        return record
+
+    def close(self):
+        """Stops the delivery of records to this subscription."""
+        self.stream.unsubscribe(self)
+
+    def __iter__(self):
+        while True:
+            record = self.get()
+            if record is None:
+                return
+            yield record
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        # the blocking get runs in the default executor of the event loop
+        record = await asyncio.get_running_loop().run_in_executor(None, self.get)
+        if record is None:
+            raise StopAsyncIteration
+        return record
+
+
+class SampleStream:
+    """Continuous stream of StreamRecords (time, x, y, r, phi) of an SR830_Lib.SR830, e.g. to monitor the drift of a
+    gap:
+
+        with sr830.stream(interval=0.1) as stream:
+            for record in stream.subscribe():
+                print(record.time, record.r)
+
+    A background thread reads the samples and puts them into the ring buffer of every subscription and passes them to
+    every callback (in the thread of the stream). While a subscription is full the stream waits (backpressure), unless
+    it was subscribed with overwrite=True, which drops the oldest records instead. A subscription only receives the
+    records after it subscribed.
+
+    With source "snap" the outputs are polled with read_snap every interval seconds (as fast as possible for 0); the
+    time of a record is the middle of its query. With source "buffer" the displays are set to X and Y and the internal
+    buffer records them at sample_rate; new points are read every poll_interval seconds in one binary block and the
+    times follow from the sample rate. The full buffer is restarted, which causes a short gap.
+
+    While the stream runs, the SR830 must not be used by other threads."""
+
+    SOURCES = ("snap", "buffer")
+
+    def __init__(self, sr830, source="snap", interval=0.0, sample_rate=64, poll_interval=0.2, capacity=4096,
+                 clock=time.time):
+
+        if source not in self.SOURCES:
+            raise ValueError("Source must be one of " + str(self.SOURCES))
+
+        self.sr830 = sr830
+        self.source = source
+        self.interval = interval
+        self.sample_rate = sample_rate
+        self.poll_interval = poll_interval
+        self.capacity = capacity
+        self.clock = clock
+        self.records = 0
+        self.error = None
+
+        self.__subscriptions = []
+        self.__callbacks = []
+        self.__lock = threading.Lock()
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    """ consumers """
+
+    def subscribe(self, capacity=None, overwrite=False):
+        """Returns a new Subscription with a ring buffer of the given capacity (the capacity of the stream by
+        default)."""
+        subscription = Subscription(self, capacity or self.capacity, overwrite)
+        with self.__lock:
+            self.__subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.__lock:
+            if subscription in self.__subscriptions:
+                self.__subscriptions.remove(subscription)
+        subscription.buffer.close()
+
+    def add_callback(self, callback):
+        """The callback is called with every StreamRecord in the thread of the stream."""
+        with self.__lock:
+            self.__callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        with self.__lock:
+            self.__callbacks.remove(callback)
+
+    def __iter__(self):
+        # iterating the stream directly uses a subscription that ends with the loop
+        subscription = self.subscribe()
+        try:
+            yield from subscription
+        finally:
+            self.unsubscribe(subscription)
+
+    async def __aiter__(self):
+        subscription = self.subscribe()
+        try:
+            async for record in subscription:
+                yield record
+        finally:
+            self.unsubscribe(subscription)
+
+    """ control """
+
+    @property
+    def running(self):
+        return self.__thread is not None and self.__thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return self
+        self.__stop.clear()
+        self.error = None
+        self.__thread = threading.Thread(target=self._run, name="SR830 stream", daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        """Stops the stream and waits for its thread. The subscriptions end after their remaining records."""
+        self.__stop.set()
+        with self.__lock:
+            subscriptions = list(self.__subscriptions)
+        # blocked producers are released by closing the buffers
+        for subscription in subscriptions:
+            subscription.buffer.close()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    """ producer """
+
+    def _run(self):
+        try:
+            if self.source == "snap":
+                self._poll_snap()
+            else:
+                self._poll_buffer()
+        except Exception as error:
+            self.error = error
+        finally:
+            with self.__lock:
+                subscriptions = list(self.__subscriptions)
+            for subscription in subscriptions:
+                subscription.buffer.close()
+
+    def _publish(self, record):
+        with self.__lock:
+            subscriptions = list(self.__subscriptions)
+            callbacks = list(self.__callbacks)
+        for callback in callbacks:
+            callback(record)
+        for subscription in subscriptions:
+            subscription.buffer.put(record)
+        self.records += 1
+
+    def _poll_snap(self):
+        next_time = self.clock()
+        while not self.__stop.is_set():
+            before = self.clock()
+            x, y, r, phi = self.sr830.read_snap()
+            self._publish(StreamRecord((before + self.clock()) / 2, x, y, r, phi))
+
+            next_time = max(next_time + self.interval, self.clock())
+            self.__stop.wait(next_time - self.clock())
+
+    def _poll_buffer(self):
+        sr830 = self.sr830
+        sr830.pause_buffer()
+        sr830.display_ch1_x()
+        sr830.display_ch2_y()
+        rate = sr830.set_sample_rate(self.sample_rate)
+        sr830.set_buffer_mode_one_shot()
+
+        try:
+            while not self.__stop.is_set():
+                sr830.reset_buffer()
+                sr830.start_buffer()
+                start = self.clock()
+                read = 0
+
+                while read < sr830.BUFFER_SIZE and not self.__stop.wait(self.poll_interval):
+                    stored = sr830.read_buffer_length()
+                    if stored <= read:
+                        continue
+                    x = sr830.read_buffer(1, read, stored - read)
+                    y = sr830.read_buffer(2, read, stored - read)
+                    times = start + np.arange(read, stored) / rate
+                    for t, xi, yi in zip(times, x, y):
+                        self._publish(StreamRecord(float(t), float(xi), float(yi), math.hypot(xi, yi),
+                                                   math.degrees(math.atan2(yi, xi))))
+                    read = stored
+        finally:
+            sr830.pause_buffer()
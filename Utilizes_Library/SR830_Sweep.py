@@ -0,0 +1,428 @@
+import math
+import time
+from collections import namedtuple
+
+import numpy as np
+
+# result of a sweep; every field is a numpy array with one entry per frequency point. fault marks the points whose
+# reading came with an overload, unlock or device error (only known if the status check of the SR830 is enabled)
+SweepResult = namedtuple('SweepResult', ['frequency', 'x', 'y', 'r', 'phi', 'settling', 'fault'], defaults=(None,))
+
+
+def settling_time(time_constant, filter_slope, accuracy=1e-2):
+    """Returns the time in seconds the output filter of the SR830 needs after a step of the input until the output is
+    within the given relative accuracy of its final value.
+
+    The filter consists of filter_slope / 6 identical RC stages. The remaining error of such a cascade after the time t
+    is exp(-t/tau) * sum_k (t/tau)^k / k! for k < number of stages, which is solved for t here. For an accuracy of 1%
+    this gives the values in the manual (4.6 tau at 6 dB/oct up to 10 tau at 24 dB/oct)."""
+
+    if not 0 < accuracy < 1:
+        raise ValueError("Accuracy must be within 0 and 1")
+
+    stages = int(round(filter_slope / 6))
+
+    def remaining_error(x):
+        return math.exp(-x) * sum(x ** k / math.factorial(k) for k in range(stages))
+
+    # the remaining error is monotonically decreasing, so we bracket the solution and bisect it
+    lower = 0.0
+    upper = 1.0
+    while remaining_error(upper) > accuracy:
+        lower = upper
+        upper *= 2
+    for _ in range(60):
+        middle = (lower + upper) / 2
+        if remaining_error(middle) > accuracy:
+            lower = middle
+        else:
+            upper = middle
+
+    return upper * time_constant
+
+
+class FrequencySweep:
+    """Steps the internal reference of an SR830_Lib.SR830 through a list of frequencies and reads X, Y, R and phi at
+    every point after the output filter settled.
+
+    The waiting time is calculated from the time constant and filter slope. If a convergence_tolerance is given, the
+    output is polled with read_snap once per time constant after the filter reached 63% of a step and the wait is
+    stopped early as soon as two successive readings differ by less than the relative tolerance. A large step (e.g.
+    the first point after a change of the setup) takes longer than the settling time, which is calculated for the
+    accuracy of a step to the next frequency, so the polling goes on up to max_settling_time (3 settling times by
+    default); a point that did not converge until then is flagged as faulty. A clipped reading (X or Y at or above the
+    full scale) or one with an overload in the status never counts as converged, since the clipped output does not
+    change while the real one does; such a point is flagged as faulty as well. With auto_range the
+    sensitivity is adjusted by SR830.auto_range after the output settled. A faulty point (clipped, not converged or, if
+    the status check of the SR830 is enabled, with a fault in the status of its reading) is measured again up to
+    retakes times. With an SR830_Averaging.Averager the
+    settled output is averaged until the capacitance is known well enough and the mean is the result of the point (the
+    statistics of the last point are in averager.last). The capacitance component is taken along the phase_reference
+    (an SR830_Calibration.PhaseReference) at the frequency of the point, or along the one of the averager without it."""
+
+    def __init__(self, sr830, time_constant=None, filter_slope=None, accuracy=1e-2, convergence_tolerance=None,
+                 auto_phase=False, auto_range=False, retakes=0, averager=None, phase_reference=None,
+                 max_settling_time=None):
+
+        self.sr830 = sr830
+
+        # if the filter settings are not given they are read from the device
+        if time_constant is None:
+            time_constant = sr830.read_time_constant()
+        if filter_slope is None:
+            filter_slope = sr830.read_filter_slope()
+
+        self.time_constant = time_constant
+        self.filter_slope = filter_slope
+        self.accuracy = accuracy
+        self.convergence_tolerance = convergence_tolerance
+        self.auto_phase = auto_phase
+        self.auto_range = auto_range
+        self.retakes = retakes
+        self.averager = averager
+        self.phase_reference = phase_reference
+        self.__clipped = False
+        self.__settled = True
+
+        # the full settling time and the time after that it makes sense to look for convergence
+        self.settling_time = settling_time(time_constant, filter_slope, accuracy)
+        self.minimum_settling_time = min(settling_time(time_constant, filter_slope, math.exp(-1)),
+                                         self.settling_time)
+        self.max_settling_time = 3 * self.settling_time if max_settling_time is None else \
+            max(max_settling_time, self.settling_time)
+
+    def run(self, frequencies, callback=None):
+        """Measures all frequencies one after another and returns a SweepResult. If a callback is given, it is called
+        with (frequency, x, y, r, phi) after every point, e.g. to stream the points into a file."""
+        return self.wait(self.steps(frequencies, callback), self.sleep)[0]
+
+    def steps(self, frequencies, callback=None):
+        """Generator version of run: it yields the times to wait and returns the SweepResult, so that a caller can do
+        something else while waiting (e.g. SR830_Station and SR830_Async drive several devices at once)."""
+
+        frequencies = np.asarray(frequencies, dtype=float)
+        values = np.zeros((len(frequencies), 4))
+        settling = np.zeros(len(frequencies))
+        fault = np.zeros(len(frequencies), dtype=bool)
+
+        for i, frequency in enumerate(frequencies):
+            steps = self.measure(frequency)
+            try:
+                while True:
+                    seconds = next(steps)
+                    settling[i] += seconds
+                    yield seconds
+            except StopIteration as finished:
+                values[i] = finished.value
+
+            fault[i] = self.faulty()
+            if callback is not None:
+                callback(frequency, *values[i])
+
+        return SweepResult(frequencies, values[:, 0], values[:, 1], values[:, 2], values[:, 3], settling, fault)
+
+    @staticmethod
+    def wait(steps, sleep=time.sleep):
+        """Drives one of the generators below by sleeping for every waiting time it yields. Returns the value the
+        generator finished with and the total time that was spent waiting."""
+
+        waited = 0.0
+        try:
+            while True:
+                seconds = next(steps)
+                sleep(seconds)
+                waited += seconds
+        except StopIteration as finished:
+            return finished.value, waited
+
+    def sleep(self, seconds):
+        """Sleeps for the given time; the sleep is recorded if the trace of the SR830 is enabled."""
+        trace = getattr(self.sr830, 'trace', None)
+        if trace is None:
+            time.sleep(seconds)
+        else:
+            trace.sleep(seconds)
+
+    def measure(self, frequency, jump=1.0):
+        """Generator that measures a single frequency point. It yields the times to wait and returns [x, y, r, phi].
+        Using a generator allows a caller to do something else (e.g. talk to another device) while waiting.
+
+        The settling time is meant for the step to a neighbouring frequency. For a point that is reached by a larger
+        jump, jump is the factor by which the output may change (e.g. the ratio of the frequencies for a capacitor) and
+        the wait is extended accordingly (see settle)."""
+
+        self.sr830.set_reference_frequency(frequency)
+        phase = float(self.phase_reference.at(frequency)) if self.phase_reference is not None else None
+        return (yield from self.acquire(phase, jump))
+
+    def acquire(self, phase_reference=None, jump=1.0):
+        """Generator that measures the current point after the reference frequency or the harmonic was changed. It
+        yields the times to wait and returns [x, y, r, phi]. The phase reference in degrees is passed on to the
+        averager, the jump to settle."""
+
+        full_scale = self.full_scale()
+        snap = yield from self.settle(full_scale, jump)
+
+        # the auto phase changes the output, so the filter has to settle once more afterwards
+        if self.auto_phase:
+            self.sr830.auto_phase()
+            snap = yield from self.settle(full_scale)
+
+        # the range is adjusted with the settled output, so that the reading it ends with can be used
+        if self.auto_range:
+            snap = yield from self.sr830.auto_range_steps(wait=self.time_constant)
+            full_scale = self.full_scale()
+
+        if snap is None:
+            snap = self.sr830.read_snap()
+        self.__clipped = self.clipped(snap, full_scale)
+
+        # an overloaded, clipped or unlocked reading is taken again after the output had time to settle once more
+        for _ in range(self.retakes):
+            if not self.faulty():
+                break
+            snap = yield from self.settle(full_scale)
+            if snap is None:
+                snap = self.sr830.read_snap()
+            self.__clipped = self.clipped(snap, full_scale)
+
+        if self.averager is not None:
+            snap = yield from self.averager.average(phase_reference)
+
+        return snap
+
+    def faulty(self):
+        """True if the last reading was clipped, did not converge or its status reported a fault."""
+        status = getattr(self.sr830, 'last_status', None)
+        return self.__clipped or not self.__settled or (status is not None and status.fault)
+
+    def full_scale(self):
+        """Returns the full scale of X and Y in the units of the input (V or A), read in one transmission."""
+        with self.sr830.batch():
+            sensitivity = self.sr830.read_sensitivity()
+            input_mode = self.sr830.read_input_mode()
+        return sensitivity.value * self.sr830.INPUT_SCALES[int(input_mode.value)]
+
+    def clipped(self, snap, full_scale):
+        """True if X or Y of the reading is at the output limit or the status of the reading reports an overload."""
+        if max(abs(snap[0]), abs(snap[1])) >= full_scale:
+            return True
+        status = getattr(self.sr830, 'last_status', None)
+        return status is not None and (status.input_overload or status.filter_overload or status.output_overload)
+
+    def settle(self, full_scale=None, jump=1.0):
+        """Generator that yields the times to wait until the output filter settled. Returns the last reading if the
+        output was polled for convergence, otherwise None. Clipped readings (see clipped) never end the wait early. If
+        the output did not converge within max_settling_time, the point counts as faulty.
+
+        After a jump of the output by the factor jump the remaining error is jump times the one of a normal step, so
+        the wait (or the limit of the polling) is the settling time for the accuracy divided by jump."""
+
+        self.__settled = True
+        limit = self.settling_time
+        if jump > 1:
+            limit = settling_time(self.time_constant, self.filter_slope, self.accuracy / jump)
+
+        if self.convergence_tolerance is None:
+            yield limit
+            return None
+
+        if full_scale is None:
+            full_scale = self.full_scale()
+
+        waited = self.minimum_settling_time
+        yield waited
+        previous = self.sr830.read_snap()
+
+        limit = max(limit, self.max_settling_time)
+        while waited < limit:
+            step = min(self.time_constant, limit - waited)
+            yield step
+            waited += step
+
+            snap = self.sr830.read_snap()
+            if not self.clipped(snap, full_scale) and self.converged(previous, snap):
+                return snap
+            previous = snap
+
+        self.__settled = False
+        return previous
+
+    def converged(self, previous, current):
+        # compare the change of the complex output (x + iy) with its magnitude
+        change = math.hypot(current[0] - previous[0], current[1] - previous[1])
+        return change <= self.convergence_tolerance * math.hypot(current[0], current[1])
+
+
+class AdaptiveFrequencySweep:
+    """Sweep that concentrates the points where the spectrum changes.
+
+    It starts with a coarse logarithmic grid between start and stop (limited to the frequency range of the SR830) and
+    then repeatedly measures the geometric center of the interval where the spectrum deviates the most from a straight
+    line in log|Z| and phase over log f, i.e. where the slope of the impedance changes. A pure capacitor therefore
+    needs no refinement while a relaxation step gets resolved. This is repeated until max_points are measured, the
+    largest deviation is below tolerance or all intervals are narrower than min_ratio. The impedance is proportional
+    to 1/(X + iY), so the amplitude is not needed for that."""
+
+    def __init__(self, sweep, start=None, stop=None, initial_points=9, max_points=50, tolerance=0.02, min_ratio=1.01):
+
+        self.sweep = sweep
+        lower = sweep.sr830.LOWER_FREQ_LIMIT
+        upper = sweep.sr830.UPPER_FREQ_LIMIT
+        self.start = lower if start is None else max(start, lower)
+        self.stop = upper if stop is None else min(stop, upper)
+        self.initial_points = initial_points
+        self.max_points = max(max_points, initial_points)
+        self.tolerance = tolerance
+        self.min_ratio = min_ratio
+
+    def run(self, callback=None):
+        """Measures the spectrum and returns a SweepResult sorted by frequency. The callback is called after every
+        measurement like for FrequencySweep.run (in the order of the measurement; a point that is measured again is
+        passed on again).
+
+        The points are not measured in the order of their frequencies, so the wait of every point is extended by the
+        jump from the frequency before (see FrequencySweep.measure). Before an interval is refined, the one of its two
+        points that deviates more is measured once more, so that a reading that was off does not draw the refinement
+        to it."""
+
+        frequencies = []
+        points = []
+        settling = []
+        fault = []
+        checked = set()
+        last = None
+
+        def measure(frequency, index=None):
+            # index is the point that is measured again, None for a new point
+            nonlocal last
+            jump = 1.0 if last is None else max(frequency / last, last / frequency)
+            values, waited = self.sweep.wait(self.sweep.measure(frequency, jump), self.sweep.sleep)
+            last = frequency
+
+            if index is None:
+                frequencies.append(frequency)
+                points.append(values)
+                settling.append(waited)
+                fault.append(self.sweep.faulty())
+            else:
+                points[index] = values
+                settling[index] += waited
+                fault[index] = self.sweep.faulty()
+            if callback is not None:
+                callback(frequency, *values)
+
+        for frequency in np.geomspace(self.start, self.stop, self.initial_points):
+            measure(float(frequency))
+
+        while len(frequencies) < self.max_points:
+            order = np.argsort(frequencies)
+            f = np.asarray(frequencies)[order]
+            values = np.asarray(points)[order]
+
+            deviations = self.deviations(f, values[:, 0], values[:, 1])
+            scores = np.maximum(deviations[:-1], deviations[1:])
+            scores[f[1:] / f[:-1] < self.min_ratio] = 0
+            interval = int(np.argmax(scores))
+            if scores[interval] < self.tolerance:
+                break
+
+            suspect = interval if deviations[interval] >= deviations[interval + 1] else interval + 1
+            if order[suspect] not in checked:
+                checked.add(order[suspect])
+                measure(f[suspect], order[suspect])
+                continue
+
+            measure(math.sqrt(f[interval] * f[interval + 1]))
+
+        order = np.argsort(frequencies)
+        values = np.asarray(points)[order]
+        return SweepResult(np.asarray(frequencies)[order], values[:, 0], values[:, 1], values[:, 2], values[:, 3],
+                           np.asarray(settling)[order], np.asarray(fault)[order])
+
+    @classmethod
+    def scores(cls, frequency, x, y):
+        """Returns a score for every interval between neighbouring points: the larger deviation (see deviations) of
+        its two points."""
+        point = cls.deviations(frequency, x, y)
+        return np.maximum(point[:-1], point[1:])
+
+    @staticmethod
+    def deviations(frequency, x, y):
+        """Returns the deviation of every point from the straight line through its neighbours in log|Z| and phase (in
+        rad) over log f; the first and the last point have none (0). A point without current gets an infinite
+        deviation, so that the spectrum is resolved around it."""
+
+        current = np.asarray(x) + 1j * np.asarray(y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # log|Z| = -log|I| + const. and phase(Z) = -phase(I); the signs don't matter for the deviation
+            curves = np.stack([np.log(np.abs(current)), np.unwrap(np.angle(current))])
+            log_f = np.log(frequency)
+
+            # deviation of the inner points from the interpolation between their neighbours
+            weight = (log_f[1:-1] - log_f[:-2]) / (log_f[2:] - log_f[:-2])
+            interpolated = curves[:, :-2] + weight * (curves[:, 2:] - curves[:, :-2])
+            deviation = np.sum(np.abs(curves[:, 1:-1] - interpolated), axis=0)
+            deviation = np.nan_to_num(deviation, nan=np.inf)
+
+        return np.concatenate([[0], deviation, [0]])
+
+
+# result of a HarmonicSweep. values has the shape (frequencies, harmonics, 4) with x, y, r and phi of every harmonic
+# at every frequency, settling and fault the shape (frequencies, harmonics). Harmonics whose detected frequency is above
+# the limit of the SR830 are not measured and nan.
+HarmonicSweepResult = namedtuple('HarmonicSweepResult', ['frequency', 'harmonics', 'values', 'settling', 'fault'])
+
+
+class HarmonicSweep:
+    """Measures several harmonics of the current at every frequency in one pass, e.g. to characterize the
+    nonlinearity of a gap:
+
+        sweep = HarmonicSweep(FrequencySweep(sr830, convergence_tolerance=1e-3), harmonics=(1, 2, 3))
+        result = sweep.run(frequencies)
+        second = result.values[:, 1, 2]     # R of the second harmonic
+
+    The reference frequency is set once per point and then only the detection harmonic is stepped, so the reference
+    stays locked and only the output filter has to settle for each harmonic (with the settings and options of the
+    given FrequencySweep). The harmonic is set back to 1 before every frequency change, because the SR830 limits the
+    frequency to 102 kHz divided by the harmonic, and at the end of the sweep."""
+
+    def __init__(self, sweep, harmonics=(1, 2, 3)):
+        self.sweep = sweep
+        self.sr830 = sweep.sr830
+        self.harmonics = tuple(int(h) for h in harmonics)
+
+    def run(self, frequencies, callback=None):
+        """Measures all frequencies and returns a HarmonicSweepResult. If a callback is given, it is called with
+        (frequency, harmonic, x, y, r, phi) after every measured harmonic."""
+
+        frequencies = np.asarray(frequencies, dtype=float)
+        values = np.full((len(frequencies), len(self.harmonics), 4), np.nan)
+        settling = np.zeros((len(frequencies), len(self.harmonics)))
+        fault = np.zeros((len(frequencies), len(self.harmonics)), dtype=bool)
+
+        try:
+            for i, frequency in enumerate(frequencies):
+                for j, snap, waited in self.measure(frequency):
+                    values[i, j], settling[i, j] = snap, waited
+                    fault[i, j] = self.sweep.faulty()
+                    if callback is not None:
+                        callback(frequency, self.harmonics[j], *snap)
+        finally:
+            self.sr830.set_harmonic(1)
+
+        return HarmonicSweepResult(frequencies, np.array(self.harmonics), values, settling, fault)
+
+    def measure(self, frequency):
+        """Measures all harmonics of one frequency that the SR830 can detect. Yields the index of the harmonic, the
+        reading [x, y, r, phi] and the time spent waiting for every harmonic."""
+
+        self.sr830.set_harmonic(1)
+        self.sr830.set_reference_frequency(frequency)
+
+        for j, harmonic in enumerate(self.harmonics):
+            if frequency * harmonic > self.sr830.UPPER_FREQ_LIMIT:
+                continue
+            self.sr830.set_harmonic(harmonic)
+            snap, waited = self.sweep.wait(self.sweep.acquire(), self.sweep.sleep)
+            yield j, snap, waited
@@ -0,0 +1,167 @@
+import bisect
+import itertools
+import json
+import time
+from collections import Counter, deque, namedtuple
+
+# one entry of the trace. category is "io" for a transmission and "sleep" for a wait. start is the time in seconds
+# since the trace was started, write_time the time the command took on the wire and wait_time the time until the reply
+# arrived (0 for commands without reply)
+TraceEvent = namedtuple('TraceEvent', ['name', 'category', 'start', 'write_time', 'wait_time', 'commands',
+                                       'reply_bytes'])
+
+
+def mnemonic(command):
+    """Returns the mnemonic of a command, e.g. "SNAP?" for "SNAP? 1, 2, 3, 4" and "SENS" for "SENS 24"."""
+    parts = command.split(None, 1)
+    return parts[0].upper() if parts else ""
+
+
+class CommandTrace:
+    """Records the timing of every transmission of an SR830_Lib.SR830 and the sleeps of the sweeps, e.g.
+
+        trace = sr830.enable_trace()
+        sweep.run(frequencies)
+        print(trace.report())
+        trace.write_chrome_trace("sweep.json")
+
+    Every transmission is split into the time to write the command and the time waiting for the reply. The number of
+    commands and the total time are counted by mnemonic (a line with several commands counts once for each of them,
+    its time is counted under "batch"), and a histogram of the latencies is kept per mnemonic. The last max_events
+    events are stored and can be exported as JSON lines or in the Chrome trace format (chrome://tracing, Perfetto).
+
+    summary() tells where the time went: writing, waiting for replies, sleeping for the output filter or anything else
+    (the Python code in between)."""
+
+    # edges of the latency histograms in seconds: 1 us to 100 s with 5 bins per decade
+    HISTOGRAM_EDGES = tuple(10 ** (k / 5 - 6) for k in range(41))
+    BATCH = "batch"
+    SLEEP = "sleep"
+
+    def __init__(self, max_events=100000, clock=time.perf_counter, sleep=time.sleep):
+        self.clock = clock
+        self.__sleep = sleep
+        self.events = deque(maxlen=max_events)
+        self.counts = Counter()
+        self.times = Counter()
+        self.histograms = {}
+        self.write_time = 0.0
+        self.wait_time = 0.0
+        self.sleep_time = 0.0
+        self.origin = clock()
+
+    def clear(self):
+        """Forgets all events and statistics and restarts the clock of the trace."""
+        self.events.clear()
+        self.counts.clear()
+        self.times.clear()
+        self.histograms.clear()
+        self.write_time = 0.0
+        self.wait_time = 0.0
+        self.sleep_time = 0.0
+        self.origin = self.clock()
+
+    def record(self, commands, start, written, finished, reply_bytes=0):
+        """Adds one transmission of the commands (in one line) that started at the time start (of clock), was written
+        at written and got its last reply at finished."""
+
+        mnemonics = [mnemonic(command) for command in commands]
+        name = mnemonics[0] if len(mnemonics) == 1 else self.BATCH
+        duration = finished - start
+
+        self.counts.update(mnemonics)
+        self.times[name] += duration
+        self.write_time += written - start
+        self.wait_time += finished - written
+        self._add_to_histogram(name, duration)
+
+        self.events.append(TraceEvent(name, "io", start - self.origin, written - start, finished - written,
+                                      tuple(commands), reply_bytes))
+
+    def sleep(self, seconds):
+        """Sleeps and records the sleep (used instead of time.sleep while the trace is enabled)."""
+        start = self.clock()
+        self.__sleep(seconds)
+        self.record_sleep(start, self.clock())
+
+    def record_sleep(self, start, finished):
+        """Adds a wait that was done elsewhere, e.g. with asyncio.sleep."""
+        duration = finished - start
+        self.times[self.SLEEP] += duration
+        self.sleep_time += duration
+        self._add_to_histogram(self.SLEEP, duration)
+        self.events.append(TraceEvent(self.SLEEP, "sleep", start - self.origin, 0.0, duration, (), 0))
+
+    def _add_to_histogram(self, name, duration):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            # one bin below and one above the edges
+            histogram = self.histograms[name] = [0] * (len(self.HISTOGRAM_EDGES) + 1)
+        histogram[bisect.bisect_right(self.HISTOGRAM_EDGES, duration)] += 1
+
+    def histogram(self, name):
+        """Returns the latency histogram of a mnemonic (or "batch" / "sleep") as counts and the edges of the bins in
+        seconds. The first bin counts everything below the first edge, the last everything above the last edge."""
+        # numpy is only imported here, so that importing the driver stays fast
+        import numpy as np
+        return np.array(self.histograms.get(name, [0] * (len(self.HISTOGRAM_EDGES) + 1))), \
+            np.array(self.HISTOGRAM_EDGES)
+
+    def percentile(self, name, q):
+        """Latency in seconds below which q percent of the transmissions of the mnemonic are, estimated from the
+        histogram (upper edge of the bin)."""
+        counts, edges = self.histogram(name)
+        if not counts.sum():
+            return None
+        index = bisect.bisect_left(list(itertools.accumulate(counts)), q / 100 * counts.sum())
+        return float(edges[min(index, len(edges) - 1)])
+
+    def summary(self):
+        """Returns the time in seconds since the trace was started and how much of it was spent writing commands,
+        waiting for replies, sleeping and elsewhere (Python, other devices, ...)."""
+        elapsed = self.clock() - self.origin
+        return {"elapsed": elapsed,
+                "write": self.write_time,
+                "reply_wait": self.wait_time,
+                "sleep": self.sleep_time,
+                "other": elapsed - self.write_time - self.wait_time - self.sleep_time}
+
+    def report(self):
+        """Returns the summary, the latencies per transmission and the number of commands per mnemonic as text."""
+        lines = ["{:<12}{:>10.3f} s".format(key, value) for key, value in self.summary().items()]
+
+        lines.append("")
+        lines.append("{:<12}{:>8}{:>12}{:>12}{:>12}".format("latency", "calls", "total / s", "mean / ms", "p95 / ms"))
+        for name in sorted(self.times, key=self.times.get, reverse=True):
+            calls = sum(self.histograms[name])
+            lines.append("{:<12}{:>8}{:>12.3f}{:>12.3f}{:>12.3f}".format(name, calls, self.times[name],
+                                                                         1e3 * self.times[name] / calls,
+                                                                         1e3 * self.percentile(name, 95)))
+
+        lines.append("")
+        lines.append("{:<12}{:>8}".format("command", "count"))
+        for name, count in self.counts.most_common():
+            lines.append("{:<12}{:>8}".format(name, count))
+        return "\n".join(lines)
+
+    def write_json_lines(self, filename):
+        """Writes one JSON object per event (times in seconds)."""
+        with open(filename, 'w', encoding='utf-8') as file:
+            for event in self.events:
+                file.write(json.dumps(event._asdict()) + "\n")
+
+    def write_chrome_trace(self, filename):
+        """Writes the events in the Chrome trace format. Every transmission is shown with the wait for its reply
+        nested inside."""
+        trace_events = []
+        for event in self.events:
+            start = 1e6 * event.start
+            trace_events.append({"name": event.name, "cat": event.category, "ph": "X", "pid": 1, "tid": 1,
+                                 "ts": start, "dur": 1e6 * (event.write_time + event.wait_time),
+                                 "args": {"commands": ";".join(event.commands), "reply_bytes": event.reply_bytes}})
+            if event.category == "io" and event.wait_time > 0:
+                trace_events.append({"name": "reply", "cat": "wait", "ph": "X", "pid": 1, "tid": 1,
+                                     "ts": start + 1e6 * event.write_time, "dur": 1e6 * event.wait_time})
+
+        with open(filename, 'w', encoding='utf-8') as file:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, file)
@@ -0,0 +1,276 @@
+import csv
+import io
+import json
+import os
+import time
+
+import numpy as np
+
+# separator between the name and the value of a metadata line in the csv header (e.g. "Ue / V :;0.004")
+METADATA_MARKER = " :"
+
+
+def setup_metadata(sr830):
+    """Returns the settings of the SR830 that are needed to interpret a sweep as metadata for the writers below."""
+    return {"Ue / V": sr830.read_sine_output_level(),
+            "Tau / s": sr830.read_time_constant(),
+            "Sensitivity / V": sr830.read_sensitivity(),
+            "Slope / dB/oct": sr830.read_filter_slope()}
+
+
+# encoding of the files of the older measurement scripts, which are read if a file is not utf-8
+LEGACY_ENCODING = 'latin-1'
+
+
+def read_sweep(filename, encoding=None):
+    """Reads a csv file written by SweepWriter (or the older measurement scripts). Returns the metadata as dict, the
+    column names and the data as numpy array with one row per point. A partially written last line is ignored.
+
+    Without an encoding the file is read as utf-8 and, if that fails, in the LEGACY_ENCODING of the older files."""
+
+    if encoding is None:
+        try:
+            return _read_sweep(filename, 'utf-8')
+        except UnicodeDecodeError:
+            return _read_sweep(filename, LEGACY_ENCODING)
+    return _read_sweep(filename, encoding)
+
+
+def _read_sweep(filename, encoding):
+    metadata = {}
+    columns = None
+    rows = []
+
+    with open(filename, 'r', encoding=encoding, newline='') as file:
+        for line in file:
+            if not line.endswith('\n'):
+                break
+            fields = line.rstrip('\r\n').split(';')
+            if columns is None:
+                if fields[0].endswith(METADATA_MARKER):
+                    metadata[fields[0][:-len(METADATA_MARKER)]] = _parse_value(fields[1])
+                else:
+                    columns = fields
+            elif len(fields) == len(columns):
+                rows.append([float(v) for v in fields])
+
+    data = np.array(rows, dtype=float).reshape(-1, len(columns) if columns else 0)
+    return metadata, columns, data
+
+
+def _parse_value(value):
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+class SweepWriter:
+    """Writes the points of a sweep into a ';' delimited csv file while the sweep is running.
+
+    The file stays open during the sweep. Rows are buffered and written to the disk (including an fsync) every
+    flush_rows rows or fsync_interval seconds, whatever comes first, so that a crash loses at most these rows. The
+    metadata (amplitude, time constant, ...) is written once at the top of the file in the same format as the older
+    measurement files:
+
+        Ue / V :;0.004
+        Frequency / Hz;Impedance / Ohm;Phase / deg
+        1000;2.5e6;-89.9
+
+    If resume is True and the file already exists, the new rows are appended. A line that was only partially written
+    during a crash is removed first. rows_written and last_row tell where the sweep has to continue."""
+
+    def __init__(self, filename, columns, metadata=None, resume=False, flush_rows=100, fsync_interval=10.0,
+                 encoding='utf-8'):
+
+        self.filename = filename
+        self.columns = list(columns)
+        self.metadata = dict(metadata) if metadata else {}
+        self.flush_rows = flush_rows
+        self.fsync_interval = fsync_interval
+        self.rows_written = 0
+        self.last_row = None
+
+        if resume and os.path.exists(filename) and os.path.getsize(filename) > 0:
+            self._prepare_resume(encoding)
+            self.__file = open(filename, 'a', encoding=encoding, newline='')
+            new_file = False
+        else:
+            self.__file = open(filename, 'w', encoding=encoding, newline='')
+            new_file = True
+
+        self.__writer = csv.writer(self.__file, delimiter=';', lineterminator='\n')
+        self.__pending = 0
+        self.__last_sync = time.monotonic()
+
+        if new_file:
+            for name, value in self.metadata.items():
+                self.__writer.writerow([name + METADATA_MARKER, value])
+            self.__writer.writerow(self.columns)
+            self.sync()
+
+    def _prepare_resume(self, encoding):
+        metadata, columns, data = read_sweep(self.filename, encoding)
+        if columns != self.columns:
+            raise ValueError("The columns of " + self.filename + " are " + str(columns) + " and not "
+                             + str(self.columns))
+        self.metadata = metadata
+        self.rows_written = len(data)
+        if len(data):
+            self.last_row = data[-1]
+
+        # cut off a partially written last line
+        with open(self.filename, 'rb+') as file:
+            content = file.read()
+            file.truncate(content.rfind(b'\n') + 1)
+
+    def write_row(self, row):
+        """Adds one point to the file. The row is written to the disk with the next flush."""
+        self.__writer.writerow(row)
+        self.rows_written += 1
+        self.last_row = row
+        self.__pending += 1
+
+        if self.__pending >= self.flush_rows or time.monotonic() - self.__last_sync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        """Writes all buffered rows to the disk."""
+        self.__file.flush()
+        os.fsync(self.__file.fileno())
+        self.__pending = 0
+        self.__last_sync = time.monotonic()
+
+    def close(self):
+        if not self.__file.closed:
+            self.sync()
+            self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ChunkedSweepWriter:
+    """Binary alternative to SweepWriter that stores the sweep column by column in numpy files.
+
+    The directory contains metadata.json (metadata and column names) and chunk_000000.npy, chunk_000001.npy, ... with
+    up to chunk_rows rows each, stored as an array of shape (columns, rows). Files are always replaced atomically, so
+    a crash leaves the last complete version of every chunk. The chunk that is being filled is written every
+    fsync_interval seconds. With resume=True an existing directory is continued."""
+
+    METADATA_FILE = "metadata.json"
+    CHUNK_FILE = "chunk_{:06d}.npy"
+
+    def __init__(self, directory, columns, metadata=None, resume=False, chunk_rows=4096, fsync_interval=10.0):
+
+        self.directory = directory
+        self.columns = list(columns)
+        self.metadata = dict(metadata) if metadata else {}
+        self.chunk_rows = chunk_rows
+        self.fsync_interval = fsync_interval
+        self.rows_written = 0
+        self.last_row = None
+
+        self.__chunk_index = 0
+        self.__chunk = np.zeros((len(self.columns), chunk_rows))
+        self.__chunk_length = 0
+        self.__last_sync = time.monotonic()
+
+        os.makedirs(directory, exist_ok=True)
+        metadata_path = os.path.join(directory, self.METADATA_FILE)
+
+        if resume and os.path.exists(metadata_path):
+            self._prepare_resume(metadata_path)
+        else:
+            content = json.dumps({"columns": self.columns, "metadata": self.metadata}, indent=1)
+            self._replace(metadata_path, content.encode('utf-8'))
+
+    def _prepare_resume(self, metadata_path):
+        with open(metadata_path, 'r', encoding='utf-8') as file:
+            header = json.load(file)
+        if header["columns"] != self.columns:
+            raise ValueError("The columns of " + self.directory + " are " + str(header["columns"]) + " and not "
+                             + str(self.columns))
+        self.metadata = header["metadata"]
+
+        chunks = _chunk_files(self.directory)
+        if not chunks:
+            return
+
+        # continue to fill the last chunk if it is not complete yet
+        last = np.load(chunks[-1])
+        self.rows_written = (len(chunks) - 1) * self.chunk_rows + last.shape[1]
+        self.__chunk_index = len(chunks) - 1
+        if last.shape[1]:
+            self.last_row = last[:, -1]
+        if last.shape[1] >= self.chunk_rows:
+            self.__chunk_index += 1
+        else:
+            self.__chunk[:, :last.shape[1]] = last
+            self.__chunk_length = last.shape[1]
+
+    def write_row(self, row):
+        """Adds one point. A chunk is written to the disk as soon as it is full."""
+        self.__chunk[:, self.__chunk_length] = row
+        self.__chunk_length += 1
+        self.rows_written += 1
+        self.last_row = self.__chunk[:, self.__chunk_length - 1]
+
+        if self.__chunk_length >= self.chunk_rows:
+            self.sync()
+            self.__chunk_index += 1
+            self.__chunk_length = 0
+        elif time.monotonic() - self.__last_sync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        """Writes the chunk that is currently filled to the disk."""
+        if self.__chunk_length:
+            buffer = io.BytesIO()
+            np.save(buffer, self.__chunk[:, :self.__chunk_length])
+            path = os.path.join(self.directory, self.CHUNK_FILE.format(self.__chunk_index))
+            self._replace(path, buffer.getvalue())
+        self.__last_sync = time.monotonic()
+
+    def close(self):
+        self.sync()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def _replace(path, content):
+        # write to a temporary file first, so that the file is either the old or the new version after a crash
+        temporary = path + ".tmp"
+        with open(temporary, 'wb') as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, path)
+
+
+def _chunk_files(directory):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.startswith("chunk_") and name.endswith(".npy"))
+
+
+def read_chunked_sweep(directory):
+    """Reads a directory written by ChunkedSweepWriter. Returns the metadata as dict, the column names and the data as
+    numpy array with one row per point (like read_sweep)."""
+
+    with open(os.path.join(directory, ChunkedSweepWriter.METADATA_FILE), 'r', encoding='utf-8') as file:
+        header = json.load(file)
+
+    chunks = [np.load(path) for path in _chunk_files(directory)]
+    if chunks:
+        data = np.concatenate(chunks, axis=1).T
+    else:
+        data = np.zeros((0, len(header["columns"])))
+
+    return header["metadata"], header["columns"], data
@@ -0,0 +1,23 @@
+"""Measurement scripts of the SR830 as functions, e.g.
+
+    from measurements import capacitance
+    result = capacitance.main(plot=True)
+
+The submodules are only imported when they are used (PEP 562), so a measurement does not load the modules of the
+others and matplotlib is only loaded by plotting."""
+
+import importlib
+
+__all__ = ["capacitance", "impedance", "plotting"]
+
+
+def __getattr__(name):
+    if name in __all__:
+        module = importlib.import_module("." + name, __name__)
+        globals()[name] = module
+        return module
+    raise AttributeError("module " + repr(__name__) + " has no attribute " + repr(name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
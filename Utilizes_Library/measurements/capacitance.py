@@ -0,0 +1,113 @@
+"""Capacitance sweep of a nanogap (the measurement of Trial.py): the SR830 is set up with the capacitance sweep profile,
+the frequencies are measured one after another and streamed into a csv file, and the capacitance is calculated from the
+magnitude and from the parallel equivalent circuit.
+
+The device does no auto phase: X and Y of one read_snap per point give the capacitance and conductance on the host
+(SR830_Analysis.dual_phase). If a SR830_Calibration.CalibrationStore is given, the phase reference and the fixture
+calibration for the settings of the sweep are taken from it."""
+
+import datetime
+
+import SR830_Analysis
+import SR830_Calibration
+import SR830_Lib
+import SR830_Profile
+import SR830_Sweep
+import SR830_Writer
+
+FREQUENCIES = [1000, 2500, 5000, 7500, 10000, 25000, 50000, 75000, 100000]
+COLUMNS = ["Frequency / Hz", "X / A", "Y / A", "R / A", "Phase / °"]
+
+
+def main(resource_name='ASRL3::INSTR', frequencies=FREQUENCIES, profile=SR830_Profile.CAPACITANCE_SWEEP, rm=None,
+         plot=False, calibrations=None):
+    """Runs the sweep and returns the SR830_Sweep.SweepResult. With plot the impedance spectrum is plotted and saved as
+    pdf next to the csv file."""
+
+    ######################################################################
+    # Connect to the lock-in amplifier
+    ######################################################################
+
+    # connect to the SR830 Lock In Amplifier
+    sr830 = SR830_Lib.SR830(rm)
+    sr830.connect(resource_name)
+    sr830.enable_debug_output()
+
+    # Reset the device
+    sr830.reset()
+
+    print('Hello Peter')
+
+    ######################################################################
+    # Setup of the SR830 Lock-in Amplifier
+    ######################################################################
+
+    # internal reference, line filters, current input (100 MOhm, floating, dc), 12 dB/oct, normal reserve, 1 s,
+    # 200 mV, displays X and Y and 4 mV amplitude. Only the settings that differ are sent and they are verified in the
+    # same transmission
+    profile.apply(sr830)
+    amplitude = profile.settings["amplitude"]
+
+    ######################################################################
+    # Measurement
+    ######################################################################
+
+    # the sweep only waits until the filter (1 s, 12 dB/oct) settled and stops early once the output does not change.
+    # The phase is corrected on the host, so the reading the convergence check ends with is all a point needs. A
+    # clipped reading is taken once more and flagged in result.fault if it is still clipped
+    sweep = SR830_Sweep.FrequencySweep(sr830, time_constant=profile.settings["time_constant"],
+                                       filter_slope=profile.settings["filter_slope"], convergence_tolerance=1e-3,
+                                       retakes=1)
+
+    # the setup changed the input and the amplitude, a far larger step than the one between two frequencies, so the
+    # output settles at the first frequency before the sweep starts
+    sr830.set_reference_frequency(frequencies[0])
+    sweep.wait(sweep.settle(), sweep.sleep)
+
+    # every point is streamed into the csv file while the sweep is running
+    filename = 'trial' + datetime.datetime.now().strftime('%Y_%m_%d_%H%M%S')
+    with SR830_Writer.SweepWriter(filename + '.csv', COLUMNS, SR830_Writer.setup_metadata(sr830)) as writer:
+        result = sweep.run(frequencies, callback=lambda *row: writer.write_row(row))
+
+    # the correction tables are looked up by input mode, sensitivity and time constant
+    calibration = phase_reference = None
+    if calibrations is not None:
+        calibration = calibrations.find(sr830)
+        phase_reference = calibrations.find(sr830, SR830_Calibration.PhaseReference)
+
+    sr830.disconnect()
+
+    # capacitance of all points in pF, once from the magnitude only and once from the parallel equivalent circuit
+    c_vals = SR830_Analysis.capacitance_from_magnitude(result.frequency, amplitude, result.r) * 10 ** 12
+    if calibration is not None:
+        analysis = calibration.correct_sweep(result, amplitude)
+    else:
+        analysis = SR830_Analysis.analyse(result.frequency, amplitude, x=result.x, y=result.y)
+
+    # capacitance and conductance from both phases of the current
+    phase = phase_reference.at(result.frequency) if phase_reference is not None else 0.0
+    estimate = SR830_Analysis.dual_phase(result.frequency, amplitude, result.x, result.y, phase)
+
+    for i in range(len(result.frequency)):
+        print('Value X', result.x[i])
+        print('Value Y', result.y[i])
+        print('Value phi', result.phi[i])
+        print('Value r', result.r[i])
+        print('Ic? ', abs(complex(result.x[i], result.y[i])))
+        print(c_vals[i])
+
+    print(c_vals)
+    if result.fault.any():
+        print('Clipped or overloaded points / Hz ', result.frequency[result.fault])
+    print('C / pF ', estimate.capacitance * 10 ** 12)
+    print('G / nS ', estimate.conductance * 10 ** 9)
+    if calibration is not None:
+        # without a calibration this would only repeat C
+        print('Cp corrected / pF ', analysis.parallel_capacitance * 10 ** 12)
+
+    if plot:
+        # matplotlib is only loaded here
+        from . import plotting
+        plotting.plot_impedance(result.frequency, analysis.impedance, filename + '.pdf')
+
+    return result
@@ -0,0 +1,60 @@
+"""Single point impedance measurement (the measurement of SR830_Impedance.py): the SR830 is set up with the impedance
+profile and X, Y, R and phi are read at one frequency after the output filter settled."""
+
+import math
+import time
+
+import SR830_Lib
+import SR830_Profile
+import SR830_Sweep
+
+
+def main(resource_name='ASRL3::INSTR', frequency=1000, profile=SR830_Profile.IMPEDANCE, rm=None):
+    """Measures one point and returns [x, y, r, phi]."""
+
+    ######################################################################
+    # Connect to the lock-in amplifier
+    ######################################################################
+
+    # connect to the SR830 Lock In Amplifier
+    sr830 = SR830_Lib.SR830(rm)
+    sr830.connect(resource_name)
+    sr830.enable_debug_output()
+
+    # Reset the device
+    sr830.reset()
+
+    print('Hello Peter')
+
+    ######################################################################
+    # Setup of the SR830 Lock-in Amplifier
+    ######################################################################
+
+    # same setup as the capacitance sweep but 0.3 s, 50 mV and 40 mV amplitude. Only the settings that differ are
+    # sent and they are verified in the same transmission
+    profile.apply(sr830)
+    amplitude = profile.settings["amplitude"]
+
+    ######################################################################
+    # Measurement
+    ######################################################################
+
+    sr830.set_reference_frequency(frequency)
+
+    # wait until the output filter (0.3 s, 12 dB/oct) settled
+    time.sleep(SR830_Sweep.settling_time(profile.settings["time_constant"], profile.settings["filter_slope"]))
+    value_x, value_y, value_r, value_phi = sr830.read_snap()
+
+    print('Value X', value_x)
+    print('Value Y', value_y)
+    print('Value phi', value_phi)
+    print('Value r', value_r)
+
+    print('Cap? ', value_r / (2 * math.pi * frequency * amplitude) * 10 ** 12)
+
+    ######################################################################
+    # Clean up
+    ######################################################################
+
+    sr830.disconnect()
+    return [value_x, value_y, value_r, value_phi]
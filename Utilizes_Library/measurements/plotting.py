@@ -0,0 +1,26 @@
+"""Plots of the measurements. matplotlib is imported by the functions, so importing this module is cheap."""
+
+import numpy as np
+
+
+def plot_impedance(frequency, impedance, filename_pdf=None, show=True):
+    """Plots the magnitude and the phase of the complex impedance over the frequency in two panels with a shared
+    frequency axis and saves the figure as pdf if a filename is given."""
+
+    import matplotlib.pyplot as plt
+
+    impedance = np.asarray(impedance, dtype=complex)
+    figure, axes = plt.subplots(2, sharex=True)
+    axes[0].plot(frequency, np.abs(impedance), 'o-')
+    axes[1].plot(frequency, np.degrees(np.angle(impedance)), '*')
+
+    # set labels
+    axes[1].set_xlabel('Frequency / Hz')
+    axes[0].set_ylabel('Z / Ohm')
+    axes[1].set_ylabel('Phi / °')
+
+    if filename_pdf is not None:
+        figure.savefig(filename_pdf)
+    if show:
+        plt.show()
+    return figure